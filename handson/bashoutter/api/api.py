@@ -1,37 +1,222 @@
-import json, os, uuid, decimal
+import json, os, uuid, decimal, base64, binascii, time
+from collections import Counter
 from datetime import datetime, timezone
-import boto3
+from feed import FEED_INDEXES, feed_shard, all_shards, query_feed
+from cache import create_cache
+from serialize import DecimalEncoder, dumps
+from clients import get_client
+from dynamodb import Table, BatchWriteError
+from bulk_delete import filter_kwargs, delete_ids, delete_matching
 
-ddb = boto3.resource("dynamodb")
-table = ddb.Table(os.environ["TABLE_NAME"])
+# the DynamoDB client is created on the first request, not at import time
+table = Table(os.environ["TABLE_NAME"])
+FEED_SHARDS = int(os.environ.get("FEED_SHARDS", "4"))
+# pages of GET /haiku, kept across invocations in a warm container
+cache = create_cache()
+
+# "direct": PATCH /haiku/{item_id} updates the item right away
+# "buffered": PATCH enqueues the like and drain_likes() applies them in batches,
+#     so that a viral haiku does not get one write per click
+LIKES_MODE = os.environ.get("LIKES_MODE", "direct")
+LIKES_QUEUE_URL = os.environ.get("LIKES_QUEUE_URL")
 
 HEADERS = {
     "Access-Control-Allow-Origin": "*",
 }
 
-# this custom class is to handle decimal.Decimal objects in json.dumps()
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, decimal.Decimal):
-            return float(o)
-        return super(DecimalEncoder, self).default(o)
+# page size of GET /haiku
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+# number of haiku in a POST /haiku/batch
+MAX_BATCH = 500
+# POST /haiku/batch_delete
+MAX_DELETE_IDS = 1000
+DEFAULT_SEGMENTS = 16
+MAX_SEGMENTS = 64
+# seconds left for returning the response after deleting
+DELETE_MARGIN = 3
+# "unordered" is a plain table scan, which also returns items not yet in the feed
+ORDERS = ["latest", "top", "unordered"]
+
+def encode_cursor(order, key):
+    """
+    Convert the position of a listing (e.g. DynamoDB's LastEvaluatedKey) into
+    an opaque, URL-safe cursor string
+    """
+    if not key:
+        return None
+    raw = json.dumps({"order": order, "key": key}, cls=DecimalEncoder, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(order, cursor):
+    """
+    Inverse of encode_cursor(). Raises ValueError when the cursor is malformed
+    or was issued for another order.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii"))
+        payload = json.loads(raw, parse_float=decimal.Decimal, parse_int=decimal.Decimal)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError("cursor is malformed")
+    if not isinstance(payload, dict) or not isinstance(payload.get("key"), dict):
+        raise ValueError("cursor is malformed")
+    if payload.get("order") != order:
+        raise ValueError(f"cursor was not issued for order={order}")
+    return payload["key"]
+
+def parse_limit(value):
+    """
+    Validate the 'limit' query parameter
+    """
+    if value is None:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    return limit
+
+def is_feed_start_key(order, shard, start_key):
+    """
+    True if 'start_key' is None or a key of the feed index of 'order' in 'shard',
+    as built by query_feed()
+    """
+    if start_key is None:
+        return True
+    _, sort_key = FEED_INDEXES[order]
+    if not isinstance(start_key, dict) or set(start_key) != {"item_id", "feed", sort_key}:
+        return False
+    sort_type = str if sort_key == "created_at" else decimal.Decimal
+    return (isinstance(start_key["item_id"], str) and start_key["feed"] == shard
+            and isinstance(start_key[sort_key], sort_type))
+
+def list_haiku(order, limit, cursor):
+    """
+    Return one page of haiku and the cursor of the next page
+    """
+    if order == "unordered":
+        scan_kwargs = {"Limit": limit}
+        if cursor:
+            start_key = decode_cursor(order, cursor)
+            if set(start_key) != {"item_id"} or not isinstance(start_key["item_id"], str):
+                raise ValueError("cursor is malformed")
+            scan_kwargs["ExclusiveStartKey"] = start_key
+        response = table.scan(**scan_kwargs)
+        return response.get("Items"), encode_cursor(order, response.get("LastEvaluatedKey"))
+
+    if cursor:
+        start_keys = decode_cursor(order, cursor)
+        shards = all_shards(FEED_SHARDS)
+        for shard, start_key in start_keys.items():
+            if shard not in shards or not is_feed_start_key(order, shard, start_key):
+                raise ValueError("cursor is malformed")
+    else:
+        start_keys = {shard: None for shard in all_shards(FEED_SHARDS)}
+    items, next_start_keys = query_feed(table, order, limit, start_keys)
+    return items, encode_cursor(order, next_start_keys)
+
+def wants_fresh(event):
+    """
+    True if the client asked to bypass the cache with 'Cache-Control: no-cache'
+    (e.g. to read its own write)
+    """
+    headers = event.get("headers") or {}
+    for name, value in headers.items():
+        if name.lower() == "cache-control" and "no-cache" in value.lower():
+            return True
+    return False
+
+def patch_cached_likes(item_id, inc):
+    """
+    Apply a like to the cached pages instead of dropping all of them
+    """
+    try:
+        entries = cache.items()
+    except NotImplementedError:
+        cache.clear()
+        return
+    for key, page in entries:
+        if key.startswith("top|"):
+            # the ranking may change, so this page must be rebuilt
+            cache.delete(key)
+            continue
+        patched = False
+        for item in page["items"]:
+            if item["item_id"] == item_id:
+                item["likes"] += inc
+                patched = True
+        # backends may return copies; the page still expires when it would have
+        if patched:
+            cache.set(key, page, keep_ttl=True)
 
 def get_haiku(event, context):
     """
     handler for GET /haiku
+
+    Query parameters:
+        order: "latest" (default), "top" or "unordered"
+        limit: maximum number of haiku in a page (default 20, max 100)
+        cursor: 'next_cursor' returned by the previous page
+
+    Pages are cached for CACHE_TTL seconds. Send 'Cache-Control: no-cache'
+    to bypass the cache.
     """
+    cache_status = "MISS"
     try:
-        response = table.scan()
+        params = event.get("queryStringParameters") or {}
+        order = params.get("order", "latest")
+        if order not in ORDERS:
+            raise ValueError(f"order must be one of {ORDERS}")
+        limit = parse_limit(params.get("limit"))
+
+        cache_key = f"{order}|{limit}|{params.get('cursor') or ''}"
+        resp = None if wants_fresh(event) else cache.get(cache_key)
+        if resp is not None:
+            cache_status = "HIT"
+        else:
+            items, next_cursor = list_haiku(order, limit, params.get("cursor"))
+            resp = {
+                "items": items,
+                "next_cursor": next_cursor,
+            }
+            cache.set(cache_key, resp)
 
         status_code = 200
-        resp = response.get("Items")
+    except ValueError as e:
+        status_code = 400
+        resp = {"description": f"Bad request. {str(e)}"}
     except Exception as e:
         status_code = 500
         resp = {"description": f"Internal server error. {str(e)}"}
     return {
         "statusCode": status_code,
-        "headers": HEADERS,
-        "body": json.dumps(resp, cls=DecimalEncoder)
+        "headers": {**HEADERS, "X-Cache": cache_status},
+        "body": dumps(resp)
+    }
+
+def new_haiku(body):
+    """
+    Validate a posted haiku and return the item to store.
+    Raises ValueError when a field is missing.
+    """
+    if not isinstance(body, dict):
+        raise ValueError("haiku must be a JSON object")
+    for key in ["username", "first", "second", "third"]:
+        if not body.get(key):
+            raise ValueError(f"{key} is empty")
+
+    item_id = uuid.uuid4().hex
+    return {
+        "item_id": item_id,
+        "feed": feed_shard(item_id, FEED_SHARDS),
+        "username": body["username"],
+        "first": body["first"],
+        "second": body["second"],
+        "third": body["third"],
+        "likes": 0,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds")
     }
 
 def post_haiku(event, context):
@@ -44,23 +229,81 @@ def post_haiku(event, context):
             raise ValueError("Invalid request. The request body is missing!")
         body = json.loads(body)
 
-        for key in ["username", "first", "second", "third"]:
-            if not body.get(key):
-                raise ValueError(f"{key} is empty")
-
-        item = {
-            "item_id": uuid.uuid4().hex,
-            "username": body["username"],
-            "first": body["first"],
-            "second": body["second"],
-            "third": body["third"],
-            "likes": 0,
-            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds")
-        }
+        item = new_haiku(body)
         response = table.put_item(Item=item)
+        # the new haiku must appear at the top of the feed
+        cache.clear()
 
         status_code = 201
-        resp = {"description": "Successfully added a new haiku"}
+        resp = {"description": "Successfully added a new haiku", "item_id": item["item_id"]}
+    except ValueError as e:
+        status_code = 400
+        resp = {"description": f"Bad request. {str(e)}"}
+    except Exception as e:
+        status_code = 500
+        resp = {"description": str(e)}
+    return {
+        "statusCode": status_code,
+        "headers": HEADERS,
+        "body": json.dumps(resp)
+    }
+
+def post_haiku_batch(event, context):
+    """
+    handler for POST /haiku/batch
+
+    The body is an array of haiku. Every haiku is validated first, then
+    the valid ones are written with BatchWriteItem. 'results' tells the
+    outcome of each haiku in the order of the request.
+    """
+    try:
+        body = event.get("body")
+        if not body:
+            raise ValueError("Invalid request. The request body is missing!")
+        haikus = json.loads(body)
+        if not isinstance(haikus, list) or not haikus:
+            raise ValueError("The request body must be a non-empty array of haiku")
+        if len(haikus) > MAX_BATCH:
+            raise ValueError(f"at most {MAX_BATCH} haiku can be posted at once")
+
+        results, items = [], []
+        for haiku in haikus:
+            try:
+                item = new_haiku(haiku)
+                results.append({"status": 201, "item_id": item["item_id"]})
+                items.append(item)
+            except ValueError as e:
+                results.append({"status": 400, "description": f"Bad request. {str(e)}"})
+        if not items:
+            raise ValueError("all haiku are invalid")
+
+        try:
+            failed, error = set(table.batch_write(put_items=items)), None
+        except BatchWriteError as e:
+            # some haiku may be stored already: report which ones
+            print(f"batch_write failed: {str(e.cause)}")
+            failed, error = set(e.unprocessed), e.cause
+        created = [r for r in results if r["status"] == 201]
+        for i, result in enumerate(created):
+            if i in failed:
+                if error is None:
+                    result.update(status=500, description="Unprocessed. Please retry.")
+                else:
+                    result.update(status=500, description=f"May not have been added. {str(error)}")
+                del result["item_id"]
+        cache.clear()
+
+        num_created = len(created) - len(failed)
+        if num_created == len(results):
+            status_code = 201
+        elif num_created == 0 and error is not None:
+            status_code = 500
+        else:
+            status_code = 207
+        resp = {
+            "description": f"Added {num_created} of {len(results)} haiku",
+            "results": results,
+        }
     except ValueError as e:
         status_code = 400
         resp = {"description": f"Bad request. {str(e)}"}
@@ -83,16 +326,26 @@ def patch_haiku(event, context):
         if not item_id:
             raise ValueError("Invalid request. The path parameter 'item_id' is missing")
         
-        response = table.update_item(
-            Key={"item_id": item_id},
-            UpdateExpression=f"SET likes = likes + :inc",
-            ExpressionAttributeValues={
-                ':inc': 1,
-            }
-        )
-
-        status_code = 200
-        resp = {"description": "OK"}
+        if LIKES_MODE == "buffered":
+            get_client("sqs").send_message(
+                QueueUrl=LIKES_QUEUE_URL,
+                MessageBody=json.dumps({"item_id": item_id, "inc": 1}),
+            )
+            status_code = 202
+            resp = {"description": "Accepted"}
+            # drain_likes() runs in a function of its own: cached pages show
+            # the like once they expire (CACHE_TTL)
+        else:
+            response = table.update_item(
+                Key={"item_id": item_id},
+                UpdateExpression=f"SET likes = likes + :inc",
+                ExpressionAttributeValues={
+                    ':inc': 1,
+                }
+            )
+            patch_cached_likes(item_id, 1)
+            status_code = 200
+            resp = {"description": "OK"}
     except ValueError as e:
         status_code = 400
         resp = {"description": f"Bad request. {str(e)}"}
@@ -118,6 +371,7 @@ def delete_haiku(event, context):
         response = table.delete_item(
             Key={"item_id": item_id}
         )
+        cache.clear()
 
         status_code = 204
         resp = {"description": "Successfully deleted."}
@@ -132,3 +386,183 @@ def delete_haiku(event, context):
         "headers": HEADERS,
         "body": json.dumps(resp)
     }
+
+def decode_delete_cursor(cursor):
+    """
+    Return (predicate, total segments, unfinished segments, IDs to delete again)
+    saved in the cursor. Raises ValueError unless all of them are well-formed.
+    """
+    state = decode_cursor("delete", cursor)
+    total_segments = state.get("total_segments")
+    if (not isinstance(total_segments, decimal.Decimal)
+            or total_segments != total_segments.to_integral_value()
+            or not 1 <= total_segments <= MAX_SEGMENTS):
+        raise ValueError("cursor is malformed")
+    total_segments = int(total_segments)
+    segments, retry = state.get("segments"), state.get("retry", [])
+    if not isinstance(segments, dict) or not isinstance(retry, list):
+        raise ValueError("cursor is malformed")
+    for segment, start_key in segments.items():
+        if not segment.isdecimal() or int(segment) >= total_segments:
+            raise ValueError("cursor is malformed")
+        if start_key is not None and (
+                not isinstance(start_key, dict) or set(start_key) != {"item_id"}
+                or not isinstance(start_key["item_id"], str)):
+            raise ValueError("cursor is malformed")
+    if not all(isinstance(i, str) and i for i in retry):
+        raise ValueError("cursor is malformed")
+    segments = {int(segment): start_key for segment, start_key in segments.items()}
+    # BatchWriteItem rejects duplicates
+    return state.get("where"), total_segments, segments, list(dict.fromkeys(retry))
+
+def delete_haiku_batch(event, context):
+    """
+    handler for POST /haiku/batch_delete
+
+    The body is one of:
+        {"item_ids": [...]}: delete the given haiku
+        {"where": {"username": ..., "created_before": ...}, "segments": 16}:
+            delete the haiku matching all conditions. {"where": {}} deletes all.
+        {"cursor": ...}: continue the previous request
+
+    Deleting by predicate stops before the Lambda times out. The response
+    then has "complete": false and a cursor to send again. So does a response
+    with failed deletes: the cursor deletes them again.
+    """
+    try:
+        body = event.get("body")
+        if not body:
+            raise ValueError("Invalid request. The request body is missing!")
+        body = json.loads(body)
+        if not isinstance(body, dict):
+            raise ValueError("The request body must be an object")
+
+        if "item_ids" in body:
+            item_ids = body["item_ids"]
+            if not isinstance(item_ids, list) or not all(isinstance(i, str) and i for i in item_ids):
+                raise ValueError("'item_ids' must be a list of IDs")
+            if len(item_ids) > MAX_DELETE_IDS:
+                raise ValueError(f"at most {MAX_DELETE_IDS} IDs can be deleted at once")
+            item_ids = list(dict.fromkeys(item_ids)) # BatchWriteItem rejects duplicates
+            failed = delete_ids(table, item_ids)
+            resp = {
+                "deleted": len(item_ids) - len(failed),
+                "failed": failed,
+                "complete": not failed,
+            }
+        else:
+            if body.get("cursor"):
+                where, total_segments, segments, retry = decode_delete_cursor(body["cursor"])
+            elif "where" in body:
+                where = body["where"]
+                total_segments = body.get("segments", DEFAULT_SEGMENTS)
+                if not isinstance(total_segments, int) or not 1 <= total_segments <= MAX_SEGMENTS:
+                    raise ValueError(f"segments must be between 1 and {MAX_SEGMENTS}")
+                segments = {segment: None for segment in range(total_segments)}
+                retry = []
+            else:
+                raise ValueError("Specify 'item_ids', 'where' or 'cursor'")
+            scan_filter = filter_kwargs(where)
+
+            remaining_ms = context.get_remaining_time_in_millis() if context else 25000
+            deadline = time.monotonic() + remaining_ms / 1000 - DELETE_MARGIN
+            # the haiku which could not be deleted by the previous request go first
+            failed = delete_ids(table, retry)
+            scanned, deleted, failed_ids, segments = delete_matching(
+                table, segments, total_segments, scan_filter, deadline
+            )
+            deleted += len(retry) - len(failed)
+            failed += failed_ids
+            print(f"scanned {scanned}, deleted {deleted}, failed {len(failed)}, "
+                  f"{len(segments)} of {total_segments} segments left")
+            resp = {
+                "scanned": scanned,
+                "deleted": deleted,
+                "failed": len(failed),
+                "complete": not segments and not failed,
+                "cursor": encode_cursor("delete", {
+                    "where": where,
+                    "total_segments": total_segments,
+                    "segments": segments,
+                    "retry": failed,
+                }) if segments or failed else None,
+            }
+        cache.clear()
+        status_code = 200
+    except ValueError as e:
+        status_code = 400
+        resp = {"description": f"Bad request. {str(e)}"}
+    except Exception as e:
+        status_code = 500
+        resp = {"description": str(e)}
+    return {
+        "statusCode": status_code,
+        "headers": HEADERS,
+        "body": dumps(resp)
+    }
+
+def drain_likes(event, context):
+    """
+    handler for the SQS queue of likes (LIKES_MODE=buffered)
+
+    Likes in the batch are summed per haiku, so each haiku gets a single
+    update_item however many times it was liked. The records of the sums
+    that failed are returned as batchItemFailures, so that only they are
+    delivered again and the likes already added are not counted twice.
+    """
+    increments = Counter()
+    message_ids = {} # item_id -> messageIds of its likes
+    for record in event["Records"]:
+        like = json.loads(record["body"])
+        increments[like["item_id"]] += like["inc"]
+        message_ids.setdefault(like["item_id"], []).append(record["messageId"])
+
+    failed = []
+    for item_id, inc in increments.items():
+        try:
+            table.update_item(
+                Key={"item_id": item_id},
+                UpdateExpression="SET likes = likes + :inc",
+                # the haiku may have been deleted in the meantime
+                ConditionExpression="attribute_exists(item_id)",
+                ExpressionAttributeValues={
+                    ':inc': inc,
+                }
+            )
+        except table.client.exceptions.ConditionalCheckFailedException:
+            pass
+        except Exception as e:
+            print(f"Failed to add {inc} likes to {item_id}: {str(e)}")
+            failed.append(item_id)
+
+    print(f"received {len(event['Records'])} likes, updated {len(increments) - len(failed)} haiku, "
+          f"{len(failed)} failed")
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": message_id}
+            for item_id in failed for message_id in message_ids[item_id]
+        ]
+    }
+
+# (httpMethod, resource) -> handler
+ROUTES = {
+    ("GET", "/haiku"): get_haiku,
+    ("POST", "/haiku"): post_haiku,
+    ("POST", "/haiku/batch"): post_haiku_batch,
+    ("POST", "/haiku/batch_delete"): delete_haiku_batch,
+    ("PATCH", "/haiku/{item_id}"): patch_haiku,
+    ("DELETE", "/haiku/{item_id}"): delete_haiku,
+}
+
+def handler(event, context):
+    """
+    handler for all routes (api_mode=monolith)
+    """
+    route = ROUTES.get((event.get("httpMethod"), event.get("resource")))
+    if route is None:
+        return {
+            "statusCode": 404,
+            "headers": HEADERS,
+            "body": json.dumps({"description": f"Not found. {event.get('httpMethod')} {event.get('resource')}"})
+        }
+    return route(event, context)
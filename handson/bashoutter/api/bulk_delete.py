@@ -0,0 +1,120 @@
+"""
+Server-side bulk delete of haiku.
+
+Matching items are found with a parallel segmented scan: the table is split
+into 'total_segments' segments (Segment/TotalSegments of Scan) which are
+scanned by separate threads, and every page of keys is deleted right away
+with BatchWriteItem. Work stops shortly before the deadline, and the scan
+position of each unfinished segment is returned so the caller can resume,
+together with the IDs of the haiku that could not be deleted.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dynamodb import BatchWriteError
+
+# items scanned per page, so that the deadline is checked often enough
+PAGE_SIZE = 1000
+
+# attributes a predicate may compare, and how
+PREDICATES = {
+    "username": "#username = :username",
+    "created_before": "#created_at < :created_before",
+}
+ATTRIBUTE_NAMES = {
+    "username": {"#username": "username"},
+    "created_before": {"#created_at": "created_at"},
+}
+
+def filter_kwargs(where):
+    """
+    Convert a predicate such as {"username": "松尾芭蕉"} into Scan parameters.
+    Conditions are combined with AND. An empty predicate matches every item.
+    """
+    if not isinstance(where, dict):
+        raise ValueError("'where' must be an object")
+    unknown = set(where) - set(PREDICATES)
+    if unknown:
+        raise ValueError(f"Unknown condition {sorted(unknown)}. Choose from {list(PREDICATES)}")
+    if not where:
+        return {}
+    names, values = {}, {}
+    for key, value in where.items():
+        if not isinstance(value, str) or not value:
+            raise ValueError(f"'{key}' must be a non-empty string")
+        names.update(ATTRIBUTE_NAMES[key])
+        values[f":{key}"] = value
+    return {
+        "FilterExpression": " AND ".join(PREDICATES[key] for key in where),
+        "ExpressionAttributeNames": names,
+        "ExpressionAttributeValues": values,
+    }
+
+def delete_ids(table, item_ids):
+    """
+    Delete the given haiku. Returns the IDs that may not have been deleted.
+    """
+    if not item_ids:
+        return []
+    try:
+        failed = table.batch_write(delete_keys=[{"item_id": i} for i in item_ids])
+    except BatchWriteError as e:
+        print(f"batch_write failed: {str(e.cause)}")
+        failed = e.unprocessed
+    return [item_ids[i] for i in failed]
+
+def delete_segment(table, segment, total_segments, start_key, scan_filter, deadline):
+    """
+    Scan one segment from 'start_key' and delete what matches, until the
+    segment is finished or the deadline passes.
+
+    Returns (scanned, deleted, IDs that failed, start key to resume from or None if finished)
+    """
+    scanned, deleted, failed = 0, 0, []
+    scan_kwargs = {
+        "Segment": segment,
+        "TotalSegments": total_segments,
+        "ProjectionExpression": "item_id",
+        "Limit": PAGE_SIZE,
+        **scan_filter,
+    }
+    while True:
+        if start_key:
+            scan_kwargs["ExclusiveStartKey"] = start_key
+        response = table.scan(**scan_kwargs)
+        item_ids = [item["item_id"] for item in response["Items"]]
+        unprocessed = delete_ids(table, item_ids)
+
+        scanned += response.get("ScannedCount", len(item_ids))
+        deleted += len(item_ids) - len(unprocessed)
+        failed += unprocessed
+        start_key = response.get("LastEvaluatedKey")
+        if not start_key or time.monotonic() >= deadline:
+            return scanned, deleted, failed, start_key
+
+def delete_matching(table, segments, total_segments, scan_filter, deadline):
+    """
+    Run delete_segment() for every unfinished segment in parallel.
+
+    Parameters
+    ----------
+    segments: dict
+        {segment number: start key, or None to start from the beginning}.
+        Finished segments are not in the dict.
+
+    Returns (scanned, deleted, IDs that failed, unfinished segments in the same format)
+    """
+    scanned, deleted, failed, remaining = 0, 0, [], {}
+    if not segments:
+        return scanned, deleted, failed, remaining
+    with ThreadPoolExecutor(len(segments)) as executor:
+        futures = {
+            segment: executor.submit(delete_segment, table, segment, total_segments,
+                                     start_key, scan_filter, deadline)
+            for segment, start_key in segments.items()
+        }
+        for segment, future in futures.items():
+            s, d, f, start_key = future.result()
+            scanned, deleted, failed = scanned + s, deleted + d, failed + f
+            if start_key:
+                remaining[segment] = start_key
+    return scanned, deleted, failed, remaining
@@ -0,0 +1,135 @@
+"""
+Read-through cache for GET /haiku.
+
+The backend is selected by environment variables:
+    CACHE_BACKEND: "memory" (default) or "none". Other backends can be added
+        with register_backend()
+    CACHE_TTL: seconds until an entry expires (default 5)
+    CACHE_MAX_ENTRIES: maximum number of entries; the least recently used
+        entry is evicted first (default 256)
+
+The "memory" backend lives in the Lambda container, so it is shared only by
+the requests served by that container. Writes handled by another container
+cannot invalidate it; CACHE_TTL bounds how stale such entries can be. This is
+why the stack enables it only with api_mode=monolith: with one function per
+route, no write ever reaches the cache of GET /haiku. A backend shared by all
+containers (e.g. ElastiCache) can be plugged in by subclassing Cache.
+"""
+import os, time
+from collections import OrderedDict
+
+class Cache:
+    """
+    Interface of a cache backend
+    """
+    def get(self, key):
+        """
+        Return the cached value, or None on a miss
+        """
+        raise NotImplementedError
+
+    def set(self, key, value, keep_ttl=False):
+        """
+        With 'keep_ttl', an existing entry keeps its expiry (e.g. when a cached
+        value is patched); otherwise the entry expires after the TTL
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def items(self):
+        """
+        Return a list of (key, value) of the live entries. Backends which cannot
+        enumerate their entries may leave this unimplemented; callers then fall
+        back to clear().
+        """
+        raise NotImplementedError
+
+class NullCache(Cache):
+    """
+    Backend which caches nothing
+    """
+    def get(self, key):
+        return None
+
+    def set(self, key, value, keep_ttl=False):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def items(self):
+        return []
+
+class MemoryCache(Cache):
+    """
+    In-process cache with TTL and size-bounded LRU eviction
+    """
+    def __init__(self, ttl=5.0, max_entries=256, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict() # key -> (expires_at, value)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, keep_ttl=False):
+        entry = self._entries.get(key)
+        expires_at = entry[0] if keep_ttl and entry else self.clock() + self.ttl
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def items(self):
+        now = self.clock()
+        return [(key, value) for key, (expires_at, value) in self._entries.items()
+                if expires_at > now]
+
+BACKENDS = {
+    "memory": MemoryCache,
+    "none": NullCache,
+}
+
+def register_backend(name, cls):
+    """
+    Make a Cache subclass selectable with CACHE_BACKEND=name.
+    The class is instantiated with the keyword arguments 'ttl' and 'max_entries'.
+    """
+    BACKENDS[name] = cls
+
+def create_cache():
+    """
+    Build the cache backend configured by the environment variables
+    """
+    name = os.environ.get("CACHE_BACKEND", "memory")
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown CACHE_BACKEND '{name}'. Choose from {list(BACKENDS)}")
+    if name == "none":
+        return NullCache()
+    return BACKENDS[name](
+        ttl=float(os.environ.get("CACHE_TTL", "5")),
+        max_entries=int(os.environ.get("CACHE_MAX_ENTRIES", "256")),
+    )
@@ -0,0 +1,32 @@
+"""
+Lazily constructed AWS clients.
+
+Building a client loads the service model from disk, which is one of the
+largest parts of a Lambda cold start. Clients are therefore created on first
+use instead of at import time, and only botocore (not boto3 and its resource
+layer) is imported.
+"""
+import os
+
+_clients = {}
+
+def get_client(service_name):
+    """
+    Return the low-level client of the service, creating it on first call
+    """
+    client = _clients.get(service_name)
+    if client is None:
+        import botocore.session
+        # e.g. DYNAMODB_ENDPOINT_URL=http://localhost:8000 for DynamoDB Local
+        endpoint_url = os.environ.get(f"{service_name.upper()}_ENDPOINT_URL")
+        client = botocore.session.get_session().create_client(
+            service_name, endpoint_url=endpoint_url
+        )
+        _clients[service_name] = client
+    return client
+
+def set_client(service_name, client):
+    """
+    Use the given client (e.g. a stub for local benchmarks) instead of a real one
+    """
+    _clients[service_name] = client
@@ -0,0 +1,183 @@
+"""
+A thin replacement of boto3's DynamoDB Table resource on top of the low-level client.
+
+Only the operations used by the API are provided. They take and return plain
+Python values like the resource layer does, but creating a Table costs
+nothing: the client is built on the first request. Unlike the resource layer,
+numbers come back as Number (a float keeping the exact digits) rather than
+decimal.Decimal, so that items can be passed to json.dumps() as they are.
+"""
+import random, time
+from decimal import Decimal
+from clients import get_client
+
+# BatchWriteItem accepts up to 25 requests
+BATCH_WRITE_SIZE = 25
+
+def _number_digits(value):
+    return value.digits if isinstance(value, Number) else str(value)
+
+def serialize(value):
+    """
+    Convert a Python value into a DynamoDB AttributeValue
+    """
+    if value is None:
+        return {"NULL": True}
+    if isinstance(value, bool):
+        return {"BOOL": value}
+    if isinstance(value, (int, Decimal, Number)):
+        return {"N": _number_digits(value)}
+    if isinstance(value, str):
+        return {"S": value}
+    if isinstance(value, (bytes, bytearray)):
+        return {"B": bytes(value)}
+    if isinstance(value, dict):
+        return {"M": {k: serialize(v) for k, v in value.items()}}
+    if isinstance(value, (list, tuple)):
+        return {"L": [serialize(v) for v in value]}
+    if isinstance(value, (set, frozenset)) and value:
+        if all(isinstance(v, str) for v in value):
+            return {"SS": list(value)}
+        if all(isinstance(v, (int, Decimal, Number)) and not isinstance(v, bool) for v in value):
+            return {"NS": [_number_digits(v) for v in value]}
+        if all(isinstance(v, (bytes, bytearray)) for v in value):
+            return {"BS": [bytes(v) for v in value]}
+    # floats are rejected like boto3 does, because they cannot be stored exactly
+    raise TypeError(f"Unsupported type {type(value)} for value {value!r}")
+
+class Number(float):
+    """
+    A number read from DynamoDB. Being a float, it is encoded by json.dumps()
+    without a callback, as float(Decimal) would be (5 -> 5.0). 'digits' keeps
+    the exact value, which serialize() writes back unchanged.
+    """
+    __slots__ = ("digits",)
+
+def deserialize_number(value):
+    # cheaper than a __new__ written in Python
+    number = Number(value)
+    number.digits = value
+    return number
+
+def deserialize(attr):
+    """
+    Convert a DynamoDB AttributeValue into a Python value
+    """
+    (dynamodb_type, value), = attr.items()
+    if dynamodb_type == "S":
+        return value
+    if dynamodb_type == "N":
+        return deserialize_number(value)
+    if dynamodb_type == "BOOL":
+        return value
+    if dynamodb_type == "NULL":
+        return None
+    if dynamodb_type == "M":
+        return {k: deserialize(v) for k, v in value.items()}
+    if dynamodb_type == "L":
+        return [deserialize(v) for v in value]
+    if dynamodb_type == "B":
+        return value
+    if dynamodb_type == "SS":
+        return set(value)
+    if dynamodb_type == "NS":
+        return set(deserialize_number(v) for v in value)
+    if dynamodb_type == "BS":
+        return set(value)
+    raise TypeError(f"Unknown DynamoDB type {dynamodb_type}")
+
+def serialize_item(item):
+    return {k: serialize(v) for k, v in item.items()}
+
+def deserialize_item(item):
+    return {k: deserialize(v) for k, v in item.items()}
+
+class BatchWriteError(Exception):
+    """
+    A BatchWriteItem call raised. 'unprocessed' holds the indexes of the
+    requests that may not have been written: those of the failed call, the
+    ones after it, and the ones left unprocessed before it.
+    """
+    def __init__(self, unprocessed, cause):
+        super().__init__(str(cause))
+        self.unprocessed = unprocessed
+        self.cause = cause
+
+# request parameters holding items or keys, and response fields to convert back
+_ITEM_PARAMS = ["Item", "Key", "ExclusiveStartKey", "ExpressionAttributeValues"]
+_ITEM_FIELDS = ["Item", "Attributes", "LastEvaluatedKey"]
+
+class Table:
+    """
+    Subset of boto3's dynamodb.Table using the low-level client
+    """
+    def __init__(self, table_name):
+        self.table_name = table_name
+
+    @property
+    def client(self):
+        return get_client("dynamodb")
+
+    def _call(self, operation, **kwargs):
+        for param in _ITEM_PARAMS:
+            if param in kwargs:
+                kwargs[param] = serialize_item(kwargs[param])
+        response = getattr(self.client, operation)(TableName=self.table_name, **kwargs)
+        for field in _ITEM_FIELDS:
+            if field in response:
+                response[field] = deserialize_item(response[field])
+        if "Items" in response:
+            response["Items"] = [deserialize_item(item) for item in response["Items"]]
+        return response
+
+    def get_item(self, **kwargs):
+        return self._call("get_item", **kwargs)
+
+    def put_item(self, **kwargs):
+        return self._call("put_item", **kwargs)
+
+    def update_item(self, **kwargs):
+        return self._call("update_item", **kwargs)
+
+    def delete_item(self, **kwargs):
+        return self._call("delete_item", **kwargs)
+
+    def scan(self, **kwargs):
+        return self._call("scan", **kwargs)
+
+    def query(self, **kwargs):
+        return self._call("query", **kwargs)
+
+    def batch_write(self, put_items=(), delete_keys=(), max_attempts=8):
+        """
+        Put and delete many items with BatchWriteItem, 25 requests at a time.
+        Unprocessed requests (e.g. throttled ones) are retried with exponential
+        backoff and jitter.
+
+        Returns the indexes of the requests that were still unprocessed after
+        'max_attempts', counting puts first and then deletes. If a call raises,
+        BatchWriteError tells which requests may not have been written.
+        """
+        requests = [{"PutRequest": {"Item": serialize_item(item)}} for item in put_items]
+        requests += [{"DeleteRequest": {"Key": serialize_item(key)}} for key in delete_keys]
+
+        failed = []
+        for start in range(0, len(requests), BATCH_WRITE_SIZE):
+            # position of each pending request, to report the failed ones
+            end = min(start + BATCH_WRITE_SIZE, len(requests))
+            pending = {i: requests[i] for i in range(start, end)}
+            for attempt in range(max_attempts):
+                if attempt > 0:
+                    time.sleep(random.uniform(0, min(1.0, 0.05 * 2 ** attempt)))
+                try:
+                    response = self.client.batch_write_item(
+                        RequestItems={self.table_name: list(pending.values())}
+                    )
+                except Exception as e:
+                    raise BatchWriteError(failed + list(pending) + list(range(end, len(requests))), e) from e
+                unprocessed = response.get("UnprocessedItems", {}).get(self.table_name, [])
+                pending = {i: r for i, r in pending.items() if r in unprocessed}
+                if not pending:
+                    break
+            failed += list(pending)
+        return failed
@@ -0,0 +1,91 @@
+"""
+Helpers for the time-ordered (and like-ordered) feed of haiku.
+
+Every haiku gets a 'feed' attribute such as "feed#3". The two global secondary
+indexes of the table use 'feed' as the partition key and 'created_at' or
+'likes' as the sort key, so "newest N" or "top N" becomes a Query on each
+shard instead of a Scan of the whole table. Items are spread over several
+shards so that a single feed partition does not become a hot key.
+"""
+import heapq, zlib
+
+# name of the GSI and of its sort key for each order
+FEED_INDEXES = {
+    "latest": ("feed-created_at-index", "created_at"),
+    "top": ("feed-likes-index", "likes"),
+}
+
+def feed_shard(item_id, num_shards):
+    """
+    Return the feed partition key for the given item
+    """
+    return f"feed#{zlib.crc32(item_id.encode('utf-8')) % num_shards}"
+
+def all_shards(num_shards):
+    return [f"feed#{i}" for i in range(num_shards)]
+
+def query_feed(table, order, limit, start_keys):
+    """
+    Return the next 'limit' items of the feed in descending order.
+
+    Parameters
+    ----------
+    table: boto3 Table
+    order: str
+        "latest" or "top"
+    limit: int
+        page size
+    start_keys: dict
+        {shard: ExclusiveStartKey or None}. Shards not in the dict are exhausted.
+
+    Returns
+    -------
+    (items, next_start_keys). next_start_keys is empty when the feed is exhausted.
+    """
+    index_name, sort_key = FEED_INDEXES[order]
+
+    # query the newest (or most liked) 'limit' items of each shard
+    pages = {}
+    for shard, start_key in start_keys.items():
+        query_kwargs = {
+            "IndexName": index_name,
+            "KeyConditionExpression": "feed = :feed",
+            "ExpressionAttributeValues": {":feed": shard},
+            "ScanIndexForward": False,
+            "Limit": limit,
+        }
+        if start_key:
+            query_kwargs["ExclusiveStartKey"] = start_key
+        response = table.query(**query_kwargs)
+        pages[shard] = (response.get("Items", []), response.get("LastEvaluatedKey"))
+
+    # k-way merge of the sorted pages
+    merged = heapq.merge(
+        *[items for items, _ in pages.values()],
+        key=lambda item: item[sort_key],
+        reverse=True,
+    )
+    items = []
+    for item in merged:
+        if len(items) == limit:
+            break
+        items.append(item)
+
+    # resume each shard right after the last item consumed from it
+    next_start_keys = {}
+    last_consumed = {}
+    for item in items:
+        last_consumed[item["feed"]] = item
+    for shard, (shard_items, last_key) in pages.items():
+        if shard in last_consumed:
+            last = last_consumed[shard]
+            if last is shard_items[-1] and not last_key:
+                continue # this shard is exhausted
+            next_start_keys[shard] = {
+                "item_id": last["item_id"],
+                "feed": last["feed"],
+                sort_key: last[sort_key],
+            }
+        elif shard_items or last_key:
+            next_start_keys[shard] = start_keys[shard]
+    return items, next_start_keys
@@ -0,0 +1,32 @@
+"""
+JSON serialization of DynamoDB items.
+
+json.dumps() cannot handle decimal.Decimal by itself, and every Decimal costs
+a call back from the C encoder into Python. dynamodb.Table returns numbers as
+dynamodb.Number, a float subclass, so the items it returns (likes included)
+contain no Decimal and are encoded without any callback, into the same bytes
+as DecimalEncoder gives for the Decimals of boto3 (e.g. 5.0 for 5). Decimals
+from elsewhere are still converted with float().
+"""
+import json, decimal
+
+# this custom class is to handle decimal.Decimal objects in json.dumps()
+class DecimalEncoder(json.JSONEncoder):
+    def default(self, o):
+        if isinstance(o, decimal.Decimal):
+            return float(o)
+        return super(DecimalEncoder, self).default(o)
+
+def _default(o):
+    # like DecimalEncoder: anything but a Decimal is an error
+    if isinstance(o, decimal.Decimal):
+        return float(o)
+    raise TypeError(f"Object of type {o.__class__.__name__} is not JSON serializable")
+
+_encoder = json.JSONEncoder(default=_default)
+
+def dumps(obj):
+    """
+    Same as json.dumps(obj, cls=DecimalEncoder)
+    """
+    return _encoder.encode(obj)
@@ -6,6 +6,7 @@ from aws_cdk import (
     aws_lambda as _lambda,
     aws_ssm as ssm,
     aws_apigateway as apigw,
+    aws_sqs as sqs,
 )
 import os
 
@@ -25,6 +26,31 @@ class Bashoutter(core.Stack):
             billing_mode=ddb.BillingMode.PAY_PER_REQUEST,
             removal_policy=core.RemovalPolicy.DESTROY
         )
+        # indexes for the feed. Items are spread over 'feed_shards' partitions
+        # ("feed#0", "feed#1", ...) and sorted by time or by likes
+        feed_shards = self.node.try_get_context("feed_shards") or "4"
+        table.add_global_secondary_index(
+            index_name="feed-created_at-index",
+            partition_key=ddb.Attribute(
+                name="feed",
+                type=ddb.AttributeType.STRING
+            ),
+            sort_key=ddb.Attribute(
+                name="created_at",
+                type=ddb.AttributeType.STRING
+            ),
+        )
+        table.add_global_secondary_index(
+            index_name="feed-likes-index",
+            partition_key=ddb.Attribute(
+                name="feed",
+                type=ddb.AttributeType.STRING
+            ),
+            sort_key=ddb.Attribute(
+                name="likes",
+                type=ddb.AttributeType.NUMBER
+            ),
+        )
 
         # <2>
         bucket = s3.Bucket(
@@ -35,48 +61,142 @@ class Bashoutter(core.Stack):
             removal_policy=core.RemovalPolicy.DESTROY
         )
 
+        # likes_mode=direct: PATCH /haiku/{item_id} updates the table right away
+        # likes_mode=buffered: likes go through a queue and are applied in batches
+        likes_mode = self.node.try_get_context("likes_mode") or "direct"
+        if likes_mode not in ["direct", "buffered"]:
+            raise ValueError("likes_mode must be 'direct' or 'buffered'")
+
+        # api_mode=split: one Lambda function per route
+        # api_mode=monolith: a single function serves every route,
+        #     so that all requests share the same pool of warm containers
+        api_mode = self.node.try_get_context("api_mode") or "split"
+        if api_mode not in ["split", "monolith"]:
+            raise ValueError("api_mode must be 'split' or 'monolith'")
+
+        # the "memory" cache lives in each container and is invalidated only by
+        # the writes of that container. With api_mode=split, GET /haiku runs in
+        # a function of its own whose cache no write can reach, so it is off.
+        cache_backend = self.node.try_get_context("cache_backend") or (
+            "memory" if api_mode == "monolith" else "none"
+        )
+        if cache_backend == "memory" and api_mode != "monolith":
+            raise ValueError("cache_backend=memory requires api_mode=monolith")
+
         common_params = {
             "runtime": _lambda.Runtime.PYTHON_3_7,
             "environment": {
-                "TABLE_NAME": table.table_name
+                "TABLE_NAME": table.table_name,
+                "FEED_SHARDS": str(feed_shards),
+                "CACHE_BACKEND": cache_backend,
+                "CACHE_TTL": str(self.node.try_get_context("cache_ttl") or 5),
+                "LIKES_MODE": likes_mode,
             }
         }
 
+        if likes_mode == "buffered":
+            likes_queue = sqs.Queue(
+                self, "Bashoutter-LikesQueue",
+                visibility_timeout=core.Duration.seconds(60),
+            )
+            common_params["environment"]["LIKES_QUEUE_URL"] = likes_queue.queue_url
+
         # <3>
         # define Lambda functions
-        get_haiku_lambda = _lambda.Function(
-            self, "GetHaiku",
-            code=_lambda.Code.from_asset("api"),
-            handler="api.get_haiku",
-            memory_size=512,
-            timeout=core.Duration.seconds(10),
-            **common_params,
-        )
-        post_haiku_lambda = _lambda.Function(
-            self, "PostHaiku",
-            code=_lambda.Code.from_asset("api"),
-            handler="api.post_haiku",
-            **common_params,
-        )
-        patch_haiku_lambda = _lambda.Function(
-            self, "PatchHaiku",
-            code=_lambda.Code.from_asset("api"),
-            handler="api.patch_haiku",
-            **common_params,
-        )
-        delete_haiku_lambda = _lambda.Function(
-            self, "DeleteHaiku",
-            code=_lambda.Code.from_asset("api"),
-            handler="api.delete_haiku",
-            **common_params,
-        )
+        if api_mode == "monolith":
+            api_lambda = _lambda.Function(
+                self, "Api",
+                code=_lambda.Code.from_asset("api"),
+                handler="api.handler",
+                memory_size=512,
+                timeout=core.Duration.seconds(10),
+                **common_params,
+            )
+            table.grant_read_write_data(api_lambda)
+            get_haiku_lambda = api_lambda
+            post_haiku_lambda = api_lambda
+            post_haiku_batch_lambda = api_lambda
+            delete_haiku_batch_lambda = api_lambda
+            patch_haiku_lambda = api_lambda
+            delete_haiku_lambda = api_lambda
+        else:
+            get_haiku_lambda = _lambda.Function(
+                self, "GetHaiku",
+                code=_lambda.Code.from_asset("api"),
+                handler="api.get_haiku",
+                memory_size=512,
+                timeout=core.Duration.seconds(10),
+                **common_params,
+            )
+            post_haiku_lambda = _lambda.Function(
+                self, "PostHaiku",
+                code=_lambda.Code.from_asset("api"),
+                handler="api.post_haiku",
+                **common_params,
+            )
+            post_haiku_batch_lambda = _lambda.Function(
+                self, "PostHaikuBatch",
+                code=_lambda.Code.from_asset("api"),
+                handler="api.post_haiku_batch",
+                memory_size=512,
+                timeout=core.Duration.seconds(29),
+                **common_params,
+            )
+            patch_haiku_lambda = _lambda.Function(
+                self, "PatchHaiku",
+                code=_lambda.Code.from_asset("api"),
+                handler="api.patch_haiku",
+                **common_params,
+            )
+            delete_haiku_lambda = _lambda.Function(
+                self, "DeleteHaiku",
+                code=_lambda.Code.from_asset("api"),
+                handler="api.delete_haiku",
+                **common_params,
+            )
 
-        # <4>
-        # grant permissions
-        table.grant_read_data(get_haiku_lambda)
-        table.grant_read_write_data(post_haiku_lambda)
-        table.grant_read_write_data(patch_haiku_lambda)
-        table.grant_read_write_data(delete_haiku_lambda)
+            delete_haiku_batch_lambda = _lambda.Function(
+                self, "DeleteHaikuBatch",
+                code=_lambda.Code.from_asset("api"),
+                handler="api.delete_haiku_batch",
+                # more memory also means more CPU and network for the parallel scan
+                memory_size=1024,
+                timeout=core.Duration.seconds(29),
+                **common_params,
+            )
+
+            # <4>
+            # grant permissions
+            table.grant_read_data(get_haiku_lambda)
+            table.grant_read_write_data(post_haiku_lambda)
+            table.grant_read_write_data(post_haiku_batch_lambda)
+            table.grant_read_write_data(patch_haiku_lambda)
+            table.grant_read_write_data(delete_haiku_lambda)
+            table.grant_read_write_data(delete_haiku_batch_lambda)
+
+        if likes_mode == "buffered":
+            # drain the queue in batches of up to 1000 likes
+            drain_likes_lambda = _lambda.Function(
+                self, "DrainLikes",
+                code=_lambda.Code.from_asset("api"),
+                handler="api.drain_likes",
+                timeout=core.Duration.seconds(30),
+                **common_params,
+            )
+            likes_mapping = drain_likes_lambda.add_event_source_mapping(
+                "LikesQueueSource",
+                event_source_arn=likes_queue.queue_arn,
+                batch_size=1000,
+                max_batching_window=core.Duration.seconds(5),
+            )
+            # drain_likes() returns the records to retry (partial batch response),
+            # which CDK 1.100 cannot set yet
+            likes_mapping.node.default_child.add_property_override(
+                "FunctionResponseTypes", ["ReportBatchItemFailures"]
+            )
+            likes_queue.grant_consume_messages(drain_likes_lambda)
+            table.grant_read_write_data(drain_likes_lambda)
+            likes_queue.grant_send_messages(patch_haiku_lambda)
 
         # <5>
         # define API Gateway
@@ -85,6 +205,8 @@ class Bashoutter(core.Stack):
             default_cors_preflight_options=apigw.CorsOptions(
                 allow_origins=apigw.Cors.ALL_ORIGINS,
                 allow_methods=apigw.Cors.ALL_METHODS,
+                # clients send 'Cache-Control: no-cache' to bypass the cache of GET /haiku
+                allow_headers=apigw.Cors.DEFAULT_HEADERS + ["Cache-Control"],
             )
         )
 
@@ -98,6 +220,18 @@ class Bashoutter(core.Stack):
             apigw.LambdaIntegration(post_haiku_lambda)
         )
 
+        haiku_batch = haiku.add_resource("batch")
+        haiku_batch.add_method(
+            "POST",
+            apigw.LambdaIntegration(post_haiku_batch_lambda)
+        )
+
+        haiku_batch_delete = haiku.add_resource("batch_delete")
+        haiku_batch_delete.add_method(
+            "POST",
+            apigw.LambdaIntegration(delete_haiku_batch_lambda)
+        )
+
         haiku_item_id = haiku.add_resource("{item_id}")
         haiku_item_id.add_method(
             "PATCH",
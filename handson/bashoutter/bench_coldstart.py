@@ -0,0 +1,108 @@
+import argparse, json, os, statistics, subprocess, sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+HANDLERS = ["get_haiku", "post_haiku", "patch_haiku", "delete_haiku"]
+
+# runs in a fresh interpreter, i.e. a cold Lambda container
+CHILD = """
+import json, sys, time
+handler_name, num_items = sys.argv[1], int(sys.argv[2])
+
+t0 = time.perf_counter()
+import api
+import_ms = (time.perf_counter() - t0) * 1000
+
+# what the first request pays in Lambda to build the real client (no network involved)
+try:
+    t0 = time.perf_counter()
+    import botocore.session
+    botocore.session.get_session().create_client("dynamodb")
+    client_ms = (time.perf_counter() - t0) * 1000
+except ImportError:
+    client_ms = None
+
+import clients
+from stub_dynamodb import StubDynamoDB
+stub = StubDynamoDB()
+item_ids = stub.seed(api.table.table_name, num_items)
+clients.set_client("dynamodb", stub)
+
+events = {
+    "get_haiku": lambda i: {"queryStringParameters": {"order": "latest"}},
+    "post_haiku": lambda i: {"body": json.dumps({"username": "u", "first": "a", "second": "b", "third": "c"})},
+    "patch_haiku": lambda i: {"pathParameters": {"item_id": item_ids[i]}},
+    "delete_haiku": lambda i: {"pathParameters": {"item_id": item_ids[i]}},
+}
+handler = getattr(api, handler_name)
+
+t0 = time.perf_counter()
+resp = handler(events[handler_name](0), None)
+first_ms = (time.perf_counter() - t0) * 1000
+assert resp["statusCode"] < 300, resp
+
+t0 = time.perf_counter()
+for i in range(1, 11):
+    handler(events[handler_name](i), None)
+warm_ms = (time.perf_counter() - t0) * 1000 / 10
+
+print(json.dumps({"import_ms": import_ms, "client_ms": client_ms, "first_ms": first_ms, "warm_ms": warm_ms}))
+"""
+
+# the previous api.py built the boto3 resource and Table at import time
+BASELINE = """
+import json, time
+t0 = time.perf_counter()
+import boto3
+boto3.resource("dynamodb").Table("Bashoutter-Table")
+print(json.dumps({"import_ms": (time.perf_counter() - t0) * 1000}))
+"""
+
+def run_child(code, args, env):
+    out = subprocess.run(
+        [sys.executable, "-c", code] + args,
+        env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def median(runs, key):
+    values = [r[key] for r in runs if r[key] is not None]
+    return statistics.median(values) if values else None
+
+def fmt(value):
+    return f"{value:10.1f}" if value is not None else f"{'n/a':>10}"
+
+def measure(runs, num_items):
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join([os.path.join(HERE, "api"), HERE]),
+        PYTHONDONTWRITEBYTECODE="1",
+        TABLE_NAME="Bashoutter-Table",
+        AWS_DEFAULT_REGION=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+    )
+    print(f"Median of {runs} cold processes per handler (stubbed DynamoDB, {num_items} items)")
+    print(f"{'handler':<14} {'import':>10} {'client':>10} {'1st call':>10} {'warm call':>10} {'cold total':>10}  [ms]")
+    for name in HANDLERS:
+        results = [run_child(CHILD, [name, str(num_items)], env) for _ in range(runs)]
+        import_ms, client_ms = median(results, "import_ms"), median(results, "client_ms")
+        first_ms, warm_ms = median(results, "first_ms"), median(results, "warm_ms")
+        total = import_ms + (client_ms or 0) + first_ms
+        print(f"{name:<14} {fmt(import_ms)} {fmt(client_ms)} {fmt(first_ms)} {fmt(warm_ms)} {fmt(total)}")
+
+    try:
+        results = [run_child(BASELINE, [], env) for _ in range(runs)]
+        print(f"\nboto3 resource + Table at import time (previous api.py): {median(results, 'import_ms'):.1f} ms")
+    except subprocess.CalledProcessError:
+        print("\nboto3 is not installed; skipped the baseline of the previous api.py")
+
+if __name__ == "__main__":
+    # parse arguments
+    parser = argparse.ArgumentParser(
+        description="Measure import time and first-invocation latency of each API handler"
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--items", type=int, default=100,
+                        help="Number of haiku in the stubbed table")
+    args = parser.parse_args()
+
+    measure(args.runs, args.items)
@@ -0,0 +1,95 @@
+import argparse, csv, random
+
+# default share of each route in the mixed trace
+DEFAULT_MIX = {
+    "GET /haiku": 0.70,
+    "POST /haiku": 0.10,
+    "PATCH /haiku/{item_id}": 0.18,
+    "DELETE /haiku/{item_id}": 0.02,
+}
+
+def synthetic_trace(duration, base_rate, burst_rate, burst_every, burst_length, mix, seed):
+    """
+    Poisson arrivals at 'base_rate' req/s, with bursts of 'burst_rate' req/s
+    lasting 'burst_length' seconds every 'burst_every' seconds.
+    Returns a list of (time, route).
+    """
+    rng = random.Random(seed)
+    routes, weights = list(mix), list(mix.values())
+    trace, t = [], 0.0
+    while True:
+        in_burst = burst_every > 0 and t % burst_every < burst_length
+        t += rng.expovariate(burst_rate if in_burst else base_rate)
+        if t >= duration:
+            return trace
+        trace.append((t, rng.choices(routes, weights)[0]))
+
+def load_trace(filename):
+    """
+    Read a trace from a CSV file with the columns 'time' (seconds) and 'route'
+    (e.g. "GET /haiku")
+    """
+    with open(filename, newline="") as f:
+        return sorted((float(row["time"]), row["route"]) for row in csv.DictReader(f))
+
+def simulate(trace, pool_of, exec_time, init_time, idle_timeout):
+    """
+    Replay the trace against Lambda-like container pools.
+    A request reuses an idle container of its pool if one has been idle for
+    less than 'idle_timeout' seconds; otherwise it cold-starts a new container.
+
+    Returns (number of cold starts, largest number of containers alive at once)
+    """
+    pools = {} # pool name -> list of containers, i.e. the time each one becomes idle
+    cold_starts, max_containers = 0, 0
+    for t, route in trace:
+        containers = pools.setdefault(pool_of(route), [])
+        # containers idle for too long are reclaimed
+        containers[:] = [idle_since for idle_since in containers if t - idle_since < idle_timeout]
+        idle = [i for i, idle_since in enumerate(containers) if idle_since <= t]
+        if idle:
+            # the most recently used container is reused first
+            i = max(idle, key=lambda i: containers[i])
+            containers[i] = t + exec_time
+        else:
+            cold_starts += 1
+            containers.append(t + init_time + exec_time)
+        max_containers = max(max_containers, sum(len(c) for c in pools.values()))
+    return cold_starts, max_containers
+
+def benchmark(trace, exec_time, init_time, idle_timeout):
+    modes = {
+        "split": lambda route: route,
+        "monolith": lambda route: "api",
+    }
+    print(f"{len(trace)} requests over {trace[-1][0]:.0f} seconds")
+    print(f"{'api_mode':<10} {'cold starts':>12} {'cold start rate':>16} {'max containers':>15}")
+    for mode, pool_of in modes.items():
+        cold_starts, max_containers = simulate(trace, pool_of, exec_time, init_time, idle_timeout)
+        print(f"{mode:<10} {cold_starts:>12} {cold_starts / len(trace):>15.2%} {max_containers:>15}")
+
+if __name__ == "__main__":
+    # parse arguments
+    parser = argparse.ArgumentParser(
+        description="Compare cold starts of api_mode=split and api_mode=monolith under a mixed request trace"
+    )
+    parser.add_argument("--trace", type=str, help="CSV file with columns 'time' and 'route'. "
+                        "A bursty synthetic trace is generated if omitted")
+    parser.add_argument("--duration", type=float, default=3600)
+    parser.add_argument("--base_rate", type=float, default=0.05, help="req/s outside bursts")
+    parser.add_argument("--burst_rate", type=float, default=20, help="req/s during bursts")
+    parser.add_argument("--burst_every", type=float, default=900)
+    parser.add_argument("--burst_length", type=float, default=30)
+    parser.add_argument("--exec_time", type=float, default=0.05, help="seconds per request")
+    parser.add_argument("--init_time", type=float, default=0.6, help="seconds of a cold start")
+    parser.add_argument("--idle_timeout", type=float, default=600,
+                        help="seconds until an idle container is reclaimed")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.trace:
+        trace = load_trace(args.trace)
+    else:
+        trace = synthetic_trace(args.duration, args.base_rate, args.burst_rate,
+                                args.burst_every, args.burst_length, DEFAULT_MIX, args.seed)
+    benchmark(trace, args.exec_time, args.init_time, args.idle_timeout)
@@ -0,0 +1,64 @@
+import argparse, json, os, sys, timeit, uuid
+from boto3.dynamodb.types import TypeDeserializer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+from serialize import DecimalEncoder, dumps
+from dynamodb import deserialize_item
+
+def make_items(num):
+    """
+    'num' haiku as returned by DynamoDB, in the low-level AttributeValue format
+    """
+    return [{
+        "item_id": {"S": uuid.uuid4().hex},
+        "feed": {"S": f"feed#{i % 4}"},
+        "username": {"S": "松尾芭蕉"},
+        "first": {"S": "閑さや"},
+        "second": {"S": "岩にしみ入る"},
+        "third": {"S": "蝉の声"},
+        "likes": {"N": str(i % 1000)},
+        "created_at": {"S": "2021-05-18T15:17:00+00:00"},
+    } for i in range(num)]
+
+def benchmark(sizes, repeat):
+    """
+    Time a GET /haiku response body from the low-level items to JSON, with the
+    boto3 resource layer (every number a Decimal) and DecimalEncoder, and with
+    dynamodb.deserialize_item() (numbers as dynamodb.Number) and serialize.dumps().
+    "encode" times json alone; "total" includes the deserialization.
+    The two bodies must be the same bytes.
+    """
+    deserializer = TypeDeserializer()
+    def boto3_page(items):
+        return {"items": [{k: deserializer.deserialize(v) for k, v in item.items()} for item in items]}
+    def table_page(items):
+        return {"items": [deserialize_item(item) for item in items]}
+
+    print(f"{'items':>8} {'encode boto3 [ms]':>18} {'encode Table [ms]':>18} {'speedup':>8} "
+          f"{'total boto3 [ms]':>17} {'total Table [ms]':>17} {'speedup':>8}")
+    for num in sizes:
+        items = make_items(num)
+        old_page, new_page = boto3_page(items), table_page(items)
+        if json.dumps(old_page, cls=DecimalEncoder) != dumps(new_page):
+            raise RuntimeError("serialize.dumps() output differs from DecimalEncoder")
+
+        number = max(1, 10000 // num)
+        def measure(func):
+            return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1000
+        enc_old = measure(lambda: json.dumps(old_page, cls=DecimalEncoder))
+        enc_new = measure(lambda: dumps(new_page))
+        total_old = measure(lambda: json.dumps(boto3_page(items), cls=DecimalEncoder))
+        total_new = measure(lambda: dumps(table_page(items)))
+        print(f"{num:>8} {enc_old:>18.2f} {enc_new:>18.2f} {enc_old / enc_new:>7.2f}x "
+              f"{total_old:>17.2f} {total_new:>17.2f} {total_old / total_new:>7.2f}x")
+
+if __name__ == "__main__":
+    # parse arguments
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmark of JSON serialization of GET /haiku responses"
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    benchmark(args.sizes, args.repeat)
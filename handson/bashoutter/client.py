@@ -1,63 +1,162 @@
-import boto3, argparse, base64
-from multiprocessing import Pool, cpu_count
+import argparse, itertools, random, time
 import requests
+import loadgen
+from loadgen import Request
 
-def post_haiku(p):
-    endpoint_url = p[0]
-    if endpoint_url.endswith("/"):
-        endpoint_url = endpoint_url[:-1]
-    print("", end=".", flush=True)
-    resp = requests.post(
-        endpoint_url + "/haiku",
-        json={
-            "username": "松尾芭蕉",
-            "first": "閑さや",
-            "second": "岩にしみ入る",
-            "third": "蝉の声"
-        }
-    )
+HAIKU = {
+    "username": "松尾芭蕉",
+    "first": "閑さや",
+    "second": "岩にしみ入る",
+    "third": "蝉の声"
+}
 
-def delete_haiku(p):
-    endpoint_url = p[0]
-    item_id = p[1]
-    print("", end=".", flush=True)
-    resp = requests.delete(
-        endpoint_url + "/haiku/" + item_id
-    )
+def post_haiku_request(endpoint_url):
+    return Request("POST /haiku", "POST", endpoint_url + "/haiku", HAIKU)
+
+def delete_haiku_request(endpoint_url, item_id):
+    return Request("DELETE /haiku/{item_id}", "DELETE", endpoint_url + "/haiku/" + item_id)
+
+def post_haiku_batch_request(endpoint_url, num):
+    return Request("POST /haiku/batch", "POST", endpoint_url + "/haiku/batch", [HAIKU] * num)
 
-def post_many_haiku(endpoint_url, num):
-    with Pool(cpu_count()) as pool:
-        params = [(endpoint_url, i) for i in range(num)]
-        pool.map(post_haiku, params)
-    print(f"\nSent POST /haiku requests {num} times.")
+def post_many_haiku(endpoint_url, num, concurrency=64, rate=None, bulk=0):
+    """
+    Post 'num' haiku, one per request, or 'bulk' haiku per POST /haiku/batch request
+    """
+    if bulk:
+        sizes = [min(bulk, num - i) for i in range(0, num, bulk)]
+        requests = (post_haiku_batch_request(endpoint_url, size) for size in sizes)
+    else:
+        requests = (post_haiku_request(endpoint_url) for i in range(num))
+    stats = loadgen.run(requests, concurrency=concurrency, rate=rate)
+    stats.report()
+    if bulk:
+        print(f"\nSent {num} haiku in {len(sizes)} POST /haiku/batch requests.")
+    else:
+        print(f"\nSent POST /haiku requests {num} times.")
+
+def list_item_ids(endpoint_url, limit=100):
+    """
+    Follow the cursor of GET /haiku and collect the IDs of all haiku
+    """
+    item_ids = []
+    params = {"order": "unordered", "limit": limit}
+    while True:
+        page = requests.get(
+            endpoint_url + "/haiku", params=params
+        ).json()
+        item_ids += [h["item_id"] for h in page["items"]]
+        if not page.get("next_cursor"):
+            return item_ids
+        params["cursor"] = page["next_cursor"]
+
+def clear_database(endpoint_url, where=None, segments=16):
+    """
+    Delete all haiku (or those matching 'where') with POST /haiku/batch_delete,
+    following the cursor until the server reports completion
+    """
+    body = {"where": where or {}, "segments": segments}
+    start = time.time()
+    total = 0
+    while True:
+        resp = requests.post(endpoint_url + "/haiku/batch_delete", json=body)
+        resp.raise_for_status()
+        result = resp.json()
+        total += result["deleted"]
+        print(f"deleted {total} haiku ({time.time() - start:.1f} sec)", flush=True)
+        if result["complete"]:
+            break
+        body = {"cursor": result["cursor"]}
+    print(f"\nDeleted all haiku in the database.")
 
-def clear_database(endpoint_url):
-    haikus = requests.get(
-        endpoint_url + "/haiku"
-    ).json()
+def clear_database_per_item(endpoint_url, concurrency=64, rate=None):
+    """
+    Delete all haiku with one DELETE /haiku/{item_id} request each
+    """
+    item_ids = list_item_ids(endpoint_url)
 
-    if not haikus:
+    if not item_ids:
         return
 
-    with Pool(cpu_count()) as pool:
-        params = [(endpoint_url, h["item_id"]) for h in haikus]
-        pool.map(delete_haiku, params)
+    stats = loadgen.run(
+        (delete_haiku_request(endpoint_url, item_id) for item_id in item_ids),
+        concurrency=concurrency, rate=rate,
+    )
+    stats.report()
     print(f"\nDeleted all haiku in the database.")
 
+def mixed_requests(endpoint_url, item_ids, mix, duration, rate):
+    """
+    Generate GET/POST/PATCH requests at random in the ratio 'mix' for 'duration' seconds.
+    With an open-loop rate the number of requests is fixed in advance,
+    otherwise requests are generated until the deadline.
+    """
+    names = ["get", "post", "patch"]
+    weights = [mix[n] for n in names]
+    if rate:
+        counter = range(int(duration * rate))
+    else:
+        deadline = time.time() + duration
+        counter = itertools.takewhile(lambda _: time.time() < deadline, itertools.count())
+    for _ in counter:
+        name = random.choices(names, weights)[0]
+        if name == "get":
+            yield Request("GET /haiku", "GET", endpoint_url + "/haiku?limit=20")
+        elif name == "post":
+            yield post_haiku_request(endpoint_url)
+        elif item_ids:
+            yield Request("PATCH /haiku/{item_id}", "PATCH",
+                          endpoint_url + "/haiku/" + random.choice(item_ids))
+
+def load_test(endpoint_url, duration, concurrency, rate, mix):
+    item_ids = list_item_ids(endpoint_url)[:1000]
+    stats = loadgen.run(
+        mixed_requests(endpoint_url, item_ids, mix, duration, rate),
+        concurrency=concurrency, rate=rate,
+    )
+    stats.report(show_histogram=True)
+
 if __name__ == "__main__":
     # parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("endpoint_url", type=str)
     subparsers = parser.add_subparsers(dest="command")
 
-    sp1 = subparsers.add_parser("post_many")
+    # options of the load generator shared by all commands
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--concurrency", type=int, default=64,
+                        help="Maximum number of requests in flight (and of connections)")
+    common.add_argument("--rate", type=float, default=None,
+                        help="Target req/s (open loop). Send as fast as possible if omitted")
+
+    sp1 = subparsers.add_parser("post_many", parents=[common])
     sp1.add_argument("num", type=int)
+    sp1.add_argument("--bulk", type=int, default=0,
+                     help="Send this many haiku per POST /haiku/batch request (max 500)")
+
+    sp2 = subparsers.add_parser("clear_database", parents=[common])
+    sp2.add_argument("--username", type=str, help="Delete only the haiku of this user")
+    sp2.add_argument("--segments", type=int, default=16, help="Parallel scan segments on the server")
+    sp2.add_argument("--per_item", action="store_true",
+                     help="Send one DELETE /haiku/{item_id} per haiku instead")
 
-    sp2 = subparsers.add_parser("clear_database")
+    sp3 = subparsers.add_parser("load", parents=[common], help="Mixed GET/POST/PATCH load test")
+    sp3.add_argument("--duration", type=float, default=30)
+    sp3.add_argument("--get", type=float, default=0.8, help="Share of GET /haiku")
+    sp3.add_argument("--post", type=float, default=0.1, help="Share of POST /haiku")
+    sp3.add_argument("--patch", type=float, default=0.1, help="Share of PATCH /haiku/{item_id}")
 
     args = parser.parse_args()
+    endpoint_url = args.endpoint_url.rstrip("/")
 
     if args.command == "post_many":
-        post_many_haiku(args.endpoint_url, int(args.num))
+        post_many_haiku(endpoint_url, int(args.num), args.concurrency, args.rate, args.bulk)
     elif args.command == "clear_database":
-        clear_database(args.endpoint_url)
+        if args.per_item:
+            clear_database_per_item(endpoint_url, args.concurrency, args.rate)
+        else:
+            where = {"username": args.username} if args.username else {}
+            clear_database(endpoint_url, where, args.segments)
+    elif args.command == "load":
+        mix = {"get": args.get, "post": args.post, "patch": args.patch}
+        load_test(endpoint_url, args.duration, args.concurrency, args.rate, mix)
@@ -0,0 +1,83 @@
+import boto3, argparse, time, threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+def like_until(endpoint_url, item_id, deadline, results, lock):
+    """
+    Keep sending PATCH /haiku/{item_id} over one keep-alive connection until 'deadline'
+    """
+    session = requests.Session()
+    url = endpoint_url + "/haiku/" + item_id
+    counts = Counter()
+    while time.time() < deadline:
+        try:
+            counts[session.patch(url).status_code] += 1
+        except requests.RequestException:
+            counts["error"] += 1
+    with lock:
+        results.update(counts)
+
+def get_likes(table, item_id):
+    item = table.get_item(Key={"item_id": item_id}, ConsistentRead=True)["Item"]
+    return int(item["likes"])
+
+def load_test(endpoint_url, table_name, duration, concurrency, settle_timeout):
+    """
+    Hammer a single haiku with likes and report how many likes/sec were
+    accepted by the API and actually applied to the table
+    """
+    if endpoint_url.endswith("/"):
+        endpoint_url = endpoint_url[:-1]
+    table = boto3.resource("dynamodb").Table(table_name)
+
+    # the hot item
+    item_id = requests.post(
+        endpoint_url + "/haiku",
+        json={
+            "username": "load test",
+            "first": "閑さや",
+            "second": "岩にしみ入る",
+            "third": "蝉の声"
+        }
+    ).json()["item_id"]
+
+    print(f"Liking {item_id} with {concurrency} connections for {duration} seconds...")
+    results, lock = Counter(), threading.Lock()
+    start = time.time()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(like_until, endpoint_url, item_id, start + duration, results, lock)
+    elapsed = time.time() - start
+    accepted = results[200] + results[202]
+
+    # wait for the buffered likes to be applied
+    applied = get_likes(table, item_id)
+    settle_start = time.time()
+    while applied < accepted and time.time() - settle_start < settle_timeout:
+        time.sleep(1)
+        applied = get_likes(table, item_id)
+    settle_time = time.time() - settle_start
+
+    print("Responses:", dict(results))
+    print(f"Accepted: {accepted} likes ({accepted / elapsed:.1f} likes/sec)")
+    print(f"Applied:  {applied} likes ({applied / (elapsed + settle_time):.1f} likes/sec, "
+          f"settled {settle_time:.1f} sec after the load)")
+    if applied < accepted:
+        print(f"Warning: {accepted - applied} likes were not applied within {settle_timeout} seconds")
+
+    requests.delete(endpoint_url + "/haiku/" + item_id)
+
+if __name__ == "__main__":
+    # parse arguments
+    parser = argparse.ArgumentParser(
+        description="Load test of PATCH /haiku/{item_id} on a single hot haiku"
+    )
+    parser.add_argument("endpoint_url", type=str)
+    parser.add_argument("table_name", type=str)
+    parser.add_argument("--duration", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--settle_timeout", type=int, default=60)
+    args = parser.parse_args()
+
+    load_test(args.endpoint_url, args.table_name, args.duration, args.concurrency, args.settle_timeout)
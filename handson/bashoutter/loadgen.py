@@ -0,0 +1,131 @@
+"""
+Asynchronous HTTP load generator.
+
+All requests go through one aiohttp session, i.e. a pool of keep-alive
+connections, so that the TLS handshake is paid once per connection instead of
+once per request. Two modes are available:
+
+    closed loop (rate=None): 'concurrency' workers send requests back to back
+    open loop (rate=R): requests are started at R req/s regardless of how fast
+        the server answers, up to 'concurrency' in flight. Latency is measured
+        from the scheduled start time, so a slow server is not hidden by the
+        generator slowing down (coordinated omission).
+"""
+import asyncio, time
+from collections import Counter, defaultdict, namedtuple
+import aiohttp
+
+# name: label used in the report, e.g. "POST /haiku"
+Request = namedtuple("Request", ["name", "method", "url", "json"], defaults=[None])
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+class Stats:
+    """
+    Latency samples and status codes per endpoint
+    """
+    def __init__(self):
+        self.latencies = defaultdict(list) # name -> [seconds]
+        self.statuses = defaultdict(Counter) # name -> {status: count}
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def record(self, name, status, latency):
+        self.latencies[name].append(latency)
+        self.statuses[name][status] += 1
+
+    @property
+    def count(self):
+        return sum(len(v) for v in self.latencies.values())
+
+    def histogram(self, name, bounds_ms=(10, 20, 50, 100, 200, 500, 1000, 2000, 5000)):
+        """
+        Return [(upper bound in ms or None for overflow, count)]
+        """
+        counts = Counter()
+        for latency in self.latencies[name]:
+            ms = latency * 1000
+            counts[next((b for b in bounds_ms if ms <= b), None)] += 1
+        return [(b, counts[b]) for b in list(bounds_ms) + [None]]
+
+    def report(self, show_histogram=False):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        print(f"\n{self.count} requests in {elapsed:.1f} sec ({self.count / elapsed:.1f} req/s)")
+        print(f"{'endpoint':<26} {'count':>7} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} [ms]  status")
+        for name in sorted(self.latencies):
+            values = sorted(self.latencies[name])
+            p50, p95, p99 = [percentile(values, p) * 1000 for p in (50, 95, 99)]
+            statuses = ", ".join(f"{k}: {v}" for k, v in sorted(self.statuses[name].items(), key=str))
+            print(f"{name:<26} {len(values):>7} {len(values) / elapsed:>8.1f} "
+                  f"{p50:>8.1f} {p95:>8.1f} {p99:>8.1f}       {statuses}")
+            if show_histogram:
+                for bound, count in self.histogram(name):
+                    label = f"<= {bound} ms" if bound is not None else "slower"
+                    bar = "#" * int(50 * count / len(values))
+                    print(f"    {label:>11} {count:>7} {bar}")
+
+async def _send(session, req, stats, scheduled=None):
+    start = time.perf_counter() if scheduled is None else scheduled
+    try:
+        async with session.request(req.method, req.url, json=req.json) as resp:
+            await resp.read()
+            status = resp.status
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        status = type(e).__name__
+    stats.record(req.name, status, time.perf_counter() - start)
+
+async def _closed_loop(session, requests, concurrency, stats):
+    iterator = iter(requests)
+
+    async def worker():
+        for req in iterator:
+            await _send(session, req, stats)
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+async def _open_loop(session, requests, concurrency, rate, stats):
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    async def send(req, scheduled):
+        async with semaphore:
+            await _send(session, req, stats, scheduled)
+
+    start = time.perf_counter()
+    for i, req in enumerate(requests):
+        scheduled = start + i / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.ensure_future(send(req, scheduled))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+
+async def run_async(requests, concurrency=64, rate=None, timeout=30):
+    """
+    Send 'requests' (an iterable of Request) and return Stats
+    """
+    stats = Stats()
+    connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=60)
+    async with aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+    ) as session:
+        if rate:
+            await _open_loop(session, requests, concurrency, rate, stats)
+        else:
+            await _closed_loop(session, requests, concurrency, stats)
+    stats.finished = time.perf_counter()
+    return stats
+
+def run(requests, concurrency=64, rate=None, timeout=30):
+    """
+    Synchronous wrapper of run_async()
+    """
+    return asyncio.run(run_async(requests, concurrency, rate, timeout))
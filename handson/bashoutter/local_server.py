@@ -0,0 +1,103 @@
+"""
+Local stand-in for the deployed API, for trying out client.py and loadgen.py
+without AWS.
+
+HTTP requests are converted into API Gateway proxy events and passed to
+api.handler, which talks to the in-memory stub_dynamodb instead of DynamoDB.
+
+    python local_server.py --port 8080 --seed 100
+    python client.py http://localhost:8080 load --duration 10
+"""
+import argparse, json, os, re, sys, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, "api"))
+os.environ.setdefault("TABLE_NAME", "Bashoutter-Table")
+import api, clients
+from stub_dynamodb import StubDynamoDB
+
+# resource path of API Gateway -> regex of the request path, matched in this order
+RESOURCES = {
+    "/haiku": re.compile(r"^/haiku/?$"),
+    "/haiku/batch": re.compile(r"^/haiku/batch/?$"),
+    "/haiku/batch_delete": re.compile(r"^/haiku/batch_delete/?$"),
+    "/haiku/{item_id}": re.compile(r"^/haiku/(?P<item_id>[^/]+)/?$"),
+}
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections alive like API Gateway does
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+
+    def _handle(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8") if length else None
+
+        event = {
+            "httpMethod": self.command,
+            "path": url.path,
+            "resource": None,
+            "headers": dict(self.headers),
+            "queryStringParameters": dict(parse_qsl(url.query)) or None,
+            "pathParameters": None,
+            "body": body,
+        }
+        for resource, pattern in RESOURCES.items():
+            m = pattern.match(url.path)
+            if m:
+                event["resource"] = resource
+                event["pathParameters"] = m.groupdict() or None
+                break
+
+        if self.latency:
+            time.sleep(self.latency)
+        resp = api.handler(event, None)
+
+        # like API Gateway, no body is sent with "204 No Content"
+        payload = resp["body"].encode("utf-8") if resp["statusCode"] != 204 else b""
+        self.send_response(resp["statusCode"])
+        for name, value in resp.get("headers", {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PATCH = do_DELETE = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+class LocalServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # a load generator opens many connections at once
+    request_queue_size = 1024
+
+def serve(port, seed, latency):
+    stub = StubDynamoDB()
+    stub.seed(api.table.table_name, seed, api.FEED_SHARDS)
+    clients.set_client("dynamodb", stub)
+    ApiRequestHandler.latency = latency
+
+    server = LocalServer(("127.0.0.1", port), ApiRequestHandler)
+    print(f"Serving the Bashoutter API on http://127.0.0.1:{port} ({seed} haiku)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    # parse arguments
+    parser = argparse.ArgumentParser(
+        description="Run the Bashoutter API locally with an in-memory DynamoDB"
+    )
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--seed", type=int, default=100, help="Number of haiku to start with")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds added to every request to mimic API Gateway and Lambda")
+    args = parser.parse_args()
+
+    serve(args.port, args.seed, args.latency)
@@ -0,0 +1,55 @@
+import boto3, argparse, os, sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+from feed import feed_shard
+
+ddb = boto3.resource("dynamodb")
+
+def backfill_feed(table_name, num_shards, dry_run=False):
+    """
+    Add the 'feed' attribute to the haiku posted before the feed indexes existed.
+    Items which already have 'feed' are left untouched, so this can be re-run safely.
+    """
+    table = ddb.Table(table_name)
+    scan_kwargs = {
+        "ProjectionExpression": "item_id, feed",
+    }
+    scanned, updated = 0, 0
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response["Items"]:
+            scanned += 1
+            if "feed" in item:
+                continue
+            if not dry_run:
+                try:
+                    table.update_item(
+                        Key={"item_id": item["item_id"]},
+                        UpdateExpression="SET feed = :feed",
+                        # do not resurrect items deleted during the migration
+                        ConditionExpression="attribute_exists(item_id) AND attribute_not_exists(feed)",
+                        ExpressionAttributeValues={
+                            ":feed": feed_shard(item["item_id"], num_shards),
+                        }
+                    )
+                except table.meta.client.exceptions.ConditionalCheckFailedException:
+                    continue
+            updated += 1
+        print(f"scanned {scanned} items, updated {updated} items", flush=True)
+        if "LastEvaluatedKey" not in response:
+            break
+        scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    print("Finished backfilling the feed." + (" (dry run)" if dry_run else ""))
+
+if __name__ == "__main__":
+    # parse arguments
+    parser = argparse.ArgumentParser(
+        description="Backfill the 'feed' attribute of existing haiku"
+    )
+    parser.add_argument("table_name", type=str)
+    parser.add_argument("--shards", type=int, default=4,
+                        help="Must be the same as 'feed_shards' of the deployed stack")
+    parser.add_argument("--dry_run", action="store_true")
+    args = parser.parse_args()
+
+    backfill_feed(args.table_name, args.shards, args.dry_run)
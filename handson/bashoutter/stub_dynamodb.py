@@ -0,0 +1,186 @@
+"""
+In-memory stand-in for the low-level DynamoDB client, for local benchmarks.
+
+It understands only what the Bashoutter API sends: the 'item_id' hash key,
+the feed indexes, and simple SET / attribute_exists / comparison expressions.
+It is not a DynamoDB emulator; use DynamoDB Local for anything more.
+"""
+import re, threading, time, uuid, zlib
+from decimal import Decimal
+from types import SimpleNamespace
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+# index name -> (partition key, sort key)
+INDEXES = {
+    "feed-created_at-index": ("feed", "created_at"),
+    "feed-likes-index": ("feed", "likes"),
+}
+
+def _value(attr):
+    (dynamodb_type, value), = attr.items()
+    return Decimal(value) if dynamodb_type == "N" else value
+
+def _check_condition(item, condition):
+    if not condition:
+        return
+    for clause in condition.split(" AND "):
+        m = re.fullmatch(r"\s*(attribute_exists|attribute_not_exists)\((\w+)\)\s*", clause)
+        if m is None:
+            raise NotImplementedError(f"Unsupported condition: {clause}")
+        exists = item is not None and m.group(2) in item
+        if exists != (m.group(1) == "attribute_exists"):
+            raise ConditionalCheckFailedException(condition)
+
+def _match(item, expression, names, values):
+    for clause in expression.split(" AND "):
+        m = re.fullmatch(r"\s*(#?\w+)\s*(=|<|>)\s*(:\w+)\s*", clause)
+        if m is None:
+            raise NotImplementedError(f"Unsupported filter: {clause}")
+        name = names.get(m.group(1), m.group(1))
+        if name not in item:
+            return False
+        left, right = _value(item[name]), _value(values[m.group(3)])
+        if not {"=": left == right, "<": left < right, ">": left > right}[m.group(2)]:
+            return False
+    return True
+
+class StubDynamoDB:
+    """
+    Low-level DynamoDB client backed by a dict. 'latency' seconds are added
+    to every call to mimic the network round trip.
+    """
+    exceptions = SimpleNamespace(ConditionalCheckFailedException=ConditionalCheckFailedException)
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.tables = {} # table name -> {item_id: item}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _table(self, name):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self.tables.setdefault(name, {})
+
+    def seed(self, table_name, num, feed_shards=4):
+        """
+        Put 'num' haiku into the table and return their IDs
+        """
+        item_ids = []
+        table = self.tables.setdefault(table_name, {})
+        for i in range(num):
+            item_id = uuid.uuid4().hex
+            table[item_id] = {
+                "item_id": {"S": item_id},
+                "feed": {"S": f"feed#{zlib.crc32(item_id.encode('utf-8')) % feed_shards}"},
+                "username": {"S": "松尾芭蕉"},
+                "first": {"S": "閑さや"},
+                "second": {"S": "岩にしみ入る"},
+                "third": {"S": "蝉の声"},
+                "likes": {"N": str(i % 100)},
+                "created_at": {"S": f"2021-05-18T15:{i // 60 % 60:02d}:{i % 60:02d}+00:00"},
+            }
+            item_ids.append(item_id)
+        return item_ids
+
+    def get_item(self, TableName, Key, **kwargs):
+        with self._lock:
+            item = self._table(TableName).get(Key["item_id"]["S"])
+            return {"Item": dict(item)} if item else {}
+
+    def put_item(self, TableName, Item, ConditionExpression=None, **kwargs):
+        with self._lock:
+            table = self._table(TableName)
+            _check_condition(table.get(Item["item_id"]["S"]), ConditionExpression)
+            table[Item["item_id"]["S"]] = dict(Item)
+            return {}
+
+    def delete_item(self, TableName, Key, ConditionExpression=None, **kwargs):
+        with self._lock:
+            table = self._table(TableName)
+            _check_condition(table.get(Key["item_id"]["S"]), ConditionExpression)
+            table.pop(Key["item_id"]["S"], None)
+            return {}
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeValues={},
+                    ConditionExpression=None, **kwargs):
+        with self._lock:
+            table = self._table(TableName)
+            item_id = Key["item_id"]["S"]
+            _check_condition(table.get(item_id), ConditionExpression)
+            item = table.setdefault(item_id, dict(Key))
+            if not UpdateExpression.startswith("SET "):
+                raise NotImplementedError(f"Unsupported update: {UpdateExpression}")
+            for action in UpdateExpression[4:].split(","):
+                m = re.fullmatch(r"\s*(\w+)\s*=\s*(?:(\w+)\s*\+\s*)?(:\w+)\s*", action)
+                if m is None:
+                    raise NotImplementedError(f"Unsupported update: {action}")
+                name, base, placeholder = m.groups()
+                value = ExpressionAttributeValues[placeholder]
+                if base:
+                    value = {"N": str(_value(item[base]) + _value(value))}
+                item[name] = value
+            return {}
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        with self._lock:
+            for table_name, requests in RequestItems.items():
+                table = self._table(table_name)
+                for request in requests:
+                    if "PutRequest" in request:
+                        item = request["PutRequest"]["Item"]
+                        table[item["item_id"]["S"]] = dict(item)
+                    else:
+                        table.pop(request["DeleteRequest"]["Key"]["item_id"]["S"], None)
+            return {"UnprocessedItems": {}}
+
+    def scan(self, TableName, Limit=None, ExclusiveStartKey=None, Segment=0, TotalSegments=1,
+             FilterExpression=None, ExpressionAttributeNames={}, ExpressionAttributeValues={},
+             **kwargs):
+        with self._lock:
+            items = sorted(
+                (i for i in self._table(TableName).values()
+                 if zlib.crc32(i["item_id"]["S"].encode("utf-8")) % TotalSegments == Segment),
+                key=lambda i: i["item_id"]["S"]
+            )
+        if ExclusiveStartKey:
+            items = [i for i in items if i["item_id"]["S"] > ExclusiveStartKey["item_id"]["S"]]
+        response = self._page(items, Limit, ["item_id"])
+        response["ScannedCount"] = response["Count"]
+        if FilterExpression:
+            response["Items"] = [i for i in response["Items"] if _match(
+                i, FilterExpression, ExpressionAttributeNames, ExpressionAttributeValues)]
+            response["Count"] = len(response["Items"])
+        return response
+
+    def query(self, TableName, IndexName, KeyConditionExpression, ExpressionAttributeValues,
+              ScanIndexForward=True, Limit=None, ExclusiveStartKey=None, **kwargs):
+        partition_key, sort_key = INDEXES[IndexName]
+        m = re.fullmatch(rf"\s*{partition_key}\s*=\s*(:\w+)\s*", KeyConditionExpression)
+        if m is None:
+            raise NotImplementedError(f"Unsupported key condition: {KeyConditionExpression}")
+        partition = ExpressionAttributeValues[m.group(1)]["S"]
+
+        def order(item):
+            return (_value(item[sort_key]), item["item_id"]["S"])
+        with self._lock:
+            items = [i for i in self._table(TableName).values()
+                     if partition_key in i and sort_key in i and i[partition_key]["S"] == partition]
+        items.sort(key=order, reverse=not ScanIndexForward)
+        if ExclusiveStartKey:
+            start = (_value(ExclusiveStartKey[sort_key]), ExclusiveStartKey["item_id"]["S"])
+            if ScanIndexForward:
+                items = [i for i in items if order(i) > start]
+            else:
+                items = [i for i in items if order(i) < start]
+        return self._page(items, Limit, ["item_id", partition_key, sort_key])
+
+    def _page(self, items, limit, key_names):
+        response = {"Items": [dict(i) for i in items[:limit]], "Count": len(items[:limit])}
+        if limit is not None and len(items) > limit:
+            last = items[limit - 1]
+            response["LastEvaluatedKey"] = {k: last[k] for k in key_names}
+        return response
@@ -1,6 +1,6 @@
 import unittest
 import requests
-import os, warnings, time, io, uuid
+import os, warnings, time, io, uuid, json, base64
 from datetime import datetime, timezone
 import boto3
 
@@ -23,6 +23,7 @@ class TestApi(unittest.TestCase):
             new_id = uuid.uuid4().hex
             response = table.put_item(Item={
                 "item_id": new_id,
+                "feed": "feed#0",
                 "username": "正岡子規",
                 "first": "柿くへば",
                 "second": "鐘が鳴るなり",
@@ -55,10 +56,56 @@ class TestApi(unittest.TestCase):
         )
         self.assertEqual(200, resp.status_code)
 
-        item = resp.json()[0]
+        item = resp.json()["items"][0]
         for key in ["item_id", "username", "first", "second", "third", "likes", "created_at"]:
             self.assertIn(key, item)
 
+    def test_get_haiku_pagination(self):
+        """
+        Test case for GET /haiku with limit and cursor
+        """
+        resp = requests.get(
+            self.ENDPOINT_URL + "/haiku", params={"limit": 1}
+        )
+        self.assertEqual(200, resp.status_code)
+        page = resp.json()
+        self.assertEqual(1, len(page["items"]))
+        self.assertIsNotNone(page["next_cursor"])
+
+        resp = requests.get(
+            self.ENDPOINT_URL + "/haiku",
+            params={"limit": 1, "cursor": page["next_cursor"]}
+        )
+        self.assertEqual(200, resp.status_code)
+        next_page = resp.json()
+        self.assertNotEqual(page["items"][0]["item_id"], next_page["items"][0]["item_id"])
+
+    def test_get_haiku_order(self):
+        """
+        Test case for GET /haiku with order
+        """
+        for order, key in [("latest", "created_at"), ("top", "likes")]:
+            resp = requests.get(
+                self.ENDPOINT_URL + "/haiku", params={"order": order}
+            )
+            self.assertEqual(200, resp.status_code)
+            values = [h[key] for h in resp.json()["items"]]
+            self.assertEqual(sorted(values, reverse=True), values)
+
+    def test_get_haiku_bad_request(self):
+        """
+        Test case for GET /haiku with invalid query parameters
+        """
+        # a well-formed cursor whose start key lacks the sort key 'created_at'
+        bad_key = json.dumps({"order": "latest", "key": {"feed#0": {"item_id": "x", "feed": "feed#0"}}})
+        bad_cursor = base64.urlsafe_b64encode(bad_key.encode("utf-8")).decode("ascii")
+        for params in [{"limit": 0}, {"limit": "abc"}, {"cursor": "!!!"}, {"cursor": bad_cursor},
+                       {"order": "random"}]:
+            resp = requests.get(
+                self.ENDPOINT_URL + "/haiku", params=params
+            )
+            self.assertEqual(400, resp.status_code)
+
     def test_post_haiku(self):
         """
         Test case for POST /haiku
@@ -74,6 +121,122 @@ class TestApi(unittest.TestCase):
         )
         self.assertEqual(201, resp.status_code)
 
+    def test_get_haiku_after_post(self):
+        """
+        Test case for GET /haiku bypassing the cache right after POST /haiku
+        """
+        username = uuid.uuid4().hex
+        resp = requests.post(
+            self.ENDPOINT_URL + "/haiku",
+            json={
+                "username": username,
+                "first": "古池や",
+                "second": "蛙飛び込む",
+                "third": "水の音"
+            }
+        )
+        self.assertEqual(201, resp.status_code)
+
+        # the feed is read through a GSI, which is only eventually consistent:
+        # poll until the new haiku shows up
+        deadline = time.time() + 10
+        while True:
+            resp = requests.get(
+                self.ENDPOINT_URL + "/haiku",
+                headers={"Cache-Control": "no-cache"}
+            )
+            self.assertEqual(200, resp.status_code)
+            self.assertEqual("MISS", resp.headers["X-Cache"])
+            usernames = [h["username"] for h in resp.json()["items"]]
+            if username in usernames or time.time() > deadline:
+                break
+            time.sleep(0.5)
+        self.assertIn(username, usernames)
+
+    def test_post_haiku_batch(self):
+        """
+        Test case for POST /haiku/batch
+        """
+        haiku = {
+            "username": "小林一茶",
+            "first": "やせ蛙",
+            "second": "負けるな一茶",
+            "third": "これにあり"
+        }
+        resp = requests.post(
+            self.ENDPOINT_URL + "/haiku/batch",
+            json=[haiku, haiku, dict(haiku, first="")]
+        )
+        self.assertEqual(207, resp.status_code)
+        results = resp.json()["results"]
+        # deleted by tearDownClass()
+        self.test_item_ids.extend(r["item_id"] for r in results if "item_id" in r)
+        self.assertEqual([201, 201, 400], [r["status"] for r in results])
+        self.assertIn("item_id", results[0])
+
+        resp = requests.post(
+            self.ENDPOINT_URL + "/haiku/batch",
+            json=haiku
+        )
+        self.assertEqual(400, resp.status_code)
+
+    def test_delete_haiku_batch(self):
+        """
+        Test case for POST /haiku/batch_delete
+        """
+        username = uuid.uuid4().hex
+        haiku = {
+            "username": username,
+            "first": "菜の花や",
+            "second": "月は東に",
+            "third": "日は西に"
+        }
+        results = requests.post(
+            self.ENDPOINT_URL + "/haiku/batch",
+            json=[haiku] * 3
+        ).json()["results"]
+        item_ids = [r["item_id"] for r in results]
+
+        # delete by IDs
+        resp = requests.post(
+            self.ENDPOINT_URL + "/haiku/batch_delete",
+            json={"item_ids": item_ids[:1]}
+        )
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(1, resp.json()["deleted"])
+
+        # delete by predicate
+        body = {"where": {"username": username}}
+        deleted = 0
+        while True:
+            resp = requests.post(
+                self.ENDPOINT_URL + "/haiku/batch_delete",
+                json=body
+            )
+            self.assertEqual(200, resp.status_code)
+            deleted += resp.json()["deleted"]
+            if resp.json()["complete"]:
+                break
+            body = {"cursor": resp.json()["cursor"]}
+        self.assertEqual(2, deleted)
+
+        resp = requests.post(
+            self.ENDPOINT_URL + "/haiku/batch_delete",
+            json={"where": {"unknown": "x"}}
+        )
+        self.assertEqual(400, resp.status_code)
+
+        # a cursor with a segment out of range
+        state = {"where": {}, "total_segments": 2, "segments": {"5": None}}
+        cursor = base64.urlsafe_b64encode(
+            json.dumps({"order": "delete", "key": state}).encode("utf-8")
+        ).decode("ascii")
+        resp = requests.post(
+            self.ENDPOINT_URL + "/haiku/batch_delete",
+            json={"cursor": cursor}
+        )
+        self.assertEqual(400, resp.status_code)
+
     def test_patch_haiku(self):
         """
         Test case for PATCH /haiku/{item_id}
@@ -81,7 +244,8 @@ class TestApi(unittest.TestCase):
         resp = requests.patch(
             self.ENDPOINT_URL + f"/haiku/{self.test_item_ids[0]}"
         )
-        self.assertEqual(200, resp.status_code)
+        # 202 when the stack is deployed with likes_mode=buffered
+        self.assertIn(resp.status_code, [200, 202])
 
     def test_delete_haiku(self):
         """
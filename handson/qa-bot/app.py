@@ -2,7 +2,9 @@ from aws_cdk import (
     core,
     aws_ec2 as ec2,
     aws_ecs as ecs,
+    aws_ecs_patterns as ecs_patterns,
     aws_dynamodb as dynamodb,
+    aws_s3 as s3,
     aws_ssm as ssm,
     aws_iam as iam,
     aws_logs,
@@ -17,6 +19,9 @@ class EcsClusterQaBot(core.Stack):
     引数:
         key_name: perman-aws-vault で取得した認証情報に含まれる社員番号
         student_id: 1 から 254 の間で指定(IPアドレスの一部に利用)
+        serve: 指定するとモデルを常駐させた推論サーバー(ALB + Fargate サービス)も作成
+            (例: -c serve=true)
+        backend: 推論バックエンド torch (既定) / int8 / onnx (例: -c backend=int8)
     """
 
     def __init__(self, scope: core.App, name: str, student_id: str, **kwargs) -> None:
@@ -44,10 +49,23 @@ class EcsClusterQaBot(core.Stack):
             table_name=f"qabot-table-{student_id}"
         )
 
+        # bucket to pass many questions at once to a batch task
+        bucket = s3.Bucket(
+            self, f"EcsClusterQaBot-Bucket-{student_id}",
+            removal_policy=core.RemovalPolicy.DESTROY,
+            auto_delete_objects=True,
+        )
+
+        serve = self.node.try_get_context("serve")
+        backend = self.node.try_get_context("backend") or "torch"
+        # e.g. 203.0.113.10/32; the server is open to the internet if not given
+        allowed_cidr = self.node.try_get_context("allowed_cidr")
+
         # <2>
         vpc = ec2.Vpc(
             self, f"EcsClusterQaBot-Vpc-{student_id}",
-            max_azs=1,
+            # ALB は 2 つ以上の AZ が必要
+            max_azs=2 if serve else 1,
             cidr=f"10.{student_id}.0.0/23",
             subnet_configuration=[
                 ec2.SubnetConfiguration(
@@ -73,21 +91,22 @@ class EcsClusterQaBot(core.Stack):
             family=f"qabot-task-{student_id}"
         )
 
-        taskdef.add_to_execution_role_policy(
-            iam.PolicyStatement(
-                effect=iam.Effect.ALLOW,
-                actions=[
-                    "ecr:GetAuthorizationToken",
-                    "ecr:BatchCheckLayerAvailability",
-                    "ecr:GetDownloadUrlForLayer",
-                    "ecr:BatchGetImage"
-                ],
-                resources=["*"]
-            )
+        # the image is pulled from another account's ECR
+        ecr_pull = iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=[
+                "ecr:GetAuthorizationToken",
+                "ecr:BatchCheckLayerAvailability",
+                "ecr:GetDownloadUrlForLayer",
+                "ecr:BatchGetImage"
+            ],
+            resources=["*"]
         )
+        taskdef.add_to_execution_role_policy(ecr_pull)
 
         # grant permissions
         table.grant_read_write_data(taskdef.task_role)
+        bucket.grant_read(taskdef.task_role)
         taskdef.add_to_task_role_policy(
             iam.PolicyStatement(
                 effect=iam.Effect.ALLOW,
@@ -103,7 +122,8 @@ class EcsClusterQaBot(core.Stack):
                 "101313435800.dkr.ecr.us-west-2.amazonaws.com/takaesu-qabot:latest"
             ),
             environment={
-                "STUDENT_ID": student_id
+                "STUDENT_ID": student_id,
+                "QA_BACKEND": backend
             },
             logging=ecs.LogDrivers.aws_logs(
                 stream_prefix=f"EcsClusterQaBot-{student_id}",
@@ -137,10 +157,79 @@ class EcsClusterQaBot(core.Stack):
             parameter_name=f"/qabot/{student_id}/TABLE_NAME",
             string_value=table.table_name
         )
+        ssm.StringParameter(
+            self, f"BUCKET_NAME_{student_id}",
+            parameter_name=f"/qabot/{student_id}/BUCKET_NAME",
+            string_value=bucket.bucket_name
+        )
 
         core.CfnOutput(self, f"ClusterName-{student_id}", value=cluster.cluster_name)
         core.CfnOutput(self, f"TaskDefinitionArn-{student_id}", value=taskdef.task_definition_arn)
 
+        # <6>
+        # long-running server: the model is loaded once and questions are sent over HTTP
+        if serve:
+            server_taskdef = ecs.FargateTaskDefinition(
+                self, f"EcsClusterQaBot-ServerTaskDef-{student_id}",
+                cpu=1024,
+                memory_limit_mib=4096,
+                family=f"qabot-server-{student_id}"
+            )
+            server_taskdef.add_to_execution_role_policy(ecr_pull)
+            table.grant_read_write_data(server_taskdef.task_role)
+            server_taskdef.add_to_task_role_policy(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    resources=["*"],
+                    actions=["ssm:GetParameter"]
+                )
+            )
+            server_container = server_taskdef.add_container(
+                f"EcsClusterQaBot-ServerContainer-{student_id}",
+                image=ecs.ContainerImage.from_registry(
+                    "101313435800.dkr.ecr.us-west-2.amazonaws.com/takaesu-qabot:latest"
+                ),
+                command=["--serve", "--port", "8080"],
+                environment={
+                    "STUDENT_ID": student_id,
+                    "QA_BACKEND": backend
+                },
+                logging=ecs.LogDrivers.aws_logs(
+                    stream_prefix=f"EcsClusterQaBot-Server-{student_id}",
+                    log_retention=aws_logs.RetentionDays.ONE_DAY
+                ),
+            )
+            server_container.add_port_mappings(ecs.PortMapping(container_port=8080))
+
+            # NAT がないため、タスクはパブリックサブネットにパブリックIP付きで配置
+            service = ecs_patterns.ApplicationLoadBalancedFargateService(
+                self, f"EcsClusterQaBot-Service-{student_id}",
+                cluster=cluster,
+                task_definition=server_taskdef,
+                desired_count=1,
+                public_load_balancer=True,
+                assign_public_ip=True,
+                task_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC),
+                # モデルの読み込みが終わるまでヘルスチェックの失敗を無視
+                health_check_grace_period=core.Duration.minutes(5),
+                # the server has no authentication: with allowed_cidr, only
+                # that range can reach the load balancer
+                open_listener=allowed_cidr is None,
+            )
+            if allowed_cidr:
+                service.load_balancer.connections.allow_from(
+                    ec2.Peer.ipv4(allowed_cidr), ec2.Port.tcp(80)
+                )
+            service.target_group.configure_health_check(path="/health")
+
+            server_url = f"http://{service.load_balancer.load_balancer_dns_name}"
+            ssm.StringParameter(
+                self, f"SERVER_URL_{student_id}",
+                parameter_name=f"/qabot/{student_id}/SERVER_URL",
+                string_value=server_url
+            )
+            core.CfnOutput(self, f"ServerUrl-{student_id}", value=server_url)
+
 app = core.App()
 EcsClusterQaBot(
     app, f"EcsClusterQaBot{app.node.try_get_context('student_id')}",
@@ -0,0 +1,146 @@
+"""
+Inference backends of the QA model on CPU.
+
+    torch: the full-precision PyTorch model of the pipeline
+    int8:  the same model with its Linear layers dynamically quantized to int8
+    onnx:  the model exported to ONNX and run by onnxruntime
+
+The int8 model is saved as TorchScript and the ONNX graph as a file, both
+made once (by snapshot_model.py, when the image is built), so that they are
+loaded without building the full-precision model first. Neither is a
+transformers model: they run through CachedQa (see context_cache.py), which
+only needs start and end logits from the model.
+
+torch is imported where it is used, so that BACKENDS can be read without it.
+"""
+import os, sys
+
+BACKENDS = ["torch", "int8", "onnx"]
+
+# files of the int8 and onnx models in a snapshot directory
+BACKEND_FILES = {"int8": "model_int8.pt", "onnx": "model.onnx"}
+
+def quantize_dynamic(model):
+    """
+    Weights of the Linear layers (almost all of DistilBERT) stored as int8;
+    activations are quantized on the fly
+    """
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def _logits(model):
+    """
+    The QA model with plain (start_logits, end_logits) outputs, for tracing
+    """
+    import torch
+
+    class Logits(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            outputs = self.model(input_ids=input_ids, attention_mask=attention_mask, return_dict=False)
+            return outputs[0], outputs[1]
+
+    return Logits(model.eval())
+
+def _example_inputs(tokenizer):
+    inputs = tokenizer("What is exported?", "The model is exported.", return_tensors="pt")
+    return inputs["input_ids"], inputs["attention_mask"]
+
+def save_int8(model, tokenizer, path):
+    """
+    Quantize the model and save it to 'path' as TorchScript, which is loaded
+    without the transformers model classes
+    """
+    import torch
+    with torch.no_grad():
+        traced = torch.jit.trace(_logits(quantize_dynamic(model)), _example_inputs(tokenizer),
+                                 check_trace=False)
+    torch.jit.save(traced, path)
+
+def export_onnx(model, tokenizer, path, opset=14):
+    """
+    Export the model to 'path', with batch size and sequence length left dynamic
+    """
+    import torch
+    axes = {0: "batch", 1: "sequence"}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    torch.onnx.export(
+        _logits(model),
+        _example_inputs(tokenizer),
+        path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["start_logits", "end_logits"],
+        dynamic_axes={
+            "input_ids": axes, "attention_mask": axes,
+            "start_logits": axes, "end_logits": axes,
+        },
+        opset_version=opset,
+    )
+
+class OnnxQaModel:
+    """
+    Callable like the PyTorch model by CachedQa: returns (start_logits, end_logits)
+    """
+    def __init__(self, path, threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            sys.exit("The onnx backend requires onnxruntime: pip install onnxruntime")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, input_ids, attention_mask):
+        import torch
+        start, end = self.session.run(None, {
+            "input_ids": input_ids.numpy().astype("int64"),
+            "attention_mask": attention_mask.numpy().astype("int64"),
+        })
+        return torch.from_numpy(start), torch.from_numpy(end)
+
+def save_backend(model, tokenizer, backend, path):
+    """
+    Save the int8 or onnx model made from the full-precision 'model' to 'path'
+    """
+    if backend == "int8":
+        save_int8(model, tokenizer, path)
+    else:
+        export_onnx(model, tokenizer, path)
+
+def load_backend(model_dir, backend, snapshot_dir):
+    """
+    (model, tokenizer) of 'backend'. 'model_dir' is a snapshot directory or a
+    model name on the hub. The int8 and onnx models are read from
+    'snapshot_dir'; one which is not there yet is made from the full-precision
+    model and saved there, so only that first load holds both in memory.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend}; choose from {BACKENDS}")
+    from transformers import AutoModelForQuestionAnswering, AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    if backend == "torch":
+        return AutoModelForQuestionAnswering.from_pretrained(model_dir), tokenizer
+    path = os.path.join(snapshot_dir, BACKEND_FILES[backend])
+    if not os.path.exists(path):
+        model = AutoModelForQuestionAnswering.from_pretrained(model_dir)
+        save_backend(model, tokenizer, backend, path)
+        del model
+    if backend == "int8":
+        import torch
+        return torch.jit.load(path), tokenizer
+    return OnnxQaModel(path), tokenizer
+
+def compare_answers(expected, answers, tolerance=0.05):
+    """
+    Answers differing from the expected ones: a different answer text, or a
+    score further than 'tolerance' from the expected score
+    """
+    return [
+        (i, a, b) for i, (a, b) in enumerate(zip(expected, answers))
+        if a["answer"] != b["answer"] or abs(a["score"] - b["score"]) > tolerance
+    ]
@@ -0,0 +1,111 @@
+"""
+Latency, memory and correctness of the inference backends (see backends.py).
+
+Each backend runs in its own process, so that its memory is measured alone:
+the resident memory once the benchmark has run (steady state), and the peak
+(max RSS), which includes loading. The int8 and onnx models are made
+beforehand into a snapshot (see snapshot_model.py), in another process, so
+that they are loaded without the full-precision model. The answers of the
+int8 and onnx backends are checked against the full-precision torch backend:
+the answer text must be the same and the score within --tolerance.
+"""
+import argparse, json, os, resource, subprocess, sys, time
+from context_cache import ContextCache, CachedQa
+from backends import BACKENDS, BACKEND_FILES, load_backend, compare_answers
+
+MB = 1024 ** 2
+
+def percentile(sorted_values, p):
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def current_rss_mb():
+    """
+    Resident memory of this process now (Linux), unlike ru_maxrss which is the peak
+    """
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / MB
+
+def run(backend, snapshot_dir, problems, repeat, threads):
+    """
+    Measure one backend in this process and return its results
+    """
+    import torch
+    if threads:
+        torch.set_num_threads(threads)
+    start = time.perf_counter()
+    model, tokenizer = load_backend(snapshot_dir, backend, snapshot_dir)
+    # the same code path for all backends, so that only the model differs
+    qa = CachedQa(None, ContextCache(tokenizer), model=model, tokenizer=tokenizer)
+    load_sec = time.perf_counter() - start
+
+    answers = qa(problems) # also warms up
+    latencies = []
+    for _ in range(repeat):
+        for prob in problems:
+            start = time.perf_counter()
+            qa(prob)
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "backend": backend,
+        "load_sec": load_sec,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "qps": 1000 * len(latencies) / sum(latencies),
+        "rss_mb": current_rss_mb(),
+        # kilobytes on Linux
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "answers": answers,
+    }
+
+if __name__ == "__main__":
+    # parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--problems", type=str, default="../problems.json")
+    parser.add_argument("--model", type=str, default="distilbert-base-cased-distilled-squad")
+    parser.add_argument("--backends", type=str, nargs="+", choices=BACKENDS, default=BACKENDS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=0.05, help="Maximum difference of the scores")
+    parser.add_argument("--snapshot_dir", type=str, default="snapshot",
+                        help="Snapshot of the model with its int8 and onnx models, made if missing")
+    parser.add_argument("--threads", type=int, default=None, help="torch threads (default: all cores)")
+    parser.add_argument("--run", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    with open(args.problems, "r") as f:
+        problems = json.load(f)
+
+    if args.run:
+        result = run(args.run, args.snapshot_dir, problems, args.repeat, args.threads)
+        print(json.dumps(result))
+        sys.exit()
+
+    files = ["config.json"] + list(BACKEND_FILES.values())
+    if not all(os.path.exists(os.path.join(args.snapshot_dir, name)) for name in files):
+        snapshot = os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshot_model.py")
+        subprocess.run([sys.executable, snapshot, args.snapshot_dir, "--model", args.model,
+                        "--int8", "--onnx"], check=True)
+
+    results = []
+    for backend in args.backends:
+        command = [sys.executable, __file__, "--run", backend] + sys.argv[1:]
+        out = subprocess.run(command, check=True, stdout=subprocess.PIPE).stdout
+        results.append(json.loads(out.decode("utf-8").strip().splitlines()[-1]))
+
+    print(f"{len(problems)} questions x {args.repeat}")
+    print(f"{'backend':8} {'load[s]':>8} {'p50[ms]':>8} {'p95[ms]':>8} {'q/s':>7} {'RSS[MB]':>8} {'peak[MB]':>9}  answers")
+    expected = next((r["answers"] for r in results if r["backend"] == "torch"), None)
+    for r in results:
+        if expected is None or r["backend"] == "torch":
+            check = "reference" if expected else "-"
+        else:
+            mismatches = compare_answers(expected, r["answers"], args.tolerance)
+            check = f"{len(problems) - len(mismatches)}/{len(problems)} match"
+        print(f"{r['backend']:8} {r['load_sec']:>8.2f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+              f"{r['qps']:>7.1f} {r['rss_mb']:>8.0f} {r['max_rss_mb']:>9.0f}  {check}")
+    if expected:
+        for r in results:
+            for i, a, b in compare_answers(expected, r["answers"], args.tolerance):
+                print(f"  {r['backend']}: {problems[i]['question']} "
+                      f"{a['answer']!r} ({a['score']:.3f}) != {b['answer']!r} ({b['score']:.3f})")
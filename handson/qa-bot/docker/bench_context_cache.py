@@ -0,0 +1,73 @@
+"""
+Time of the questions of problems.json with and without the context cache.
+
+problems.json asks several questions about each context. The pipeline
+tokenizes the context for every question; CachedQa tokenizes each distinct
+context once. The model itself still runs on every (question, context)
+window, so the gain is the tokenization share of the total time.
+"""
+import argparse, json, time
+from transformers import pipeline
+from context_cache import ContextCache, CachedQa
+
+def tokenize_pipeline(nlp, problems):
+    for prob in problems:
+        nlp.tokenizer(
+            prob["question"], prob["context"], truncation="only_second", max_length=384,
+            stride=128, return_overflowing_tokens=True, return_offsets_mapping=True,
+        )
+
+def tokenize_cached(qa, problems):
+    for prob in problems:
+        qa.windows(prob["question"], prob["context"])
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+if __name__ == "__main__":
+    # parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--problems", type=str, default="../problems.json")
+    parser.add_argument("--model", type=str, default="distilbert-base-cased-distilled-squad")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--batch_size", type=int, default=1)
+    args = parser.parse_args()
+
+    with open(args.problems, "r") as f:
+        problems = json.load(f)
+    n_contexts = len(set(prob["context"] for prob in problems))
+    print(f"{len(problems)} questions on {n_contexts} contexts")
+
+    nlp = pipeline("question-answering", model=args.model)
+    nlp(problems[0]) # warm up
+
+    # tokenization only; a fresh cache on each repeat
+    t_pipe, _ = timed(lambda: tokenize_pipeline(nlp, problems), args.repeat)
+    t_cold, _ = timed(lambda: tokenize_cached(CachedQa(nlp, ContextCache(nlp.tokenizer)), problems), args.repeat)
+    qa = CachedQa(nlp, ContextCache(nlp.tokenizer))
+    tokenize_cached(qa, problems)
+    t_warm, _ = timed(lambda: tokenize_cached(qa, problems), args.repeat)
+
+    # whole questions
+    t_answer_pipe, expected = timed(lambda: [nlp(prob) for prob in problems], args.repeat)
+    qa = CachedQa(nlp, ContextCache(nlp.tokenizer))
+    t_answer_cached, answers = timed(lambda: qa(problems, batch_size=args.batch_size), args.repeat)
+
+    print(f"{'':24} {'pipeline':>10} {'cache cold':>11} {'cache warm':>11} [ms]")
+    print(f"{'tokenize all':24} {t_pipe * 1000:>10.2f} {t_cold * 1000:>11.2f} {t_warm * 1000:>11.2f}")
+    print(f"{'answer all':24} {t_answer_pipe * 1000:>10.2f} {'':>11} {t_answer_cached * 1000:>11.2f}")
+    print(f"cache: {qa.cache.hits} hits, {qa.cache.misses} misses")
+
+    mismatches = [
+        (prob["question"], a["answer"], b["answer"])
+        for prob, a, b in zip(problems, expected, answers)
+        if a["answer"] != b["answer"] or abs(a["score"] - b["score"]) > 1e-4
+    ]
+    print(f"answers matching the pipeline: {len(problems) - len(mismatches)}/{len(problems)}")
+    for question, a, b in mismatches:
+        print(f"  {question}: {a!r} != {b!r}")
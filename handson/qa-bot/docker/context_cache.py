@@ -0,0 +1,201 @@
+"""
+Cache of tokenized contexts for question answering.
+
+The question-answering pipeline tokenizes the question and the context
+together for every question. When many questions are asked about the same
+document (as in problems.json), the context is tokenized again each time.
+ContextCache keeps the tokens of each context, keyed by the sha256 of its
+text, in an LRU and optionally on disk. CachedQa answers questions from
+these tokens: only the (short) question is tokenized, and the windows of
+the context are sliced from the cached tokens.
+
+Only the tokenization can be cached: DistilBERT attends over the question
+and the context together, so no encoder state of the context alone can be
+reused across questions.
+
+The windows are built as [CLS] question [SEP] context [SEP], as the
+BERT-style tokenizer of the QA model does for a pair.
+"""
+import hashlib, json, os, tempfile, threading
+from collections import OrderedDict
+import numpy as np
+import torch
+
+def context_key(context):
+    return hashlib.sha256(context.encode("utf-8")).hexdigest()
+
+class ContextCache:
+    """
+    LRU of tokenized contexts: sha256 of the text -> (token ids, character offsets, word ids).
+    With 'path', the cache is loaded from and saved to a JSON file.
+    """
+    def __init__(self, tokenizer, max_entries=256, path=None):
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load()
+
+    def get(self, context):
+        key = context_key(context)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        encoded = self.tokenizer(context, add_special_tokens=False, return_offsets_mapping=True)
+        entry = (
+            encoded["input_ids"],
+            [tuple(o) for o in encoded["offset_mapping"]],
+            encoded.word_ids(),
+        )
+        with self._lock:
+            self.entries[key] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def load(self):
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        # tokens of another tokenizer are of no use
+        if data.get("tokenizer") != self.tokenizer.name_or_path:
+            return
+        for key, entry in data["entries"].items():
+            self.entries[key] = (
+                entry["input_ids"], [tuple(o) for o in entry["offsets"]], entry["word_ids"]
+            )
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def save(self):
+        """
+        Write the cache, least recently used first, through a temporary file
+        so that a crash never leaves a truncated cache behind
+        """
+        with self._lock:
+            data = {
+                "tokenizer": self.tokenizer.name_or_path,
+                "entries": {
+                    key: {"input_ids": ids, "offsets": offsets, "word_ids": word_ids}
+                    for key, (ids, offsets, word_ids) in self.entries.items()
+                },
+            }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+class CachedQa:
+    """
+    Drop-in replacement of the question-answering pipeline which takes the
+    context tokens from a ContextCache. Called like the pipeline, with one
+    {"question", "context"} dict or a list of them. 'model' and 'tokenizer'
+    replace those of the pipeline 'nlp' (which can then be None), e.g. with
+    another backend (see backends.py).
+    """
+    def __init__(self, nlp, cache, max_length=384, stride=128, max_answer_len=15, candidates=12,
+                 model=None, tokenizer=None):
+        self.model = model if model is not None else nlp.model
+        self.tokenizer = tokenizer if tokenizer is not None else nlp.tokenizer
+        self.cache = cache
+        self.max_length = max_length
+        self.stride = stride
+        self.max_answer_len = max_answer_len
+        self.candidates = candidates
+
+    def windows(self, question, context):
+        """
+        Model inputs of the windows over the context, with the position of
+        the first context token in each
+        """
+        tok = self.tokenizer
+        ids, offsets, word_ids = self.cache.get(context)
+        question_ids = tok(question, add_special_tokens=False)["input_ids"]
+        room = self.max_length - len(question_ids) - 3
+        step = max(1, room - self.stride)
+        prefix = [tok.cls_token_id] + question_ids + [tok.sep_token_id]
+        windows = []
+        start = 0
+        while True:
+            window = ids[start:start + room]
+            windows.append((prefix + window + [tok.sep_token_id], len(prefix), start, len(window)))
+            if start + room >= len(ids):
+                return windows, (offsets, word_ids)
+            start += step
+
+    def best_spans(self, start_logits, end_logits, first, length):
+        """
+        Most probable (score, start, end) token spans of one window, as the pipeline picks them
+        """
+        # the context tokens can be in the answer; [CLS] is only part of the softmax
+        mask = np.full(start_logits.shape, True)
+        mask[first:first + length] = False
+        mask[0] = False
+        start_logits = np.where(mask, -10000.0, start_logits)
+        end_logits = np.where(mask, -10000.0, end_logits)
+        start_p = np.exp(start_logits - start_logits.max())
+        start_p /= start_p.sum()
+        end_p = np.exp(end_logits - end_logits.max())
+        end_p /= end_p.sum()
+        start_p[0] = end_p[0] = 0.0
+        scores = np.tril(np.triu(np.outer(start_p, end_p)), self.max_answer_len - 1)
+        flat = scores.flatten()
+        top = np.argsort(-flat)[:self.candidates]
+        spans = []
+        for s, e in zip(*np.unravel_index(top, scores.shape)):
+            if first <= s < first + length and first <= e < first + length:
+                spans.append((float(scores[s, e]), s - first, e - first))
+        return spans
+
+    def to_chars(self, offsets, word_ids, s, e):
+        """
+        Character span of the tokens s..e, widened to whole words
+        """
+        while s > 0 and word_ids[s - 1] == word_ids[s]:
+            s -= 1
+        while e < len(word_ids) - 1 and word_ids[e + 1] == word_ids[e]:
+            e += 1
+        return offsets[s][0], offsets[e][1]
+
+    def __call__(self, inputs, batch_size=1):
+        single = isinstance(inputs, dict)
+        inputs = [inputs] if single else inputs
+        features = [] # (input index, input ids, first context position, window start, window length)
+        contexts = [] # (offsets, word ids) of each context
+        for i, item in enumerate(inputs):
+            windows, context = self.windows(item["question"], item["context"])
+            contexts.append(context)
+            features.extend((i, *w) for w in windows)
+
+        # answer text -> answer, for each input: scores of the same text are summed
+        answers = [{} for _ in inputs]
+        pad = self.tokenizer.pad_token_id
+        for b in range(0, len(features), max(1, batch_size)):
+            batch = features[b:b + max(1, batch_size)]
+            width = max(len(f[1]) for f in batch)
+            input_ids = torch.tensor([f[1] + [pad] * (width - len(f[1])) for f in batch])
+            attention_mask = torch.tensor([[1] * len(f[1]) + [0] * (width - len(f[1])) for f in batch])
+            with torch.no_grad():
+                outputs = self.model(input_ids=input_ids, attention_mask=attention_mask)
+            start_logits, end_logits = outputs[0].numpy(), outputs[1].numpy()
+            for (i, ids, first, start, length), sl, el in zip(batch, start_logits, end_logits):
+                n = len(ids)
+                for score, s, e in self.best_spans(sl[:n], el[:n], first, length):
+                    char_start, char_end = self.to_chars(*contexts[i], start + s, start + e)
+                    text = inputs[i]["context"][char_start:char_end]
+                    answer = answers[i].setdefault(text.lower(), {
+                        "score": 0.0, "start": char_start, "end": char_end, "answer": text
+                    })
+                    answer["score"] += score
+
+        answers = [max(a.values(), key=lambda x: x["score"]) for a in answers]
+        return answers[0] if single else answers
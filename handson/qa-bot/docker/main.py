@@ -1,49 +1,318 @@
+import time
+STARTED_AT = time.perf_counter()
+
 import os
-import argparse, sys, logging
-from transformers import pipeline
-import boto3
+import argparse, sys, logging, json, threading, uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from backends import BACKENDS
+# transformers (with torch) and boto3 are imported where they are used:
+# they take seconds to import, and boto3 is not needed with --no_save
 
 # suppress warning message from pipeline
 logging.disable(sys.maxsize)
 
-def main(context, question, item_id, save_flag):
+MODEL_NAME = 'distilbert-base-cased-distilled-squad'
+# snapshot made by snapshot_model.py: a directory or s3://bucket/prefix
+MODEL_DIR = os.environ.get("MODEL_DIR")
+
+startup = {} # phase -> seconds, printed by report_startup()
+
+@contextmanager
+def startup_phase(name):
+    start = time.perf_counter()
+    yield
+    startup[name] = round(time.perf_counter() - start, 3)
+
+def report_startup(**fields):
+    """
+    Print the startup time of each phase as one JSON line
+    """
+    startup["total_sec"] = round(time.perf_counter() - STARTED_AT, 3)
+    print(json.dumps({"event": "startup", **fields, **startup}), flush=True)
+
+def model_dir():
+    """
+    Local directory of the model snapshot, or None to load the model from the hub
+    """
+    if not MODEL_DIR:
+        return None
+    if MODEL_DIR.startswith("s3://"):
+        from snapshot_model import fetch_snapshot
+        return fetch_snapshot(MODEL_DIR)
+    return MODEL_DIR
+
+def load_model(context_cache=False, cache_path=None, backend="torch"):
+    """
+    With 'context_cache', the tokens of each context are kept (and saved to
+    'cache_path', if given) so that the same context is tokenized only once.
+    'backend' is one of backends.BACKENDS.
+    """
+    with startup_phase("import_sec"):
+        from transformers import pipeline
+        from context_cache import ContextCache, CachedQa
+        from backends import load_backend
+    with startup_phase("load_sec"):
+        local_dir = model_dir()
+        # the int8 and onnx models are in the snapshot, or made next to main.py
+        backend_dir = local_dir or os.path.dirname(os.path.abspath(__file__))
+        model, tokenizer = load_backend(local_dir or MODEL_NAME, backend, backend_dir)
+    startup["model"] = local_dir or MODEL_NAME
+    # the int8 (TorchScript) and ONNX models can only run outside the pipeline, through CachedQa
+    if context_cache or cache_path or backend != "torch":
+        return CachedQa(None, ContextCache(tokenizer, path=cache_path), model=model, tokenizer=tokenizer)
+    return pipeline('question-answering', model=model, tokenizer=tokenizer)
+
+def save_cache(nlp):
+    cache = getattr(nlp, "cache", None)
+    if cache is not None and cache.path:
+        cache.save()
 
-    nlp = pipeline('question-answering', model='distilbert-base-cased-distilled-squad')
-    answer = nlp({
-        "question": question,
-        "context": context
-    })
+def get_table():
+    # パラメータ名のプレフィックスを構築
+    student_id = os.environ.get("STUDENT_ID")
+    if not student_id:
+        raise ValueError("STUDENT_ID environment variable must be set.")
+    full_path_table_name = f"/qabot/{student_id}/TABLE_NAME"
+    # get the table name
+    import boto3
+    ssm_client = boto3.client("ssm")
+    table_name = ssm_client.get_parameter(Name=full_path_table_name)["Parameter"]["Value"]
+
+    dynamodb = boto3.resource("dynamodb")
+    return dynamodb.Table(table_name)
+
+def save_answer(table, item_id, context, question, answer):
+    table.put_item(
+        Item={
+            "item_id": item_id,
+            "context": context,
+            "question": question,
+            "score": str(answer["score"]),
+            "answer": answer["answer"],
+        }
+    )
+
+def main(context, question, item_id, save_flag, context_cache=False, cache_path=None, backend="torch"):
+
+    nlp = load_model(context_cache, cache_path, backend)
+    with startup_phase("first_inference_sec"):
+        answer = nlp({
+            "question": question,
+            "context": context
+        })
+    report_startup(mode="single", backend=backend)
+    save_cache(nlp)
 
     # store answer in DynamoDB
     if save_flag:
-        # パラメータ名のプレフィックスを構築
-        student_id = os.environ.get("STUDENT_ID")
-        if not student_id:
-            raise ValueError("STUDENT_ID environment variable must be set.")
-        full_path_table_name = f"/qabot/{student_id}/TABLE_NAME"
-        # get the table name
-        ssm_client = boto3.client("ssm")
-        table_name = ssm_client.get_parameter(Name=full_path_table_name)["Parameter"]["Value"]
-
-        dynamodb = boto3.resource("dynamodb")
-        table = dynamodb.Table(table_name)
-        resp = table.put_item(
-            Item={
-                "item_id": item_id,
-                "context": context,
-                "question": question,
-                "score": str(answer["score"]),
-                "answer": answer["answer"],
-            }
-        )
+        save_answer(get_table(), item_id, context, question, answer)
 
     print(answer)
 
+def read_problems(path):
+    """
+    (context, question) pairs from a JSON list or a JSONL file, local or "s3://bucket/key".
+    Each pair gets an item_id unless it has one.
+    """
+    if path.startswith("s3://"):
+        import boto3
+        bucket, _, key = path[len("s3://"):].partition("/")
+        s3 = boto3.client("s3")
+        text = s3.get_object(Bucket=bucket, Key=key)["Body"].read().decode("utf-8")
+    else:
+        with open(path, "r") as f:
+            text = f.read()
+    if text.lstrip().startswith("["):
+        problems = json.loads(text)
+    else:
+        problems = [json.loads(line) for line in text.splitlines() if line.strip()]
+    for prob in problems:
+        prob.setdefault("item_id", str(uuid.uuid4()))
+    return problems
+
+def sort_by_length(nlp, problems):
+    """
+    Order the pairs by their number of tokens, so that each batch is padded
+    to a similar length. Each distinct context is tokenized once (or taken
+    from the context cache); only the questions are tokenized for every pair.
+    """
+    cache = getattr(nlp, "cache", None)
+    context_lengths = {}
+    def context_length(context):
+        if context not in context_lengths:
+            if cache is not None:
+                ids = cache.get(context)[0]
+            else:
+                ids = nlp.tokenizer(context, add_special_tokens=False)["input_ids"]
+            context_lengths[context] = len(ids)
+        return context_lengths[context]
+
+    lengths = [
+        context_length(prob["context"])
+        + len(nlp.tokenizer(prob["question"], add_special_tokens=False)["input_ids"])
+        for prob in problems
+    ]
+    return [prob for _, prob in sorted(zip(lengths, problems), key=lambda x: x[0])]
+
+def answer_batch(nlp, problems, batch_size):
+    """
+    Answer all the pairs, 'batch_size' at a time
+    """
+    answers = []
+    for i in range(0, len(problems), batch_size):
+        inputs = [
+            {"question": prob["question"], "context": prob["context"]}
+            for prob in problems[i:i + batch_size]
+        ]
+        result = nlp(inputs, batch_size=batch_size)
+        # the pipeline returns a dict, not a list, for a single input
+        answers.extend([result] if isinstance(result, dict) else result)
+    return answers
+
+def save_answers(table, problems, answers):
+    with table.batch_writer() as batch:
+        for prob, answer in zip(problems, answers):
+            batch.put_item(
+                Item={
+                    "item_id": prob["item_id"],
+                    "context": prob["context"],
+                    "question": prob["question"],
+                    "score": str(answer["score"]),
+                    "answer": answer["answer"],
+                }
+            )
+
+def main_batch(path, batch_sizes, save_flag, context_cache=False, cache_path=None, backend="torch"):
+    """
+    Answer many questions in one process and report questions/sec for each batch size
+    """
+    nlp = load_model(context_cache, cache_path, backend)
+    problems = sort_by_length(nlp, read_problems(path))
+
+    # warm up, so that the first batch size is not charged for it
+    with startup_phase("first_inference_sec"):
+        answer_batch(nlp, problems[:1], 1)
+    report_startup(mode="batch", backend=backend)
+
+    results = []
+    for batch_size in batch_sizes:
+        start = time.time()
+        answers = answer_batch(nlp, problems, batch_size)
+        elapsed = time.time() - start
+        results.append((batch_size, elapsed))
+        print(f"batch_size={batch_size}: {len(problems)} questions in {elapsed:.2f} sec", flush=True)
+    save_cache(nlp)
+
+    # store answers in DynamoDB
+    if save_flag:
+        save_answers(get_table(), problems, answers)
+        print(f"Saved {len(answers)} answers")
+    else:
+        for prob, answer in zip(problems, answers):
+            print(prob["question"], "->", answer)
+
+    print(f"{'batch_size':>10} {'sec':>8} {'q/s':>8}")
+    for batch_size, elapsed in results:
+        print(f"{batch_size:>10} {elapsed:>8.2f} {len(problems) / elapsed:>8.2f}")
+
+class QaHandler(BaseHTTPRequestHandler):
+    """
+    GET /health: 200 once the model is loaded
+    POST /ask: {"context": ..., "question": ..., "item_id": optional} -> answer
+    """
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok", "model": self.server.model})
+        else:
+            self.send_json(404, {"message": "Not found"})
+
+    def do_POST(self):
+        if self.path != "/ask":
+            self.send_json(404, {"message": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length))
+            context, question = body["context"], body["question"]
+            if not isinstance(context, str) or not isinstance(question, str):
+                raise ValueError("'context' and 'question' must be strings")
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {"message": f"Bad request. {e}"})
+            return
+        try:
+            with self.server.lock:
+                answer = self.server.nlp({"question": question, "context": context})
+            answer["score"] = float(answer["score"])
+            if self.server.table is not None and body.get("item_id"):
+                save_answer(self.server.table, body["item_id"], context, question, answer)
+        except Exception as e:
+            self.send_json(500, {"message": f"Internal server error. {e}"})
+            return
+        self.send_json(200, answer)
+
+    def log_message(self, format, *args):
+        # one line per request on stdout, collected by CloudWatch Logs
+        print(f"{self.address_string()} {format % args}", flush=True)
+
+def serve(port, save_flag, context_cache=False, cache_path=None, backend="torch"):
+    """
+    Load the model once and answer questions over HTTP
+    """
+    nlp = load_model(context_cache, cache_path, backend)
+    # answer once before the health check passes, so that no request waits for it
+    with startup_phase("first_inference_sec"):
+        nlp({"question": "What is served?", "context": "The model is served."})
+    table = get_table() if save_flag else None
+    server = ThreadingHTTPServer(("", port), QaHandler)
+    server.nlp, server.table = nlp, table
+    # the snapshot in MODEL_DIR or the model name on the hub
+    server.model = startup["model"]
+    # the pipeline is not thread safe: one inference at a time
+    server.lock = threading.Lock()
+    report_startup(mode="serve", backend=backend)
+    print(f"Serving {startup['model']} on port {port}", flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        save_cache(nlp)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("context", type=str)
-    parser.add_argument("question", type=str)
-    parser.add_argument("item_id", type=str)
+    parser.add_argument("context", type=str, nargs="?")
+    parser.add_argument("question", type=str, nargs="?")
+    parser.add_argument("item_id", type=str, nargs="?")
     parser.add_argument("--no_save", action="store_true")
+    parser.add_argument("--serve", action="store_true",
+                        help="Keep the model loaded and answer questions over HTTP")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--batch", type=str, default=None,
+                        help="Answer all the questions in this JSON/JSONL file or s3://bucket/key")
+    parser.add_argument("--batch_size", type=int, nargs="+", default=[8],
+                        help="Batch size; with several sizes each is timed in turn")
+    parser.add_argument("--context_cache", action="store_true",
+                        help="Tokenize each distinct context only once")
+    parser.add_argument("--cache_path", type=str, default=None,
+                        help="Load and save the context cache in this file (implies --context_cache)")
+    parser.add_argument("--backend", type=str, choices=BACKENDS,
+                        default=os.environ.get("QA_BACKEND", "torch"),
+                        help="int8: dynamically quantized model, onnx: ONNX graph run by onnxruntime")
     args = parser.parse_args()
-    main(args.context, args.question, args.item_id, not(args.no_save))
+    if args.serve:
+        serve(args.port, not(args.no_save), args.context_cache, args.cache_path, args.backend)
+    elif args.batch:
+        main_batch(args.batch, args.batch_size, not(args.no_save), args.context_cache, args.cache_path,
+                   args.backend)
+    elif None in (args.context, args.question, args.item_id):
+        parser.error("context, question and item_id are required unless --serve or --batch is given")
+    else:
+        main(args.context, args.question, args.item_id, not(args.no_save),
+             args.context_cache, args.cache_path, args.backend)
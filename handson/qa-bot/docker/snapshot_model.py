@@ -0,0 +1,82 @@
+"""
+Snapshot of the QA model, made once (e.g. when the image is built) so that
+tasks load it from disk instead of downloading it from the hub at startup.
+
+    python snapshot_model.py /workspace/model --int8 --onnx
+    python snapshot_model.py s3://bucket/qabot/model --int8 --onnx
+
+main.py loads the snapshot given by the MODEL_DIR environment variable;
+an S3 snapshot is downloaded once into a local cache directory.
+"""
+import argparse, os, tempfile
+
+MODEL_NAME = 'distilbert-base-cased-distilled-squad'
+CACHE_DIR = os.path.expanduser("~/.cache/qabot")
+# written last, so that an interrupted download is not taken for a snapshot
+COMPLETE = ".complete"
+
+def split_s3_url(url):
+    bucket, _, prefix = url[len("s3://"):].partition("/")
+    return bucket, prefix.strip("/")
+
+def save_snapshot(dest, model_name=MODEL_NAME, onnx=False, int8=False):
+    """
+    Save the weights, config and tokenizer (and the int8 model and the ONNX
+    graph) in the local directory 'dest'
+    """
+    from transformers import pipeline
+    from backends import BACKEND_FILES, save_backend
+    nlp = pipeline('question-answering', model=model_name)
+    nlp.model.save_pretrained(dest)
+    nlp.tokenizer.save_pretrained(dest)
+    for backend, wanted in [("int8", int8), ("onnx", onnx)]:
+        if wanted:
+            save_backend(nlp.model, nlp.tokenizer, backend, os.path.join(dest, BACKEND_FILES[backend]))
+    open(os.path.join(dest, COMPLETE), "w").close()
+
+def upload_snapshot(local_dir, url):
+    import boto3
+    bucket, prefix = split_s3_url(url)
+    s3 = boto3.client("s3")
+    names = sorted(os.listdir(local_dir), key=lambda name: name == COMPLETE)
+    for name in names:
+        s3.upload_file(os.path.join(local_dir, name), bucket, f"{prefix}/{name}")
+        print(f"Uploaded s3://{bucket}/{prefix}/{name}")
+
+def fetch_snapshot(url, cache_dir=CACHE_DIR):
+    """
+    Local directory of the snapshot at 'url', downloaded unless it is in the cache already
+    """
+    bucket, prefix = split_s3_url(url)
+    local_dir = os.path.join(cache_dir, bucket, prefix)
+    if os.path.exists(os.path.join(local_dir, COMPLETE)):
+        return local_dir
+
+    import boto3
+    s3 = boto3.client("s3")
+    os.makedirs(local_dir, exist_ok=True)
+    keys = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=f"{prefix}/"):
+        keys.extend(obj["Key"] for obj in page.get("Contents", []))
+    if not any(key.endswith(f"/{COMPLETE}") for key in keys):
+        raise FileNotFoundError(f"No complete model snapshot at {url}")
+    for key in sorted(keys, key=lambda key: key.endswith(f"/{COMPLETE}")):
+        s3.download_file(bucket, key, os.path.join(local_dir, key[len(prefix) + 1:]))
+    return local_dir
+
+if __name__ == "__main__":
+    # parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dest", type=str, help="Local directory or s3://bucket/prefix")
+    parser.add_argument("--model", type=str, default=MODEL_NAME)
+    parser.add_argument("--onnx", action="store_true", help="Also export the ONNX graph")
+    parser.add_argument("--int8", action="store_true", help="Also save the int8 model")
+    args = parser.parse_args()
+
+    if args.dest.startswith("s3://"):
+        with tempfile.TemporaryDirectory() as tmp:
+            save_snapshot(tmp, args.model, args.onnx, args.int8)
+            upload_snapshot(tmp, args.dest)
+    else:
+        save_snapshot(args.dest, args.model, args.onnx, args.int8)
+        print(f"Saved {args.model} in {args.dest}")
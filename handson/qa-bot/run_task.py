@@ -3,6 +3,7 @@ import argparse
 import time
 import uuid
 import json
+import urllib.request
 import boto3
 from colorama import init, Fore, Back, Style
 init(autoreset=True)
@@ -24,6 +25,15 @@ class Params:
         self.CONTAINER_NAME = self._get_parameter(ssm_client, "CONTAINER_NAME")
         self.ECS_TASK_VPC_SUBNET_1 = self._get_parameter(ssm_client, "ECS_TASK_VPC_SUBNET_1")
         self.TABLE_NAME = self._get_parameter(ssm_client, "TABLE_NAME")
+        self._bucket_name = None
+
+    @property
+    def BUCKET_NAME(self):
+        # read only when needed (--batch): stacks deployed before the bucket
+        # was added do not have this parameter
+        if self._bucket_name is None:
+            self._bucket_name = self._get_parameter(boto3.client("ssm"), "BUCKET_NAME")
+        return self._bucket_name
 
     def _get_parameter(self, client, param_name):
         """パラメータを取得する際にプレフィックスを追加"""
@@ -144,6 +154,114 @@ def ask_many():
         )
     print() # new line
 
+def ask_many_batch(batch_size):
+    """
+    Ask all the questions in "problems.json" with a single task, which
+    loads the model once and answers them in batches
+    """
+    P = Params()
+
+    with open("problems.json", "r") as f:
+        problems = json.load(f)
+    lines = []
+    for prob in problems:
+        item = {"context": prob["context"], "question": prob["question"]}
+        item["item_id"] = str(uuid.uuid4()) # ID of the dynamoDB entry
+        lines.append(json.dumps(item))
+
+    key = f"batches/{uuid.uuid4()}.jsonl"
+    s3 = boto3.client("s3")
+    s3.put_object(Bucket=P.BUCKET_NAME, Key=key, Body="\n".join(lines).encode("utf-8"))
+
+    print("Submitting task...")
+    client = boto3.client("ecs")
+    resp = client.run_task(
+        cluster=P.ECS_CLUSTER_NAME,
+        taskDefinition=P.ECS_TASK_DEFINITION_ARN,
+        count=1,
+        launchType="FARGATE",
+        networkConfiguration={
+            'awsvpcConfiguration': {
+                'subnets': [P.ECS_TASK_VPC_SUBNET_1],
+                'assignPublicIp': 'ENABLED'
+            }
+        },
+        overrides={
+            'containerOverrides': [
+                {
+                    'name': P.CONTAINER_NAME,
+                    'command': [
+                        "--batch", f"s3://{P.BUCKET_NAME}/{key}",
+                        "--batch_size", str(batch_size)
+                    ],
+                }
+            ]
+        }
+    )
+    print("Task ARN:", resp["tasks"][0]["taskArn"])
+    print(f"{len(problems)} questions submitted; check them with 'list_answers' when the task has stopped")
+
+def get_server_url(url=None):
+    """
+    URL of the QA server deployed with "-c serve=true", unless given
+    """
+    if url:
+        return url.rstrip("/")
+    student_id = os.getenv('STUDENT_ID')
+    if not student_id:
+        raise ValueError("STUDENT_ID environment variable is not set. Please set it with 'export STUDENT_ID=223'")
+    ssm_client = boto3.client("ssm")
+    return ssm_client.get_parameter(
+        Name=f"/qabot/{student_id}/SERVER_URL"
+    )["Parameter"]["Value"].rstrip("/")
+
+def post_question(url, context, question, item_id=None, timeout=60):
+    """
+    Send one question to the QA server and return its answer and the elapsed seconds
+    """
+    body = {"context": context, "question": question}
+    if item_id:
+        body["item_id"] = item_id
+    req = urllib.request.Request(
+        f"{url}/ask",
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    start = time.time()
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        answer = json.load(resp)
+    return answer, time.time() - start
+
+def ask_server(context, question, url=None):
+    """
+    Ask a single question to the long-running QA server. The answer comes
+    back in the response, so no task has to start and the model is already loaded.
+    """
+    url = get_server_url(url)
+    item_id = str(uuid.uuid4()) # ID of the dynamoDB entry
+    answer, elapsed = post_question(url, context, question, item_id)
+    print(Back.GREEN + "Context:", context)
+    print(Back.BLUE + "Question:", question)
+    print(Back.MAGENTA + "Answer:", answer["answer"])
+    print(Back.YELLOW + "Score:", answer["score"])
+    print(f"({elapsed:.2f} sec)")
+
+def ask_many_server(url=None):
+    """
+    Ask the questions in "problems.json" to the long-running QA server
+    """
+    url = get_server_url(url)
+    with open("problems.json", "r") as f:
+        problems = json.load(f)
+
+    start = time.time()
+    for prob in problems:
+        item_id = str(uuid.uuid4()) # ID of the dynamoDB entry
+        answer, elapsed = post_question(url, prob["context"], prob["question"], item_id)
+        print(Back.BLUE + "Question:", prob["question"])
+        print(Back.MAGENTA + "Answer:", answer["answer"], f"({elapsed:.2f} sec)")
+    print(f"Answered {len(problems)} questions in {time.time() - start:.1f} sec")
+
 def list_answers(limit):
     """
     List the answers to the questions that have been submitted previously
@@ -190,6 +308,19 @@ if __name__ == "__main__":
     ask_p.add_argument("question", type=str)
 
     ask_many_p = subparsers.add_parser("ask_many")
+    ask_many_p.add_argument("--server", action="store_true",
+                            help="Send the questions to the QA server instead of starting tasks")
+    ask_many_p.add_argument("--batch", action="store_true",
+                            help="Answer all the questions with a single task")
+    ask_many_p.add_argument("--batch_size", type=int, default=8)
+    ask_many_p.add_argument("--url", type=str, default=None,
+                            help="URL of the QA server (default: SERVER_URL in SSM)")
+
+    ask_server_p = subparsers.add_parser("ask_server")
+    ask_server_p.add_argument("context", type=str)
+    ask_server_p.add_argument("question", type=str)
+    ask_server_p.add_argument("--url", type=str, default=None,
+                              help="URL of the QA server (default: SERVER_URL in SSM)")
 
     list_p = subparsers.add_parser("list_answers")
     list_p.add_argument("--limit", type=int, default=50)
@@ -201,7 +332,14 @@ if __name__ == "__main__":
     if args.command == "ask":
         ask(args.context, args.question)
     elif args.command == "ask_many":
-        ask_many()
+        if args.server:
+            ask_many_server(args.url)
+        elif args.batch:
+            ask_many_batch(args.batch_size)
+        else:
+            ask_many()
+    elif args.command == "ask_server":
+        ask_server(args.context, args.question, args.url)
     elif args.command == "list_answers":
         list_answers(args.limit)
     elif args.command == "clear":
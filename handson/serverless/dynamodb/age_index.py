@@ -0,0 +1,62 @@
+"""
+Query of items by age through the 'age_bucket-age-index' global secondary index.
+
+The index has 'age' as sort key, so a KeyConditionExpression on it reads only
+the matching items. Its partition key 'age_bucket' spreads the items over
+AGE_BUCKETS partitions (all items in one partition would be limited to the
+throughput of a single partition); a query therefore runs once per bucket,
+and the buckets are queried in parallel.
+"""
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from boto3.dynamodb.conditions import Key
+from parallel_scan import default_table_factory
+
+AGE_INDEX = "age_bucket-age-index"
+AGE_BUCKETS = 10
+
+def age_bucket(item_id):
+    """
+    Bucket of an item, derived from its ID so that writes spread evenly
+    """
+    return str(zlib.crc32(str(item_id).encode("utf-8")) % AGE_BUCKETS)
+
+def with_age_bucket(item):
+    """
+    Add the 'age_bucket' attribute to an item which has an 'age'
+    """
+    if "age" in item and "age_bucket" not in item:
+        item = dict(item, age_bucket=age_bucket(item["item_id"]))
+    return item
+
+def query_bucket(table, bucket, key_condition, on_response=None, **query_kwargs):
+    """
+    All items of one bucket matching 'key_condition', following pagination
+    """
+    kwargs = dict(
+        query_kwargs,
+        IndexName=AGE_INDEX,
+        KeyConditionExpression=Key("age_bucket").eq(bucket) & key_condition,
+    )
+    items = []
+    while True:
+        response = table.query(**kwargs)
+        if on_response:
+            on_response(response)
+        items += response["Items"]
+        if "LastEvaluatedKey" not in response:
+            return items
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+def query_under_age(table_name, age, table_factory=None, on_response=None, **query_kwargs):
+    """
+    Generator of the items whose 'age' is less than 'age', querying all buckets in parallel
+    """
+    make_table = table_factory or default_table_factory(table_name)
+
+    def run(bucket):
+        return query_bucket(make_table(), bucket, Key("age").lt(age), on_response, **query_kwargs)
+
+    with ThreadPoolExecutor(AGE_BUCKETS) as executor:
+        for items in executor.map(run, [str(b) for b in range(AGE_BUCKETS)]):
+            yield from items
@@ -19,6 +19,19 @@ class SimpleDynamoDb(core.Stack):
             billing_mode=ddb.BillingMode.PAY_PER_REQUEST,
             removal_policy=core.RemovalPolicy.DESTROY
         )
+
+        # index to query items by age; see age_index.py
+        table.add_global_secondary_index(
+            index_name="age_bucket-age-index",
+            partition_key=ddb.Attribute(
+                name="age_bucket",
+                type=ddb.AttributeType.STRING
+            ),
+            sort_key=ddb.Attribute(
+                name="age",
+                type=ddb.AttributeType.NUMBER
+            ),
+        )
         core.CfnOutput(self, "TableName", value=table.table_name)
 
 app = core.App()
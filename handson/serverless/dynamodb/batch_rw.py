@@ -2,51 +2,68 @@ import boto3
 from boto3.dynamodb.conditions import Key, Attr
 import argparse, random
 from uuid import uuid4
+from parallel_scan import parallel_scan
+from bulk_load import bulk_load, read_items
+from age_index import with_age_bucket, query_under_age
 
 import boto3
 ddb = boto3.resource('dynamodb')
 
-def batch_write(table_name, num):
-    table = ddb.Table(table_name)
-    with table.batch_writer() as batch:
-        for i in range(num):
-            batch.put_item(
-                Item={
-                    'item_id': str(uuid4()),
-                    'first_name': 'John',
-                    'last_name': 'Doe',
-                    'age': random.randint(1,50),
-                }
-            )
-    print(f"Finished writing {num} items to the table")
+def generate_items(num):
+    for i in range(num):
+        yield {
+            'item_id': str(uuid4()),
+            'first_name': 'John',
+            'last_name': 'Doe',
+            'age': random.randint(1,50),
+        }
+
+def batch_write(table_name, num, path=None, workers=8, wcu=None):
+    """
+    Write 'num' generated items, or the items of a JSONL/CSV file if 'path' is given
+    """
+    items = read_items(path) if path else generate_items(num)
+    items = (with_age_bucket(item) for item in items)
+    count = bulk_load(table_name, items, workers, wcu)
+    print(f"Finished writing {count} items to the table")
+
+def add_age_bucket(table_name, segments=8, workers=8):
+    """
+    Add 'age_bucket' to the items written before the age index existed
+    """
+    items = parallel_scan(
+        table_name, segments,
+        FilterExpression=Attr('age').exists() & Attr('age_bucket').not_exists()
+    )
+    count = bulk_load(table_name, (with_age_bucket(item) for item in items), workers)
+    print(f"Added age_bucket to {count} items")
 
-def clear_database(table_name):
+def clear_database(table_name, segments=8):
     table = ddb.Table(table_name)
-    scan = None
+    items = parallel_scan(table_name, segments, ProjectionExpression='item_id')
 
     with table.batch_writer() as batch:
         count = 0
-        while scan is None or 'LastEvaluatedKey' in scan:
-            if scan is not None and 'LastEvaluatedKey' in scan:
-                scan = table.scan(
-                    ExclusiveStartKey=scan['LastEvaluatedKey'],
-                )
-            else:
-                scan = table.scan()
-
-            for item in scan['Items']:
-                if count % 5000 == 0:
-                    print(count)
-                batch.delete_item(Key={'item_id': item['item_id']})
-                count = count + 1
+        for item in items:
+            if count % 5000 == 0:
+                print(count)
+            batch.delete_item(Key={'item_id': item['item_id']})
+            count = count + 1
     print("Deleted all elements in the database.")
 
-def search_under_age(table_name, age):
-    table = ddb.Table(table_name)
-    response = table.scan(
-        FilterExpression=Attr('age').lt(age)
-    )
-    print(response.get("Items"))
+def search_under_age(table_name, age, segments=8, scan=False):
+    if scan:
+        items = parallel_scan(
+            table_name, segments,
+            FilterExpression=Attr('age').lt(age)
+        )
+    else:
+        items = query_under_age(table_name, age)
+    count = 0
+    for item in items:
+        print(item)
+        count = count + 1
+    print(f"Found {count} items")
 
 if __name__ == "__main__":
     # parse arguments
@@ -55,18 +72,29 @@ if __name__ == "__main__":
     subparsers = parser.add_subparsers(dest="command")
 
     sp1 = subparsers.add_parser("write")
-    sp1.add_argument("num", type=int)
+    sp1.add_argument("num", type=int, nargs="?", default=1000, help="Number of items to generate")
+    sp1.add_argument("--file", type=str, help="Load the items of this JSONL or CSV file instead")
+    sp1.add_argument("--workers", type=int, default=8, help="Number of writer threads")
+    sp1.add_argument("--wcu", type=float, default=None, help="Target write capacity units per second")
 
     sp2 = subparsers.add_parser("clear")
+    sp2.add_argument("--segments", type=int, default=8, help="Number of parallel scan segments")
 
     sp3 = subparsers.add_parser("search_under_age")
     sp3.add_argument("age", type=int)
+    sp3.add_argument("--scan", action="store_true", help="Scan the table instead of querying the age index")
+    sp3.add_argument("--segments", type=int, default=8, help="Number of parallel scan segments")
+
+    sp4 = subparsers.add_parser("add_age_bucket", help="Add age_bucket to existing items")
+    sp4.add_argument("--segments", type=int, default=8, help="Number of parallel scan segments")
 
     args = parser.parse_args()
 
     if args.command == "write":
-        batch_write(args.table_name, args.num)
+        batch_write(args.table_name, args.num, args.file, args.workers, args.wcu)
     elif args.command == "clear":
-        clear_database(args.table_name)
+        clear_database(args.table_name, args.segments)
     elif args.command == "search_under_age":
-        search_under_age(args.table_name, args.age)
+        search_under_age(args.table_name, args.age, args.segments, args.scan)
+    elif args.command == "add_age_bucket":
+        add_age_bucket(args.table_name, args.segments)
@@ -0,0 +1,56 @@
+"""
+Compare the read capacity consumed by search_under_age with a scan and with
+a query of the age index.
+
+A scan reads (and bills) every item of the table whatever the filter, while
+the query reads only the items it returns. Run it against a table filled
+with 'batch_rw.py write' (or DynamoDB Local with --endpoint_url).
+"""
+import argparse, threading, time
+from boto3.dynamodb.conditions import Attr
+from parallel_scan import parallel_scan, default_table_factory
+from age_index import query_under_age
+
+class CapacityCounter:
+    """
+    Sum of the ConsumedCapacity of responses, from any thread
+    """
+    def __init__(self):
+        self.units = 0.0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, response):
+        with self._lock:
+            self.units += response.get("ConsumedCapacity", {}).get("CapacityUnits", 0)
+            self.requests += 1
+
+def measure(name, run):
+    counter = CapacityCounter()
+    start = time.perf_counter()
+    count = sum(1 for _ in run(counter))
+    elapsed = time.perf_counter() - start
+    print(f"{name:6s} {count:8d} {counter.units:10.1f} {counter.requests:9d} {elapsed:8.2f}")
+    return counter.units
+
+if __name__ == "__main__":
+    # parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("table_name", type=str)
+    parser.add_argument("age", type=int)
+    parser.add_argument("--segments", type=int, default=8)
+    parser.add_argument("--endpoint_url", type=str, help="e.g. http://localhost:8000 for DynamoDB Local")
+    args = parser.parse_args()
+
+    table_factory = default_table_factory(args.table_name, args.endpoint_url)
+    print("method    items        RCU  requests  time[s]")
+    scan_units = measure("scan", lambda counter: parallel_scan(
+        args.table_name, args.segments, table_factory=table_factory, on_response=counter,
+        FilterExpression=Attr("age").lt(args.age), ReturnConsumedCapacity="TOTAL",
+    ))
+    query_units = measure("query", lambda counter: query_under_age(
+        args.table_name, args.age, table_factory=table_factory, on_response=counter,
+        ReturnConsumedCapacity="TOTAL",
+    ))
+    if query_units:
+        print(f"\nRead capacity of the scan / the query: {scan_units / query_units:.1f}")
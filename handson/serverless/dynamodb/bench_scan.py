@@ -0,0 +1,98 @@
+"""
+Benchmark of parallel_scan() against the number of segments.
+
+By default the scan runs against an in-memory stand-in of a DynamoDB table
+which adds a fixed latency to every page, so that the effect of parallelism
+can be seen without AWS. Give --table_name (and --endpoint_url for DynamoDB
+Local) to scan a real table instead.
+"""
+import argparse, threading, time, zlib
+from uuid import uuid4
+from botocore.exceptions import ClientError
+from parallel_scan import parallel_scan, default_table_factory, AdaptiveThrottle
+
+class StandInTable:
+    """
+    Table-like object answering Scan from a list of items.
+    Each page holds 'page_size' items (a 1 MB page of DynamoDB) and takes
+    'latency' seconds. With 'capacity', pages beyond that many per second
+    are rejected with ProvisionedThroughputExceededException.
+    """
+    def __init__(self, num, latency=0.02, page_size=1000, capacity=None):
+        self.items = [
+            {"item_id": str(uuid4()), "first_name": "John", "last_name": "Doe", "age": i % 50 + 1}
+            for i in range(num)
+        ]
+        self._hashes = [zlib.crc32(i["item_id"].encode("utf-8")) for i in self.items]
+        self.latency = latency
+        self.page_size = page_size
+        self.capacity = capacity
+        self._segments = {}
+        self._lock = threading.Lock()
+        self._window = (0, 0) # (second, pages served in that second)
+
+    def _consume(self):
+        if self.capacity is None:
+            return
+        with self._lock:
+            second, pages = self._window
+            now = int(time.monotonic())
+            if now != second:
+                second, pages = now, 0
+            if pages >= self.capacity:
+                raise ClientError(
+                    {"Error": {"Code": "ProvisionedThroughputExceededException", "Message": ""}},
+                    "Scan"
+                )
+            self._window = (second, pages + 1)
+
+    def _segment(self, segment, total_segments):
+        with self._lock:
+            key = (segment, total_segments)
+            if key not in self._segments:
+                self._segments[key] = [
+                    i for i, h in zip(self.items, self._hashes) if h % total_segments == segment
+                ]
+            return self._segments[key]
+
+    def scan(self, Segment=0, TotalSegments=1, ExclusiveStartKey=None, **kwargs):
+        self._consume()
+        time.sleep(self.latency)
+        items = self._segment(Segment, TotalSegments)
+        start = ExclusiveStartKey["position"] if ExclusiveStartKey else 0
+        response = {"Items": items[start:start + self.page_size]}
+        if start + self.page_size < len(items):
+            response["LastEvaluatedKey"] = {"position": start + self.page_size}
+        return response
+
+def bench(table_name, table_factory, segments_list):
+    base = None
+    print("segments   items    time[s]   items/s   speedup  throttled")
+    for segments in segments_list:
+        throttle = AdaptiveThrottle()
+        start = time.perf_counter()
+        count = sum(1 for _ in parallel_scan(table_name, segments, table_factory=table_factory,
+                                             throttle=throttle))
+        elapsed = time.perf_counter() - start
+        base = base or elapsed
+        print(f"{segments:8d} {count:7d} {elapsed:10.2f} {count / elapsed:9.0f} "
+              f"{base / elapsed:8.1f}x {throttle.throttled:10d}")
+
+if __name__ == "__main__":
+    # parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segments", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--table_name", type=str, help="Scan this table instead of the stand-in")
+    parser.add_argument("--endpoint_url", type=str, help="e.g. http://localhost:8000 for DynamoDB Local")
+    parser.add_argument("--num", type=int, default=200000, help="Items in the stand-in table")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds per page of the stand-in")
+    parser.add_argument("--capacity", type=int, default=None,
+                        help="Pages per second the stand-in serves before throttling")
+    args = parser.parse_args()
+
+    if args.table_name:
+        table_factory = default_table_factory(args.table_name, args.endpoint_url)
+    else:
+        table = StandInTable(args.num, args.latency, capacity=args.capacity)
+        table_factory = lambda: table
+    bench(args.table_name, table_factory, args.segments)
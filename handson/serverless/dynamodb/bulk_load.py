@@ -0,0 +1,193 @@
+"""
+Multi-threaded bulk loader for a DynamoDB table.
+
+Items are read (or generated) on the main thread and handed out in chunks to
+worker threads, each of which writes through its own batch_writer(), so that
+many BatchWriteItem requests are in flight at the same time. The write rate
+can be capped with a token bucket counting write capacity units (WCU).
+"""
+import csv, json, math, queue, threading, time
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+
+# items handed to a worker at a time
+CHUNK_SIZE = 25
+
+# string keys of the table and its index, kept as they are in CSV files
+STRING_COLUMNS = ["item_id", "age_bucket"]
+
+class TokenBucket:
+    """
+    Rate limiter shared by all workers: 'rate' tokens are added every second,
+    up to 'rate' tokens in stock (or as many as one acquire() asks for)
+    """
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                # an item costing more WCU than 'rate' would otherwise never fit
+                self.tokens = min(max(self.rate, tokens), self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+def write_units(item):
+    """
+    WCU consumed by putting the item: one per started KB. The size is estimated
+    from the JSON encoding, which is close to DynamoDB's own accounting.
+    """
+    size = len(json.dumps(item, default=str).encode("utf-8"))
+    return max(1, math.ceil(size / 1024))
+
+def read_jsonl(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                # floats are not accepted by boto3
+                yield json.loads(line, parse_float=Decimal)
+
+def _number_or_str(value):
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+def read_csv(path):
+    """
+    Rows of a CSV file with a header line. Integer columns are stored as
+    numbers, except for the STRING_COLUMNS.
+    """
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            yield {k: v if k in STRING_COLUMNS else _number_or_str(v) for k, v in row.items()}
+
+def read_items(path):
+    if path.endswith(".csv"):
+        return read_csv(path)
+    return read_jsonl(path)
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+class Progress:
+    """
+    Count written items and print the throughput every 'interval' seconds
+    """
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.count = 0
+        self.start = time.monotonic()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._report, daemon=True)
+
+    def add(self, n):
+        with self._lock:
+            self.count += n
+
+    def _report(self):
+        last_count, last_time = 0, self.start
+        while not self._stop.wait(self.interval):
+            now, count = time.monotonic(), self.count
+            print(f"{count} items, {(count - last_count) / (now - last_time):.0f} items/s", flush=True)
+            last_count, last_time = count, now
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+def _worker(table_name, chunks, finished, bucket, progress, endpoint_url):
+    """
+    Write chunks from the queue until it is empty and 'finished' is set
+    """
+    # boto3 resources are not thread safe, so every worker gets its own session
+    table = boto3.session.Session().resource("dynamodb", endpoint_url=endpoint_url).Table(table_name)
+    with table.batch_writer() as batch:
+        while True:
+            # read before get(): once set, no chunk is put after an empty get()
+            done = finished.is_set()
+            try:
+                chunk = chunks.get(timeout=0.1)
+            except queue.Empty:
+                if done:
+                    return
+                continue
+            for item in chunk:
+                if bucket:
+                    bucket.acquire(write_units(item))
+                batch.put_item(Item=item)
+            progress.add(len(chunk))
+
+def _hand_out(chunks, chunk, futures):
+    """
+    Put a chunk in the queue. Returns False if a worker has failed, since
+    workers only finish early on errors and the queue may never drain.
+    """
+    while True:
+        try:
+            chunks.put(chunk, timeout=1.0)
+            return True
+        except queue.Full:
+            if any(future.done() for future in futures):
+                return False
+
+def bulk_load(table_name, items, workers=8, wcu_per_sec=None, endpoint_url=None):
+    """
+    Put all 'items' into the table with 'workers' threads.
+
+    Parameters
+    ----------
+    items: iterable of dict
+    wcu_per_sec: float
+        Target write capacity units per second across all workers (unlimited if None)
+
+    Returns the number of items written
+    """
+    bucket = TokenBucket(wcu_per_sec) if wcu_per_sec else None
+    # bounded, so that a large file is not read into memory ahead of the writers
+    chunks = queue.Queue(maxsize=workers * 4)
+    # set once no more chunks will be put, so that the workers stop when the
+    # queue is empty, whether or not another worker has failed
+    finished = threading.Event()
+    with Progress() as progress, ThreadPoolExecutor(workers) as executor:
+        futures = [
+            executor.submit(_worker, table_name, chunks, finished, bucket, progress, endpoint_url)
+            for _ in range(workers)
+        ]
+        try:
+            for chunk in _chunks(items, CHUNK_SIZE):
+                if not _hand_out(chunks, chunk, futures):
+                    break
+        finally:
+            finished.set()
+        # raise the error of a failed worker, if any
+        for future in futures:
+            future.result()
+    print(f"Wrote {progress.count} items in {progress.elapsed:.1f} sec "
+          f"({progress.count / progress.elapsed:.0f} items/s)")
+    return progress.count
@@ -0,0 +1,158 @@
+"""
+Parallel scan of a DynamoDB table.
+
+The table is split into 'total_segments' segments (the Segment and
+TotalSegments parameters of Scan) and every segment is paged through by a
+worker thread. Items are streamed to the caller through a bounded queue, so
+memory use does not grow with the table size.
+
+When DynamoDB answers with ProvisionedThroughputExceededException, all
+workers slow down together (the delay between requests is doubled) and speed
+up again little by little as requests succeed.
+"""
+import queue, random, threading, time
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+from botocore.exceptions import ClientError
+
+THROTTLING_ERRORS = [
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+]
+
+class AdaptiveThrottle:
+    """
+    Delay shared by all workers: doubled on throttling, decreased on success
+    """
+    def __init__(self, initial_delay=0.05, max_delay=5.0, decrease=0.8):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.decrease = decrease
+        self.delay = 0.0
+        self.throttled = 0
+        self._increased_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        delay = self.delay
+        if delay > 0:
+            # jitter keeps the workers from retrying at the same moment
+            time.sleep(random.uniform(0.5, 1.0) * delay)
+
+    def on_throttled(self):
+        with self._lock:
+            self.throttled += 1
+            # workers throttled by the same burst slow down only once
+            now = time.monotonic()
+            if now - self._increased_at >= self.delay:
+                self.delay = min(self.max_delay, max(self.initial_delay, self.delay * 2))
+                self._increased_at = now
+
+    def on_success(self):
+        with self._lock:
+            self.delay = self.delay * self.decrease if self.delay > 0.001 else 0.0
+
+def default_table_factory(table_name, endpoint_url=None):
+    """
+    boto3 resources are not thread safe, so every worker gets its own session
+    """
+    def factory():
+        session = boto3.session.Session()
+        return session.resource("dynamodb", endpoint_url=endpoint_url).Table(table_name)
+    return factory
+
+_DONE = object()
+
+def _put(out, item, closed):
+    """
+    Put an item in the queue unless the consumer has gone away
+    """
+    while not closed.is_set():
+        try:
+            out.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+def _scan_segment(make_table, segment, total_segments, scan_kwargs, throttle, out, stop, closed,
+                  on_response):
+    table = make_table()
+    kwargs = dict(scan_kwargs, Segment=segment, TotalSegments=total_segments)
+    while not stop.is_set():
+        throttle.wait()
+        try:
+            response = table.scan(**kwargs)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in THROTTLING_ERRORS:
+                throttle.on_throttled()
+                continue
+            raise
+        throttle.on_success()
+        if on_response:
+            on_response(response)
+        # pages rather than items go through the queue to keep locking cheap
+        if response["Items"]:
+            _put(out, response["Items"], closed)
+        if "LastEvaluatedKey" not in response:
+            return
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+def parallel_scan(table_name, total_segments=8, max_workers=None, table_factory=None,
+                  throttle=None, buffer_size=64, on_response=None, **scan_kwargs):
+    """
+    Generator of all items of the table, scanned in parallel.
+
+    Parameters
+    ----------
+    table_name: str
+    total_segments: int
+        Number of segments the table is split into
+    max_workers: int
+        Number of threads (default: total_segments)
+    table_factory: callable
+        Returns a new Table-like object for each worker (default: boto3)
+    throttle: AdaptiveThrottle
+        Pass one to read its 'throttled' count afterwards
+    buffer_size: int
+        Maximum number of pages waiting to be consumed
+    on_response: callable
+        Called with every Scan response, from the worker threads
+    scan_kwargs:
+        Passed to every Scan call, e.g. FilterExpression, ProjectionExpression
+    """
+    make_table = table_factory or default_table_factory(table_name)
+    throttle = throttle or AdaptiveThrottle()
+    out = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event() # set when a worker fails or the consumer stops
+    closed = threading.Event() # set when the consumer stops
+    errors = []
+
+    def run(segment):
+        try:
+            _scan_segment(make_table, segment, total_segments, scan_kwargs,
+                          throttle, out, stop, closed, on_response)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(out, _DONE, closed)
+
+    executor = ThreadPoolExecutor(max_workers or total_segments)
+    for segment in range(total_segments):
+        executor.submit(run, segment)
+    try:
+        remaining = total_segments
+        while remaining:
+            page = out.get()
+            if page is _DONE:
+                remaining -= 1
+            elif not stop.is_set():
+                yield from page
+        if errors:
+            raise errors[0]
+    finally:
+        # the consumer may stop early; let the workers exit
+        stop.set()
+        closed.set()
+        executor.shutdown(wait=False)
@@ -1,17 +1,136 @@
 import boto3
-import argparse
+from boto3.dynamodb.types import Binary
+import argparse, csv, json, sys
+from decimal import Decimal
 
 ddb = boto3.resource('dynamodb')
 
-def scan_table(table_name):
+# rows written to a Parquet file at a time
+PARQUET_ROW_GROUP = 10000
+
+def scan_items(table_name, projection=None):
+    """
+    Generator of all items of the table. Pages are read one at a time as the
+    items are consumed, so memory use does not depend on the table size.
+
+    Parameters
+    ----------
+    projection: list of str
+        Attributes to read. Other attributes are not transferred at all.
+    """
     table = ddb.Table(table_name)
-    items = table.scan().get("Items")
-    print(items)
+    kwargs = {}
+    if projection:
+        # placeholders avoid clashes with reserved words such as "name"
+        kwargs["ProjectionExpression"] = ", ".join(f"#p{i}" for i in range(len(projection)))
+        kwargs["ExpressionAttributeNames"] = {f"#p{i}": name for i, name in enumerate(projection)}
+    while True:
+        response = table.scan(**kwargs)
+        yield from response["Items"]
+        if "LastEvaluatedKey" not in response:
+            return
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+def to_plain(value):
+    """
+    Convert the values returned by boto3 (Decimal, set, ...) into JSON-friendly ones
+    """
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(to_plain(v) for v in value)
+    if isinstance(value, list):
+        return [to_plain(v) for v in value]
+    if isinstance(value, dict):
+        return {k: to_plain(v) for k, v in value.items()}
+    if isinstance(value, Binary):
+        return value.value.hex()
+    return value
+
+def write_jsonl(items, out):
+    for item in items:
+        out.write(json.dumps(to_plain(item), ensure_ascii=False) + "\n")
+
+def write_csv(items, out, columns=None):
+    """
+    Columns are 'columns' if given, otherwise the attributes of the first item;
+    since the items are streamed, attributes found only in later items are
+    dropped, with a warning listing them. Nested values are written as JSON.
+    """
+    writer = None
+    dropped = set()
+    for item in items:
+        if writer is None:
+            writer = csv.DictWriter(out, columns or list(item), extrasaction="ignore")
+            writer.writeheader()
+            fieldnames = set(writer.fieldnames)
+        row = to_plain(item)
+        dropped.update(row.keys() - fieldnames)
+        writer.writerow({
+            k: json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else v
+            for k, v in row.items()
+        })
+    if dropped:
+        print(f"Warning: attributes not in the CSV columns were dropped: {', '.join(sorted(dropped))} "
+              "(list the columns with --projection)", file=sys.stderr)
+
+def write_parquet(items, out):
+    """
+    Rows are written in row groups of PARQUET_ROW_GROUP items.
+    The schema is taken from the first row group.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        sys.exit("Parquet output requires pyarrow: pip install pyarrow")
+
+    writer = None
+    rows = []
+
+    def flush():
+        nonlocal writer
+        batch = pa.Table.from_pylist(rows, schema=writer.schema if writer else None)
+        if writer is None:
+            writer = pq.ParquetWriter(out, batch.schema)
+        writer.write_table(batch)
+        rows.clear()
+
+    for item in items:
+        rows.append(to_plain(item))
+        if len(rows) == PARQUET_ROW_GROUP:
+            flush()
+    if rows or writer is None:
+        flush()
+    writer.close()
+
+def scan_table(table_name, output=None, fmt="jsonl", projection=None):
+    items = scan_items(table_name, projection)
+    binary = fmt == "parquet"
+    if output:
+        out = open(output, "wb" if binary else "w", newline="" if fmt == "csv" else None)
+    else:
+        out = sys.stdout.buffer if binary else sys.stdout
+    try:
+        if fmt == "jsonl":
+            write_jsonl(items, out)
+        elif fmt == "csv":
+            write_csv(items, out, projection)
+        elif fmt == "parquet":
+            write_parquet(items, out)
+    finally:
+        if output:
+            out.close()
 
 if __name__ == "__main__":
     # parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("table_name", type=str)
+    parser.add_argument("--format", type=str, default="jsonl", choices=["jsonl", "csv", "parquet"])
+    parser.add_argument("--output", type=str, default=None, help="Write to this file instead of stdout")
+    parser.add_argument("--projection", type=str, default=None,
+                        help="Comma-separated attributes to read, e.g. item_id,age")
     args = parser.parse_args()
 
-    scan_table(args.table_name)
+    projection = args.projection.split(",") if args.projection else None
+    scan_table(args.table_name, args.output, args.format, projection)
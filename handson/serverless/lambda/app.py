@@ -7,12 +7,26 @@ import os
 # <1>
 FUNC = """
 import time
+loaded_at = time.time()
+import json
 from random import choice, randint
+init_ms = (time.time() - loaded_at) * 1000
+cold = True
+
 def handler(event, context):
+    global cold
+    start = time.time()
     time.sleep(randint(2,5))
     sushi = ["salmon", "tuna", "squid"]
     message = "Welcome to Cloud Sushi. Your order is " + choice(sushi)
     print(message)
+    # metrics read by instrument.py
+    print(json.dumps({
+        "cold": cold,
+        "init_ms": round(init_ms, 3),
+        "exec_ms": round((time.time() - start) * 1000, 1),
+    }))
+    cold = False
     return message
 """
 
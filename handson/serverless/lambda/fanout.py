@@ -0,0 +1,204 @@
+"""
+Thread-based fan-out of Lambda invocations.
+
+Worker threads take tasks from a shared iterator and invoke the function
+through one boto3 client, whose connection pool has one connection per
+worker. The submission rate can be capped with a token bucket, and throttled
+calls (TooManyRequestsException), server errors (5xx) and connection errors
+are retried with exponential backoff and full jitter.
+
+imap() runs a function over tasks the same way but hands back the results,
+for synchronous (RequestResponse) invocations.
+"""
+import json, random, threading, time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+
+THROTTLING_ERRORS = ["TooManyRequestsException", "ThrottlingException"]
+
+def make_client(concurrency=32):
+    """
+    Lambda client shared by all threads. Retries are left to call_with_retry()
+    so that they can be counted and go through the token bucket.
+    """
+    return boto3.client("lambda", config=Config(
+        max_pool_connections=concurrency,
+        retries={"total_max_attempts": 1},
+    ))
+
+class TokenBucket:
+    """
+    Rate limiter shared by all workers: 'rate' tokens are added every second
+    """
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = 1.0
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                # at least one token, or a rate below 1/s would never reach it
+                self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class Stats:
+    """
+    Counts of a fan-out, updated from the worker threads
+    """
+    def __init__(self):
+        self.submitted = 0
+        self.succeeded = 0
+        self.retries = 0
+        self.errors = Counter() # error code -> count
+        self.start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for name, n in counts.items():
+                setattr(self, name, getattr(self, name) + n)
+
+    def add_error(self, code):
+        with self._lock:
+            self.errors[code] += 1
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def report(self, file=None):
+        print(f"\nSubmitted {self.submitted} tasks in {self.elapsed:.1f} sec "
+              f"({self.submitted / self.elapsed:.1f} tasks/s)", file=file)
+        print(f"Succeeded: {self.succeeded}, retries: {self.retries}, "
+              f"failed: {sum(self.errors.values())}", file=file)
+        for code, n in self.errors.most_common():
+            print(f"  {code}: {n}", file=file)
+
+def is_transient(error):
+    """
+    Whether the call may succeed if retried: throttling, a server error (5xx)
+    or a connection error, which botocore's own retries would have covered
+    """
+    if isinstance(error, ClientError):
+        return (error.response["Error"]["Code"] in THROTTLING_ERRORS
+                or error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0) >= 500)
+    return isinstance(error, (BotoConnectionError, HTTPClientError))
+
+def call_with_retry(fn, stats, max_attempts=8, base_delay=0.1, max_delay=10.0):
+    """
+    Call fn() and retry it while it fails with a transient error
+    """
+    for attempt in range(max_attempts):
+        try:
+            return fn()
+        except Exception as e:
+            if not is_transient(e) or attempt == max_attempts - 1:
+                raise
+        stats.add(retries=1)
+        time.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+
+def invoke_request(function_name, payload=None, invocation_type="Event"):
+    """
+    Parameters of Invoke for one task
+    """
+    request = {"FunctionName": function_name, "InvocationType": invocation_type}
+    if payload is not None:
+        request["Payload"] = json.dumps(payload)
+    return request
+
+def _progress(stats, stop, interval=1.0):
+    last_count, last_time = 0, stats.start
+    while not stop.wait(interval):
+        now, count = time.monotonic(), stats.submitted
+        print(f"{count} submitted, {(count - last_count) / (now - last_time):.1f} tasks/s", flush=True)
+        last_count, last_time = count, now
+
+def run(client, requests, concurrency=32, rate=None, max_attempts=8):
+    """
+    Invoke the function once for each request (Invoke parameters) with
+    'concurrency' threads and at most 'rate' invocations (retries included)
+    per second.
+    Failed invocations are counted in the returned Stats, not raised.
+    """
+    stats = Stats()
+    bucket = TokenBucket(rate) if rate else None
+    requests = iter(requests)
+    lock = threading.Lock()
+
+    def invoke(request):
+        # retries take a token too, so that they do not exceed the rate
+        if bucket:
+            bucket.acquire()
+        return client.invoke(**request)
+
+    def worker():
+        while True:
+            with lock:
+                request = next(requests, None)
+            if request is None:
+                return
+            try:
+                call_with_retry(lambda: invoke(request), stats, max_attempts)
+                stats.add(submitted=1, succeeded=1)
+            except ClientError as e:
+                stats.add(submitted=1)
+                stats.add_error(e.response["Error"]["Code"])
+            except Exception as e:
+                stats.add(submitted=1)
+                stats.add_error(type(e).__name__)
+
+    stop = threading.Event()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    threads.append(threading.Thread(target=_progress, args=(stats, stop), daemon=True))
+    for thread in threads:
+        thread.start()
+    for thread in threads[:-1]:
+        thread.join()
+    stop.set()
+    return stats
+
+_END = object()
+
+def imap(fn, tasks, concurrency=32, ordered=True):
+    """
+    Generator of (task, result, error) for fn(task) run on 'concurrency'
+    threads, so at most 'concurrency' tasks are in flight. Results come in the
+    order of the tasks if 'ordered', otherwise as soon as they complete.
+    In order, up to 4 x 'concurrency' results wait behind a slow task while
+    the threads go on with the next tasks.
+    """
+    def call(task):
+        try:
+            return task, fn(task), None
+        except Exception as e:
+            return task, None, e
+
+    tasks = iter(tasks)
+    window = 4 * concurrency if ordered else concurrency
+    with ThreadPoolExecutor(concurrency) as executor:
+        pending = deque(executor.submit(call, task) for _, task in zip(range(window), tasks))
+        while pending:
+            if ordered:
+                done = [pending.popleft()]
+                done[0].result()
+            else:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                done = [f for f in pending if f in finished]
+                for future in done:
+                    pending.remove(future)
+            for future in done:
+                task = next(tasks, _END)
+                if task is not _END:
+                    pending.append(executor.submit(call, task))
+                yield future.result()
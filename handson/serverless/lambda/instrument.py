@@ -0,0 +1,104 @@
+"""
+Latency and cold-start metrics of Lambda invocations.
+
+Invoked with LogType="Tail", Lambda returns the last 4 KB of the
+invocation's log. It holds the REPORT line written by Lambda (duration,
+billed duration, memory, and "Init Duration" on a cold start) and the JSON
+line written by the handler in app.py (cold flag, init and execution time
+measured inside the function).
+"""
+import base64, json, re, threading
+
+REPORT_PATTERN = re.compile(
+    r"REPORT RequestId: \S+\s+Duration: (?P<duration_ms>[\d.]+) ms\s+"
+    r"Billed Duration: (?P<billed_ms>\d+) ms\s+Memory Size: (?P<memory_size_mb>\d+) MB\s+"
+    r"Max Memory Used: (?P<max_memory_mb>\d+) MB(?:\s+Init Duration: (?P<init_ms>[\d.]+) ms)?"
+)
+
+# upper bounds of the histogram buckets
+BOUNDS_MS = (100, 200, 500, 1000, 2000, 3000, 4000, 5000, 6000, 8000, 10000)
+
+def parse_log_tail(log_result):
+    """
+    Metrics of one invocation from the base64 LogResult of Invoke
+    """
+    metrics = {}
+    for line in base64.b64decode(log_result).decode("utf-8", "replace").splitlines():
+        m = REPORT_PATTERN.search(line)
+        if m:
+            metrics.update({k: float(v) for k, v in m.groupdict().items() if v is not None})
+        elif line.startswith("{") and '"cold"' in line:
+            handler = json.loads(line)
+            metrics["cold"] = handler["cold"]
+            metrics["exec_ms"] = handler["exec_ms"]
+            # Lambda's Init Duration also covers the runtime start; prefer it
+            metrics.setdefault("init_ms", handler["init_ms"] if handler["cold"] else None)
+    if "init_ms" in metrics and metrics["init_ms"] is None:
+        del metrics["init_ms"]
+    metrics.setdefault("cold", "init_ms" in metrics)
+    return metrics
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+class LatencyStats:
+    """
+    Collect the metrics of many invocations, from any thread
+    """
+    def __init__(self):
+        self.samples = [] # metrics dicts, with "round_trip_ms" measured by the client
+        self._lock = threading.Lock()
+
+    def add(self, metrics):
+        with self._lock:
+            self.samples.append(metrics)
+
+    def values(self, name, cold=None):
+        return sorted(
+            s[name] for s in self.samples
+            if name in s and (cold is None or s.get("cold") == cold)
+        )
+
+    @property
+    def cold_starts(self):
+        return sum(1 for s in self.samples if s.get("cold"))
+
+    def report(self, show_histogram=True):
+        n = len(self.samples)
+        if not n:
+            print("No invocations.")
+            return
+        print(f"{n} invocations, {self.cold_starts} cold starts ({100 * self.cold_starts / n:.1f}%)")
+        print(f"{'metric':<22} {'count':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} [ms]")
+        rows = [
+            ("round trip", "round_trip_ms", None),
+            ("round trip (cold)", "round_trip_ms", True),
+            ("round trip (warm)", "round_trip_ms", False),
+            ("duration", "duration_ms", None),
+            ("billed duration", "billed_ms", None),
+            ("init duration", "init_ms", None),
+        ]
+        for label, name, cold in rows:
+            values = self.values(name, cold)
+            if values:
+                p50, p95, p99 = [percentile(values, p) for p in (50, 95, 99)]
+                print(f"{label:<22} {len(values):>6} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {values[-1]:>9.1f}")
+        memory = self.values("max_memory_mb")
+        if memory:
+            print(f"max memory used: {memory[-1]:.0f} MB of {self.samples[0].get('memory_size_mb', 0):.0f} MB")
+        if show_histogram:
+            self.histogram("round_trip_ms")
+
+    def histogram(self, name):
+        values = self.values(name)
+        print(f"\n{name} histogram")
+        counts = [0] * (len(BOUNDS_MS) + 1)
+        for v in values:
+            counts[next((i for i, b in enumerate(BOUNDS_MS) if v <= b), len(BOUNDS_MS))] += 1
+        for bound, count in zip(list(BOUNDS_MS) + [None], counts):
+            label = f"<= {bound} ms" if bound is not None else "slower"
+            bar = "#" * int(50 * count / len(values))
+            print(f"    {label:>12} {count:>7} {bar}")
@@ -1,25 +1,125 @@
-import boto3, argparse, base64
-from multiprocessing import Pool, cpu_count
-client = boto3.client("lambda")
-
-def invoke(p):
-    function_name = p[0]
-    print("", end=".", flush=True)
-    client.invoke(
-        FunctionName=function_name,
-        InvocationType="Event",
+import argparse, json, time
+import fanout
+from instrument import parse_log_tail, percentile, LatencyStats
+from invoke_map import FunctionError
+
+def make_payload(template, i):
+    """
+    Payload of the i-th task: the JSON template with "{i}" replaced by i
+    """
+    if template is None:
+        return None
+    return json.loads(template.replace("{i}", str(i)))
+
+def main(function_name, num_tasks, concurrency=32, rate=None, payload=None):
+    client = fanout.make_client(concurrency)
+    requests = (
+        fanout.invoke_request(function_name, make_payload(payload, i))
+        for i in range(num_tasks)
+    )
+    stats = fanout.run(client, requests, concurrency, rate)
+    stats.report()
+    print(f"\nSubmitted {stats.succeeded} tasks to Lambda!")
+
+def invoke_measured(client, function_name, payload, stats):
+    """
+    Invoke synchronously and return the metrics of the invocation.
+    Raises FunctionError if the function raised.
+    """
+    request = fanout.invoke_request(function_name, payload, "RequestResponse")
+    request["LogType"] = "Tail"
+    start = time.perf_counter()
+    response = fanout.call_with_retry(lambda: client.invoke(**request), stats)
+    body = response["Payload"].read()
+    if "FunctionError" in response:
+        raise FunctionError(body.decode("utf-8", "replace"))
+    metrics = parse_log_tail(response["LogResult"])
+    metrics["round_trip_ms"] = (time.perf_counter() - start) * 1000
+    return metrics
+
+def measure(client, function_name, num_tasks, concurrency, payload=None):
+    """
+    Run 'num_tasks' synchronous invocations, 'concurrency' at a time, and collect their metrics
+    """
+    stats = fanout.Stats()
+    latency = LatencyStats()
+    tasks = (make_payload(payload, i) for i in range(num_tasks))
+    run = lambda p: invoke_measured(client, function_name, p, stats)
+    for task, metrics, error in fanout.imap(run, tasks, concurrency):
+        stats.add(submitted=1)
+        if error is None:
+            stats.add(succeeded=1)
+            latency.add(metrics)
+        else:
+            stats.add_error(type(error).__name__)
+    return stats, latency
+
+def measure_main(function_name, num_tasks, concurrency=32, payload=None):
+    client = fanout.make_client(concurrency)
+    stats, latency = measure(client, function_name, num_tasks, concurrency, payload)
+    stats.report()
+    print()
+    latency.report()
+
+def reset_environments(client, function_name):
+    """
+    Changing the configuration makes Lambda start new execution environments,
+    so that the next invocations are cold starts
+    """
+    config = client.get_function_configuration(FunctionName=function_name)
+    variables = config.get("Environment", {}).get("Variables", {})
+    variables["RESET_AT"] = str(time.time())
+    client.update_function_configuration(
+        FunctionName=function_name, Environment={"Variables": variables}
     )
+    client.get_waiter("function_updated").wait(FunctionName=function_name)
+
+def sweep(function_name, num_tasks, levels, payload=None, reset=False):
+    """
+    Measure latency and cold-start rate at each concurrency level
+    """
+    client = fanout.make_client(max(levels))
+    rows = []
+    for concurrency in levels:
+        if reset:
+            reset_environments(client, function_name)
+        stats, latency = measure(client, function_name, num_tasks, concurrency, payload)
+        print(f"\n=== concurrency {concurrency} ===")
+        latency.report(show_histogram=False)
+        rows.append((concurrency, stats, latency))
+
+    print(f"\n{'concurrency':>11} {'invocations':>11} {'cold':>6} {'cold %':>7} "
+          f"{'p50':>8} {'p95':>8} {'init p50':>9} [ms]  errors")
+    for concurrency, stats, latency in rows:
+        n = len(latency.samples)
+        round_trip, init = latency.values("round_trip_ms"), latency.values("init_ms")
+        p50, p95 = [percentile(round_trip, p) for p in (50, 95)]
+        init_p50 = percentile(init, 50)
+        print(f"{concurrency:>11} {n:>11} {latency.cold_starts:>6} "
+              f"{100 * latency.cold_starts / max(n, 1):>7.1f} {p50:>8.1f} {p95:>8.1f} {init_p50:>9.1f}"
+              f"       {sum(stats.errors.values())}")
 
 if __name__ == "__main__":
     # parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("function_name", type=str)
     parser.add_argument("num_tasks", type=int)
+    parser.add_argument("--concurrency", type=int, default=32, help="Number of invoking threads")
+    parser.add_argument("--rate", type=float, default=None, help="Maximum invocations per second")
+    parser.add_argument("--payload", type=str, default=None,
+                        help='JSON payload of each task; "{i}" is replaced by the task number')
+    parser.add_argument("--measure", action="store_true",
+                        help="Invoke synchronously and report latency and cold starts")
+    parser.add_argument("--sweep", type=int, nargs="+", default=None,
+                        help="Measure at each of these concurrency levels, e.g. 1 4 16 64")
+    parser.add_argument("--reset", action="store_true",
+                        help="With --sweep, update the function's environment before each level "
+                             "so that it starts from cold environments")
     args = parser.parse_args()
 
-    # submit tasks
-    with Pool(cpu_count()) as p:
-        params = [(args.function_name, i) for i in range(args.num_tasks)]
-        p.map(invoke, params)
-
-    print(f"\nSubmitted {args.num_tasks} tasks to Lambda!")
+    if args.sweep:
+        sweep(args.function_name, args.num_tasks, args.sweep, args.payload, args.reset)
+    elif args.measure:
+        measure_main(args.function_name, args.num_tasks, args.concurrency, args.payload)
+    else:
+        main(args.function_name, args.num_tasks, args.concurrency, args.rate, args.payload)
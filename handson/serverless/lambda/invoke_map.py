@@ -0,0 +1,85 @@
+import argparse, json, random, sys, time
+from botocore.exceptions import BotoCoreError, ClientError
+import fanout
+
+class FunctionError(Exception):
+    """
+    The function raised an exception; the message is its error payload
+    """
+
+def read_payloads(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def is_retryable(error):
+    if isinstance(error, (FunctionError, BotoCoreError)):
+        return True
+    if isinstance(error, ClientError):
+        return error.response["ResponseMetadata"].get("HTTPStatusCode", 500) >= 500
+    return False
+
+def invoke_sync(client, function_name, payload, stats, retries=3):
+    """
+    Invoke the function with RequestResponse and return its decoded result.
+    Function errors and server-side failures are retried 'retries' times.
+    """
+    request = fanout.invoke_request(function_name, payload, "RequestResponse")
+    for attempt in range(retries + 1):
+        try:
+            response = fanout.call_with_retry(lambda: client.invoke(**request), stats)
+            body = response["Payload"].read()
+            result = json.loads(body) if body else None
+            if "FunctionError" in response:
+                raise FunctionError(json.dumps(result))
+            return result
+        except Exception as e:
+            if attempt == retries or not is_retryable(e):
+                raise
+        stats.add(retries=1)
+        time.sleep(random.uniform(0, 0.1 * 2 ** attempt))
+
+def main(function_name, input_path, output_path=None, concurrency=32, ordered=True, retries=3):
+    client = fanout.make_client(concurrency)
+    stats = fanout.Stats()
+    out = open(output_path, "w") if output_path else sys.stdout
+
+    def run(task):
+        index, payload = task
+        return invoke_sync(client, function_name, payload, stats, retries)
+
+    tasks = enumerate(read_payloads(input_path))
+    try:
+        for (index, payload), result, error in fanout.imap(run, tasks, concurrency, ordered):
+            record = {"index": index, "payload": payload}
+            if error is None:
+                record["result"] = result
+                stats.add(submitted=1, succeeded=1)
+            else:
+                code = error.response["Error"]["Code"] if isinstance(error, ClientError) else type(error).__name__
+                record["error"] = {"type": code, "message": str(error)}
+                stats.add(submitted=1)
+                stats.add_error(code)
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+    finally:
+        if output_path:
+            out.close()
+    # stdout may hold the results
+    stats.report(file=sys.stderr)
+
+if __name__ == "__main__":
+    # parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("function_name", type=str)
+    parser.add_argument("input", type=str, help="JSONL file with one payload per line")
+    parser.add_argument("--output", type=str, default=None, help="JSONL file of results (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=32, help="Maximum invocations in flight")
+    parser.add_argument("--as_completed", action="store_true",
+                        help="Write results as they complete instead of in input order")
+    parser.add_argument("--retries", type=int, default=3, help="Retries of a failed invocation")
+    args = parser.parse_args()
+
+    main(args.function_name, args.input, args.output, args.concurrency,
+         not args.as_completed, args.retries)
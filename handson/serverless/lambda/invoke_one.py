@@ -1,17 +1,28 @@
-import boto3, argparse, base64
+import boto3, argparse, base64, time
+from instrument import parse_log_tail, LatencyStats
 
-def main(function_name):
+def main(function_name, repeat=1):
     client = boto3.client("lambda")
-    response = client.invoke(
-        FunctionName=function_name,
-        InvocationType="RequestResponse",
-    )
-    print(response['Payload'].read().decode("utf-8"))
+    stats = LatencyStats()
+    for i in range(repeat):
+        start = time.perf_counter()
+        response = client.invoke(
+            FunctionName=function_name,
+            InvocationType="RequestResponse",
+            LogType="Tail",
+        )
+        print(response['Payload'].read().decode("utf-8"))
+        metrics = parse_log_tail(response["LogResult"])
+        metrics["round_trip_ms"] = (time.perf_counter() - start) * 1000
+        stats.add(metrics)
+    print()
+    stats.report(show_histogram=repeat > 1)
 
 if __name__ == "__main__":
     # parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("function_name", type=str)
+    parser.add_argument("--repeat", type=int, default=1, help="Invoke the function this many times in a row")
     args = parser.parse_args()
 
-    main(args.function_name)
+    main(args.function_name, args.repeat)
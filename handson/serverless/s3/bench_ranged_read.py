@@ -0,0 +1,83 @@
+"""
+Time to first byte and throughput of ranged reads versus download_file().
+
+With download_file() nothing can be used before the whole object is on disk
+and read back, so its time to first byte is the time of the full download
+plus the read. iter_object() hands out the first range as soon as it arrives.
+
+Set S3_ENDPOINT_URL to run against a local S3 stand-in.
+"""
+import argparse, os, tempfile, time
+from transfer import MB, make_client, make_config
+from ranged_read import read_object, read_object_to_mmap, iter_object
+
+ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")
+
+def bench_download_file(client, bucket_name, key, size, part_size, concurrency):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "object")
+        start = time.perf_counter()
+        client.download_file(bucket_name, key, path, Config=make_config(part_size // MB, concurrency))
+        with open(path, "rb") as f:
+            f.read()
+        elapsed = time.perf_counter() - start
+    return elapsed, elapsed
+
+def bench_read_object(client, bucket_name, key, size, part_size, concurrency):
+    buffer = bytearray(size)
+    start = time.perf_counter()
+    read_object(client, bucket_name, key, buffer, part_size, concurrency)
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed
+
+def bench_mmap(client, bucket_name, key, size, part_size, concurrency):
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        mapped = read_object_to_mmap(client, bucket_name, key, os.path.join(tmp, "object"),
+                                     part_size, concurrency)
+        elapsed = time.perf_counter() - start
+        if size:
+            mapped.close()
+    return elapsed, elapsed
+
+def bench_iter_object(client, bucket_name, key, size, part_size, concurrency):
+    start = time.perf_counter()
+    ttfb = None
+    for chunk in iter_object(client, bucket_name, key, part_size, concurrency):
+        if ttfb is None:
+            ttfb = time.perf_counter() - start
+    return ttfb or 0.0, time.perf_counter() - start
+
+METHODS = {
+    "download_file": bench_download_file,
+    "read_object": bench_read_object,
+    "mmap": bench_mmap,
+    "iter_object": bench_iter_object,
+}
+
+if __name__ == "__main__":
+    # parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("bucket_name", type=str)
+    parser.add_argument("key", type=str)
+    parser.add_argument("--upload", type=int, default=None,
+                        help="First upload a random object of this many MB to the key")
+    parser.add_argument("--part_size", type=int, default=8, help="Range size in MB")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    client = make_client(ENDPOINT_URL, args.concurrency)
+    if args.upload:
+        client.put_object(Bucket=args.bucket_name, Key=args.key, Body=os.urandom(args.upload * MB))
+    size = client.head_object(Bucket=args.bucket_name, Key=args.key)["ContentLength"]
+
+    print(f"{size / MB:.1f} MB, ranges of {args.part_size} MB, concurrency {args.concurrency}")
+    print("method           TTFB[s]  total[s]     MB/s")
+    for name, bench in METHODS.items():
+        results = [
+            bench(client, args.bucket_name, args.key, size, args.part_size * MB, args.concurrency)
+            for _ in range(args.repeat)
+        ]
+        ttfb, total = min(r[0] for r in results), min(r[1] for r in results)
+        print(f"{name:14s} {ttfb:9.3f} {total:9.3f} {size / MB / total:8.1f}")
@@ -0,0 +1,111 @@
+"""
+Read S3 objects into memory with parallel ranged GETs.
+
+The object is split into ranges of 'part_size' bytes which are fetched at the
+same time, and each response body is read straight into its slice of one
+preallocated buffer (StreamingBody.readinto), without a temporary file or
+intermediate copies. The buffer can be a bytearray or a memory-mapped file.
+
+Every range is fetched with the ETag of the object as IfMatch, so that an
+object overwritten during the read fails with 412 (PreconditionFailed)
+instead of yielding a mix of the old and the new bytes.
+
+For example, a dataset shard can be used without downloading it first:
+
+    buffer = read_object(client, bucket_name, "mnist/train-images-idx3-ubyte")
+    images = numpy.frombuffer(buffer, dtype=numpy.uint8, offset=16).reshape(-1, 28, 28)
+"""
+import mmap
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from transfer import MB
+
+def object_head(client, bucket_name, key):
+    """
+    (size, ETag) of the object
+    """
+    response = client.head_object(Bucket=bucket_name, Key=key)
+    return response["ContentLength"], response["ETag"]
+
+def byte_ranges(size, part_size):
+    """
+    (start, end) of each range, 'end' excluded
+    """
+    return [(start, min(start + part_size, size)) for start in range(0, size, part_size)]
+
+def read_range_into(client, bucket_name, key, etag, view, start, end):
+    """
+    Fetch bytes [start, end) of the version 'etag' of the object into 'view',
+    which has length end - start
+    """
+    response = client.get_object(Bucket=bucket_name, Key=key, IfMatch=etag,
+                                 Range=f"bytes={start}-{end - 1}")
+    body, filled = response["Body"], 0
+    while filled < len(view):
+        n = body.readinto(view[filled:])
+        if n == 0:
+            raise IOError(f"Connection closed after {filled} of {len(view)} bytes of {key}")
+        filled += n
+    body.close()
+
+def read_ranges_into(client, bucket_name, key, etag, size, buffer, part_size, concurrency):
+    view = memoryview(buffer)
+    with ThreadPoolExecutor(concurrency) as executor:
+        futures = [
+            executor.submit(read_range_into, client, bucket_name, key, etag, view[start:end], start, end)
+            for start, end in byte_ranges(size, part_size)
+        ]
+        for future in futures:
+            future.result()
+
+def read_object(client, bucket_name, key, buffer=None, part_size=8 * MB, concurrency=10):
+    """
+    Read the whole object into 'buffer' (a new bytearray if None) and return the buffer
+    """
+    size, etag = object_head(client, bucket_name, key)
+    if buffer is None:
+        buffer = bytearray(size)
+    if len(buffer) < size:
+        raise ValueError(f"Buffer of {len(buffer)} bytes is too small for {size} bytes")
+    read_ranges_into(client, bucket_name, key, etag, size, buffer, part_size, concurrency)
+    return buffer
+
+def read_object_to_mmap(client, bucket_name, key, path, part_size=8 * MB, concurrency=10):
+    """
+    Read the object into a memory-mapped file at 'path' and return the mmap.
+    Pages are written back to the file by the OS, not by us.
+    """
+    size, etag = object_head(client, bucket_name, key)
+    with open(path, "w+b") as f:
+        f.truncate(size)
+        if size == 0:
+            return b""
+        mapped = mmap.mmap(f.fileno(), size)
+    read_ranges_into(client, bucket_name, key, etag, size, mapped, part_size, concurrency)
+    return mapped
+
+def iter_object(client, bucket_name, key, part_size=8 * MB, concurrency=10):
+    """
+    Generator of the object's ranges, in order, each as soon as it is complete.
+    At most 2 * 'concurrency' ranges are held in memory.
+    """
+    size, etag = object_head(client, bucket_name, key)
+
+    def fetch(start, end):
+        buffer = bytearray(end - start)
+        read_range_into(client, bucket_name, key, etag, memoryview(buffer), start, end)
+        return buffer
+
+    ranges = iter(byte_ranges(size, part_size))
+    with ThreadPoolExecutor(concurrency) as executor:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(executor.submit(fetch, start, end))
+            if len(pending) >= 2 * concurrency:
+                break
+        while pending:
+            chunk = pending.popleft().result()
+            next_range = next(ranges, None)
+            if next_range:
+                pending.append(executor.submit(fetch, *next_range))
+            yield chunk
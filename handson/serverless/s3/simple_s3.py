@@ -1,45 +1,131 @@
-import boto3
 import argparse
+import fnmatch
 import os
+from transfer import (
+    make_client, make_config, local_files, remote_keys, join_key, local_path,
+    upload_many, download_many
+)
+from sync import sync_up, sync_down
 
-s3 = boto3.resource('s3')
-
-def upload_file(bucket_name, filename, key=None):
-    bucket = s3.Bucket(bucket_name)
+# set S3_ENDPOINT_URL to use a local stand-in of S3
+ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")
 
+def upload_file(bucket_name, filename, key=None, part_size=8, concurrency=10):
     if key is None:
         key = os.path.basename(filename)
 
-    bucket.upload_file(filename, key)
+    client = make_client(ENDPOINT_URL, concurrency)
+    upload_many(client, bucket_name, [(filename, key)], make_config(part_size, concurrency))
     print("Upload completed.")
     print("Original file:", filename)
     print("Key in bucket:", key)
 
-def download_file(bucket_name, key, filename=None):
-    bucket = s3.Bucket(bucket_name)
-
+def download_file(bucket_name, key, filename=None, part_size=8, concurrency=10):
     if filename is None:
         filename = os.path.basename(key)
 
-    bucket.download_file(key, filename)
+    client = make_client(ENDPOINT_URL, concurrency)
+    download_many(client, bucket_name, [(key, filename)], make_config(part_size, concurrency))
+    print("Download completed.")
+
+def upload_files(bucket_name, source, prefix="", resume=False, part_size=8, concurrency=10,
+                 key=None):
+    """
+    Upload a file, all files under a directory, or the files matching a glob
+    pattern, in parallel. Keys are 'prefix' + the path relative to the directory
+    ('key' can be given for a single file).
+    """
+    client = make_client(ENDPOINT_URL, concurrency)
+    config = make_config(part_size, concurrency)
+    if key and os.path.isfile(source):
+        files = [(source, key)]
+    else:
+        files = [(path, join_key(prefix, relpath)) for path, relpath in local_files(source)]
+    if not files:
+        print("No files to upload.")
+        return
+    upload_many(client, bucket_name, files, config, resume)
+    print("Upload completed.")
+
+def download_files(bucket_name, prefix, dest=".", pattern=None, part_size=8, concurrency=10):
+    """
+    Download all objects under 'prefix' (whose keys match the glob 'pattern',
+    if given) into 'dest', in parallel
+    """
+    client = make_client(ENDPOINT_URL, concurrency)
+    config = make_config(part_size, concurrency)
+    # keep the key below the last '/' of the prefix as the local path
+    base = prefix[:prefix.rfind("/") + 1]
+    objects = []
+    for key, size in remote_keys(client, bucket_name, prefix):
+        if key.endswith("/") or (pattern is not None and not fnmatch.fnmatch(key, pattern)):
+            continue
+        try:
+            objects.append((key, local_path(dest, key[len(base):])))
+        except ValueError as e:
+            print(f"Skipping {key}: {e}")
+    if not objects:
+        print("No objects to download.")
+        return
+    download_many(client, bucket_name, objects, config)
     print("Download completed.")
 
+def sync(bucket_name, local_dir, prefix="", down=False, part_size=8, concurrency=10):
+    """
+    Upload (or with 'down', download) only the files which differ between
+    'local_dir' and 'prefix'
+    """
+    client = make_client(ENDPOINT_URL, concurrency)
+    config = make_config(part_size, concurrency)
+    if down:
+        sync_down(client, bucket_name, prefix, local_dir, config)
+    else:
+        sync_up(client, bucket_name, local_dir, prefix, config)
+    print("Sync completed.")
+
 if __name__ == "__main__":
     # parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("bucket_name", type=str)
     subparsers = parser.add_subparsers(dest="command")
-    p1 = subparsers.add_parser("upload")
-    p1.add_argument("filename", type=str)
+
+    # options of the transfer engine
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--part_size", type=int, default=8, help="Multipart part size in MB")
+    common.add_argument("--concurrency", type=int, default=10,
+                        help="Parts and files transferred at the same time")
+
+    p1 = subparsers.add_parser("upload", parents=[common])
+    p1.add_argument("filename", type=str, help="A file, a directory or a glob pattern such as 'data/**/*.csv'")
     p1.add_argument("--key", type=str, required=False)
-    p2 = subparsers.add_parser("download")
+    p1.add_argument("--prefix", type=str, default="", help="Key prefix for a directory or glob pattern")
+    p1.add_argument("--resume", action="store_true",
+                    help="Make multipart uploads resumable after an interruption")
+    p2 = subparsers.add_parser("download", parents=[common])
     p2.add_argument("key", type=str)
+    p2.add_argument("--recursive", action="store_true", help="Download all objects under the prefix 'key'")
+    p2.add_argument("--dest", type=str, default=".", help="Directory to download into, with --recursive")
+    p2.add_argument("--pattern", type=str, default=None, help="Download only the keys matching this glob")
+    p3 = subparsers.add_parser("sync", parents=[common])
+    p3.add_argument("local_dir", type=str)
+    p3.add_argument("--prefix", type=str, default="", help="Key prefix to sync with")
+    p3.add_argument("--down", action="store_true", help="Download from the bucket instead of uploading")
     args = parser.parse_args()
 
     if args.command == "upload":
-        if args.key:
-            upload_file(args.bucket_name, args.filename, args.key)
+        if os.path.isfile(args.filename) and not args.resume:
+            upload_file(args.bucket_name, args.filename, args.key,
+                        args.part_size, args.concurrency)
         else:
-            upload_file(args.bucket_name, args.filename)
+            upload_files(args.bucket_name, args.filename, args.prefix, args.resume,
+                         args.part_size, args.concurrency, args.key)
     elif args.command == "download":
-        download_file(args.bucket_name, args.key)
+        if args.recursive:
+            download_files(args.bucket_name, args.key, args.dest, args.pattern,
+                           args.part_size, args.concurrency)
+        else:
+            download_file(args.bucket_name, args.key, None,
+                          args.part_size, args.concurrency)
+    elif args.command == "sync":
+        sync(args.bucket_name, args.local_dir, args.prefix, args.down,
+             args.part_size, args.concurrency)
@@ -0,0 +1,255 @@
+"""
+Incremental sync between a local directory and a prefix of an S3 bucket.
+
+A file is transferred only if the other side has no object of the same size
+and content. Content is compared through the ETag: the MD5 of the object, or
+for a multipart upload the MD5 of the MD5s of its parts followed by "-<number
+of parts>", which is computed locally with the same part size.
+
+Hashing every file on each run would cost as much as reading the whole tree,
+so the ETag of each file is kept in a manifest together with its size and
+mtime, and recomputed only for files that changed. The manifest also keeps
+the ETag of the object each file was last synced with, so that an unchanged
+file and object are skipped even when the part size of a multipart ETag
+cannot be inferred. The bucket is still listed on every run, since other
+writers may have changed it.
+"""
+import hashlib, json, os
+from concurrent.futures import ThreadPoolExecutor
+from transfer import MB, STATE_DIR, local_files, join_key, local_path, upload_many, download_many
+
+# part sizes tried when matching a multipart ETag (8 MB is the boto3 default)
+DEFAULT_PART_SIZES = [8 * MB, 5 * MB, 16 * MB]
+
+def compute_etags(path, part_sizes):
+    """
+    {part size: ETag} S3 gives to the file uploaded in one piece (part size
+    None) or in parts of each of 'part_sizes' bytes, reading the file once
+    """
+    whole = hashlib.md5() if None in part_sizes else None
+    # current part, its size so far, and the digests of the previous parts
+    parts = {size: {"md5": hashlib.md5(), "size": 0, "digests": []} for size in part_sizes if size}
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(MB), b""):
+            if whole is not None:
+                whole.update(data)
+            for part_size, part in parts.items():
+                view = memoryview(data)
+                while view:
+                    n = min(len(view), part_size - part["size"])
+                    part["md5"].update(view[:n])
+                    part["size"] += n
+                    view = view[n:]
+                    if part["size"] == part_size:
+                        part["digests"].append(part["md5"].digest())
+                        part["md5"], part["size"] = hashlib.md5(), 0
+    etags = {}
+    for part_size in part_sizes:
+        if part_size is None:
+            etags[None] = f'"{whole.hexdigest()}"'
+            continue
+        part = parts[part_size]
+        digests = part["digests"] + ([part["md5"].digest()] if part["size"] else [])
+        etags[part_size] = '"' + hashlib.md5(b"".join(digests)).hexdigest() + f'-{len(digests)}"'
+    return etags
+
+def compute_etag(path, part_size=None):
+    """
+    ETag S3 gives to the file uploaded in one piece (part_size=None) or in
+    parts of 'part_size' bytes
+    """
+    return compute_etags(path, [part_size])[part_size]
+
+def upload_part_size(size, config):
+    """
+    Part size of a file uploaded with the config, or None if sent in one piece
+    """
+    return config.multipart_chunksize if size >= config.multipart_threshold else None
+
+def guess_part_size(size, etag, part_size):
+    """
+    Part size which gives the number of parts in a multipart ETag, or None
+    """
+    if "-" not in etag:
+        return None
+    num_parts = int(etag.strip('"').rsplit("-", 1)[1])
+    candidates = [part_size] + DEFAULT_PART_SIZES
+    # parts are usually a whole number of MB
+    candidates.append(-(-size // num_parts // MB) * MB)
+    for candidate in candidates:
+        if candidate and -(-size // candidate) == num_parts:
+            return candidate
+    return None
+
+def list_remote(client, bucket_name, prefix, workers=16):
+    """
+    {key: (size, ETag)} of the objects under the prefix. The "directories"
+    right below the prefix are listed in parallel.
+    """
+    objects = {}
+    response = client.list_objects_v2(Bucket=bucket_name, Prefix=prefix, Delimiter="/")
+    subprefixes = [p["Prefix"] for p in response.get("CommonPrefixes", [])]
+    for obj in response.get("Contents", []):
+        objects[obj["Key"]] = (obj["Size"], obj["ETag"])
+    while response.get("IsTruncated"):
+        response = client.list_objects_v2(Bucket=bucket_name, Prefix=prefix, Delimiter="/",
+                                          ContinuationToken=response["NextContinuationToken"])
+        subprefixes += [p["Prefix"] for p in response.get("CommonPrefixes", [])]
+        for obj in response.get("Contents", []):
+            objects[obj["Key"]] = (obj["Size"], obj["ETag"])
+
+    def list_prefix(subprefix):
+        paginator = client.get_paginator("list_objects_v2")
+        return [
+            (obj["Key"], obj["Size"], obj["ETag"])
+            for page in paginator.paginate(Bucket=bucket_name, Prefix=subprefix)
+            for obj in page.get("Contents", [])
+        ]
+
+    with ThreadPoolExecutor(workers) as executor:
+        for listed in executor.map(list_prefix, subprefixes):
+            for key, size, etag in listed:
+                objects[key] = (size, etag)
+    return objects
+
+class Manifest:
+    """
+    ETags of local files (one per part size) and of the objects they were
+    synced with, valid as long as their size and mtime do not change
+    """
+    def __init__(self, bucket_name, prefix, local_dir):
+        name = hashlib.sha1(
+            f"{bucket_name}\0{prefix}\0{os.path.abspath(local_dir)}".encode()
+        ).hexdigest()
+        self.path = os.path.join(STATE_DIR, name + ".manifest.json")
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        self.hashed = 0
+
+    def _entry(self, path, relpath):
+        """
+        Entry of the file, or an empty one if it changed since it was kept
+        """
+        stat = os.stat(path)
+        entry = self.entries.get(relpath)
+        if not entry or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime:
+            entry = {"size": stat.st_size, "mtime": stat.st_mtime, "etags": {}}
+        return entry
+
+    def etag(self, path, relpath, part_size, other_part_sizes=()):
+        """
+        ETag of the file with 'part_size'. If the file has to be hashed, the
+        ETags with 'other_part_sizes' are computed in the same pass and kept.
+        """
+        entry = self._entry(path, relpath)
+        # JSON object keys are strings
+        etags = entry.get("etags", {})
+        if str(part_size) in etags:
+            return etags[str(part_size)]
+        computed = compute_etags(path, list(dict.fromkeys([part_size, *other_part_sizes])))
+        self.hashed += 1
+        etags.update((str(size), etag) for size, etag in computed.items())
+        self.entries[relpath] = dict(entry, etags=etags)
+        return computed[part_size]
+
+    def synced(self, path, relpath, etag):
+        """
+        Whether the file is unchanged since it was synced with an object of this ETag
+        """
+        return self._entry(path, relpath).get("synced_etag") == etag
+
+    def record(self, path, relpath, etag, part_size=None):
+        """
+        Keep the ETag of the object the file was just synced with. Unless it is
+        a multipart ETag of unknown 'part_size' (None), it is also the ETag of
+        the file with that part size.
+        """
+        entry = self._entry(path, relpath)
+        etags = dict(entry["etags"])
+        if part_size is not None or "-" not in etag:
+            etags[str(part_size)] = etag
+        self.entries[relpath] = dict(entry, etags=etags, synced_etag=etag)
+
+    def save(self):
+        os.makedirs(STATE_DIR, exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(self.entries, f)
+
+def is_same(manifest, path, relpath, remote, config):
+    """
+    Whether the local file has the same content as the remote (size, ETag).
+    The ETag the file would get from an upload with 'config' is computed in
+    the same pass, so that it need not be hashed again once uploaded.
+    """
+    if remote is None:
+        return False
+    size, etag = remote
+    if os.path.getsize(path) != size:
+        return False
+    if manifest.synced(path, relpath, etag):
+        return True
+    part_size = None
+    if "-" in etag:
+        part_size = guess_part_size(size, etag, config.multipart_chunksize)
+        if part_size is None:
+            return False
+    return manifest.etag(path, relpath, part_size, [upload_part_size(size, config)]) == etag
+
+def _as_directory(prefix):
+    return prefix.rstrip("/") + "/" if prefix else ""
+
+def sync_up(client, bucket_name, local_dir, prefix, config):
+    """
+    Upload the files of 'local_dir' which are missing or different under 'prefix'
+    """
+    prefix = _as_directory(prefix)
+    manifest = Manifest(bucket_name, prefix, local_dir)
+    remote = list_remote(client, bucket_name, prefix)
+    files = local_files(local_dir)
+    changed = [
+        (path, relpath) for path, relpath in files
+        if not is_same(manifest, path, relpath, remote.get(join_key(prefix, relpath)), config)
+    ]
+    print(f"{len(changed)} of {len(files)} files to upload ({manifest.hashed} hashed)")
+    if changed:
+        upload_many(client, bucket_name,
+                    [(path, join_key(prefix, relpath)) for path, relpath in changed], config)
+        # the uploaded objects now have the ETag of the local file with our part
+        # size, already computed by is_same() unless the file was not compared
+        for path, relpath in changed:
+            part_size = upload_part_size(os.path.getsize(path), config)
+            manifest.record(path, relpath, manifest.etag(path, relpath, part_size), part_size)
+    manifest.save()
+
+def sync_down(client, bucket_name, prefix, local_dir, config):
+    """
+    Download the objects under 'prefix' which are missing or different in
+    'local_dir'. Keys which would be written outside 'local_dir' are skipped.
+    """
+    prefix = _as_directory(prefix)
+    manifest = Manifest(bucket_name, prefix, local_dir)
+    remote = list_remote(client, bucket_name, prefix)
+    changed = []
+    for key, obj in remote.items():
+        if key.endswith("/"):
+            continue
+        try:
+            path = local_path(local_dir, key[len(prefix):])
+        except ValueError as e:
+            print(f"Skipping {key}: {e}")
+            continue
+        relpath = os.path.relpath(path, local_dir)
+        if not os.path.isfile(path) or not is_same(manifest, path, relpath, obj, config):
+            changed.append((key, path))
+    print(f"{len(changed)} of {len(remote)} objects to download ({manifest.hashed} hashed)")
+    if changed:
+        download_many(client, bucket_name, changed, config)
+        # downloaded files get a new mtime: record their ETag (known from the
+        # listing), so that they are skipped next time without being hashed
+        # (a guessed part size may be wrong, so a multipart ETag is only kept as
+        # the ETag of the object)
+        for key, path in changed:
+            manifest.record(path, os.path.relpath(path, local_dir), remote[key][1])
+    manifest.save()
@@ -0,0 +1,254 @@
+"""
+Parallel transfer of many files between the local disk and S3.
+
+All transfers share one low-level client (whose connection pool is sized to
+the concurrency) and one s3transfer TransferManager, so the parts of large
+files and whole small files are all scheduled on the same pool of threads.
+
+Large uploads can also be made resumable: the multipart upload ID is kept in
+a state file, and a re-run asks S3 which parts it already has (ListParts) and
+sends only the missing ones.
+"""
+import glob, hashlib, json, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from s3transfer.subscribers import BaseSubscriber
+
+MB = 1024 ** 2
+
+# a multipart upload has at most this many parts
+MAX_PARTS = 10000
+
+# where the state of resumable uploads is kept
+STATE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "simple_s3")
+
+def make_client(endpoint_url=None, concurrency=10):
+    """
+    S3 client shared by all threads, with one pooled connection per thread
+    """
+    return boto3.client(
+        "s3", endpoint_url=endpoint_url,
+        config=Config(max_pool_connections=concurrency)
+    )
+
+def make_config(part_size=8, concurrency=10):
+    """
+    TransferConfig splitting files larger than 'part_size' MB into parts of that size
+    """
+    return TransferConfig(
+        multipart_threshold=part_size * MB,
+        multipart_chunksize=part_size * MB,
+        max_concurrency=concurrency,
+    )
+
+class Throughput(BaseSubscriber):
+    """
+    Count the bytes transferred by all files and report MB/s
+    """
+    def __init__(self):
+        self.bytes = 0
+        self.files = 0
+        self.start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, nbytes):
+        with self._lock:
+            self.bytes += nbytes
+
+    def on_progress(self, future, bytes_transferred, **kwargs):
+        self.add(bytes_transferred)
+
+    def on_done(self, future, **kwargs):
+        with self._lock:
+            self.files += 1
+
+    def report(self):
+        elapsed = time.monotonic() - self.start
+        print(f"{self.files} files, {self.bytes / MB:.1f} MB in {elapsed:.2f} sec "
+              f"({self.bytes / MB / elapsed:.1f} MB/s)")
+
+def _glob_root(pattern):
+    """
+    Leading directories of a glob pattern without wildcards, e.g. 'data' for 'data/**/*.csv'
+    """
+    parts = []
+    for part in pattern.split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or "."
+
+def local_files(source):
+    """
+    List (path, relative path) of a file, the files under a directory, or
+    the files matching a glob pattern
+    """
+    if os.path.isfile(source):
+        return [(source, os.path.basename(source))]
+    if os.path.isdir(source):
+        root, paths = source, [
+            os.path.join(d, f) for d, _, files in os.walk(source) for f in files
+        ]
+    else:
+        root, paths = _glob_root(source), [
+            p for p in glob.glob(source, recursive=True) if os.path.isfile(p)
+        ]
+    return sorted((p, os.path.relpath(p, root)) for p in paths)
+
+def remote_keys(client, bucket_name, prefix):
+    """
+    All keys under the prefix, with their sizes
+    """
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            yield obj["Key"], obj["Size"]
+
+def join_key(prefix, relpath):
+    key = relpath.replace(os.sep, "/")
+    return f"{prefix.rstrip('/')}/{key}" if prefix else key
+
+def local_path(dest, relkey):
+    """
+    Path of the object 'relkey' (its key below the prefix) under 'dest'.
+    Raises ValueError if the path falls outside 'dest', e.g. for a key with "..".
+    """
+    path = os.path.join(dest, *relkey.split("/"))
+    root = os.path.realpath(dest)
+    resolved = os.path.realpath(path)
+    if resolved == root or os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"{relkey} would be written outside {dest}")
+    return path
+
+def upload_many(client, bucket_name, files, config, resume=False):
+    """
+    Upload (path, key) pairs concurrently. With 'resume', files large enough
+    for a multipart upload are sent with resumable_upload().
+    """
+    throughput = Throughput()
+    resumable, others = [], []
+    for path, key in files:
+        if resume and os.path.getsize(path) >= config.multipart_threshold:
+            resumable.append((path, key))
+        else:
+            others.append((path, key))
+
+    with create_transfer_manager(client, config) as manager:
+        futures = [
+            manager.upload(path, bucket_name, key, subscribers=[throughput])
+            for path, key in others
+        ]
+        for path, key in resumable:
+            resumable_upload(client, bucket_name, path, key, config, throughput)
+        for future in futures:
+            future.result()
+    throughput.report()
+
+def download_many(client, bucket_name, objects, config):
+    """
+    Download (key, path) pairs concurrently, creating directories as needed
+    """
+    throughput = Throughput()
+    with create_transfer_manager(client, config) as manager:
+        futures = []
+        for key, path in objects:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            futures.append(manager.download(bucket_name, key, path, subscribers=[throughput]))
+        for future in futures:
+            future.result()
+    throughput.report()
+
+def _state_path(bucket_name, key, path):
+    name = hashlib.sha1(f"{bucket_name}\0{key}\0{os.path.abspath(path)}".encode()).hexdigest()
+    return os.path.join(STATE_DIR, name + ".json")
+
+def _uploaded_parts(client, bucket_name, key, upload_id):
+    parts = {}
+    paginator = client.get_paginator("list_parts")
+    for page in paginator.paginate(Bucket=bucket_name, Key=key, UploadId=upload_id):
+        for part in page.get("Parts", []):
+            parts[part["PartNumber"]] = part
+    return parts
+
+def _ignore_no_such_upload(fn, *args, **kwargs):
+    """
+    fn(*args, **kwargs), or None if it fails because the multipart upload is gone
+    """
+    try:
+        return fn(*args, **kwargs)
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "NoSuchUpload":
+            raise
+        return None
+
+def resumable_upload(client, bucket_name, path, key, config, throughput=None):
+    """
+    Multipart upload which can be resumed after an interruption by running it again
+    """
+    size, mtime = os.path.getsize(path), os.path.getmtime(path)
+    part_size = config.multipart_chunksize
+    num_parts = max(1, -(-size // part_size))
+    if num_parts > MAX_PARTS:
+        raise ValueError(f"{path} needs {num_parts} parts; use a part size of at least "
+                         f"{-(-size // MAX_PARTS // MB)} MB")
+    state_path = _state_path(bucket_name, key, path)
+
+    state = None
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+        if [state["size"], state["mtime"], state["part_size"]] != [size, mtime, part_size]:
+            # the file changed since the interrupted upload: start over
+            _ignore_no_such_upload(client.abort_multipart_upload,
+                                   Bucket=bucket_name, Key=key, UploadId=state["upload_id"])
+            state = None
+
+    done = {}
+    if state is not None:
+        done = _ignore_no_such_upload(_uploaded_parts, client, bucket_name, key, state["upload_id"])
+        if done is None:
+            # the upload was aborted, or expired by a lifecycle rule: start over
+            print(f"Upload of {path} no longer exists, starting over")
+            state, done = None, {}
+        else:
+            print(f"Resuming {path}: {len(done)} of {num_parts} parts already uploaded")
+
+    if state is None:
+        upload_id = client.create_multipart_upload(Bucket=bucket_name, Key=key)["UploadId"]
+        state = {"upload_id": upload_id, "size": size, "mtime": mtime, "part_size": part_size}
+        os.makedirs(STATE_DIR, exist_ok=True)
+        with open(state_path, "w") as f:
+            json.dump(state, f)
+
+    def expected_size(number):
+        return min(part_size, size - (number - 1) * part_size)
+
+    def upload_part(number):
+        with open(path, "rb") as f:
+            f.seek((number - 1) * part_size)
+            body = f.read(expected_size(number))
+        response = client.upload_part(
+            Bucket=bucket_name, Key=key, UploadId=state["upload_id"],
+            PartNumber=number, Body=body,
+        )
+        if throughput:
+            throughput.add(len(body))
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    missing = [n for n in range(1, num_parts + 1)
+               if n not in done or done[n]["Size"] != expected_size(n)]
+    with ThreadPoolExecutor(config.max_concurrency) as executor:
+        uploaded = list(executor.map(upload_part, missing))
+
+    parts = {n: {"PartNumber": n, "ETag": p["ETag"]} for n, p in done.items()}
+    parts.update({p["PartNumber"]: p for p in uploaded})
+    client.complete_multipart_upload(
+        Bucket=bucket_name, Key=key, UploadId=state["upload_id"],
+        MultipartUpload={"Parts": [parts[n] for n in range(1, num_parts + 1)]},
+    )
+    os.remove(state_path)
+    if throughput:
+        throughput.on_done(None)